@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_capture.py  – конвейер захвата миникарты без дисплея
+
+Кадры – из файла (видео / .npy / картинки, см. screenshot.FileSource) или
+синтетические: фон + несколько движущихся «иконок», часть кадров повторяется
+(--static), как миникарта без событий. Сравнивает на тех же кадрах (время
+самого источника вычтено):
+  legacy    np.array(кадр) + cv2.cvtColor в новый массив (старый capture_loop)
+  pipeline  Capture.step_once: сравнение прореженной копии → cvtColor в
+            двойной буфер → публикация (--shared – в shared_memory)
+и скорость чтения последнего кадра FrameBuffer.read() – из этого же
+процесса и из дочернего через FrameBuffer.attach.
+
+  python bench_capture.py --frames 2000 --static 0.7
+  python bench_capture.py --source minimap.mp4 --shared
+"""
+
+from __future__ import annotations
+import argparse, multiprocessing as mp, time
+import numpy as np
+
+import screenshot
+from screenshot import Capture, FileSource, FrameBuffer
+
+# ---------------------------------------------------------------------------#
+class MemorySource:
+    """Кадры в памяти по кругу (≤256 – не вытесняют кэш); декодирование видео не меряем."""
+
+    def __init__(self, frames):
+        self.frames, self.i = frames, 0
+        self.shape = frames[0].shape[:2]
+        self.grab = np.empty_like(frames[0])
+
+    def read(self):
+        # как mss: каждый снимок – свежие байты в буфере источника
+        np.copyto(self.grab, self.frames[self.i % len(self.frames)]); self.i += 1
+        return self.grab
+
+    def close(self): pass
+
+
+def synthetic(n: int, static: float, h: int = screenshot.H, w: int = screenshot.W, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    bg = rng.integers(0, 60, (h, w, 4), dtype=np.uint8); bg[..., 3] = 255
+    pos = rng.integers(0, [h - 8, w - 8], (10, 2))
+    frames, cur = [], bg
+    for i in range(min(n, 256)):
+        if i == 0 or rng.random() >= static:
+            cur = bg.copy()
+            pos = np.clip(pos + rng.integers(-3, 4, pos.shape), 0, [h - 8, w - 8])
+            for y, x in pos:
+                cur[y:y + 8, x:x + 8, :3] = (0, 220, 0)
+        frames.append(cur)
+    return frames
+
+def from_file(path, n: int):
+    fs = FileSource(path)
+    frames = [fs.read().copy() for _ in range(min(n, 256))]
+    fs.close()
+    return frames
+
+
+def reader(name, shape, n, q):
+    buf = FrameBuffer.attach(name, shape)
+    out = np.empty(shape, dtype=np.uint8)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        buf.read(out)
+    q.put((time.perf_counter() - t0) / n * 1e6)
+    buf.close()
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", default=None, help="видео / .npy / картинка / каталог")
+    ap.add_argument("--frames", type=int, default=2000)
+    ap.add_argument("--static", type=float, default=0.7, help="доля повторных кадров (синтетика)")
+    ap.add_argument("--shared", action="store_true", help="FrameBuffer в shared_memory")
+    a = ap.parse_args()
+
+    import cv2
+    src = MemorySource(from_file(a.source, a.frames) if a.source else synthetic(a.frames, a.static))
+    n = a.frames
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        src.read()
+    grab = (time.perf_counter() - t0) / n * 1e6      # сам источник – вычитаем из обоих
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        last = cv2.cvtColor(np.array(src.read()), cv2.COLOR_BGRA2BGR)
+    legacy = (time.perf_counter() - t0) / n * 1e6 - grab
+
+    cap = Capture(src, interval=0, shared=a.shared)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        cap.step_once()
+    pipe = (time.perf_counter() - t0) / n * 1e6 - grab
+
+    out = np.empty(cap.buf.shape, dtype=np.uint8)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        cap.buf.read(out)
+    read_us = (time.perf_counter() - t0) / n * 1e6
+
+    line = (f"frames: {n} {src.shape[1]}×{src.shape[0]} | source: {grab:.1f} µs | "
+            f"legacy: {legacy:.1f} µs | "
+            f"pipeline: {pipe:.1f} µs (×{legacy / pipe:.2f}) | published: {cap.published} "
+            f"skipped: {cap.skipped} | read: {read_us:.1f} µs")
+    if a.shared:
+        q = mp.get_context("spawn").Queue()
+        p = mp.get_context("spawn").Process(target=reader, args=(cap.buf.name, cap.buf.shape, n, q))
+        p.start(); child_us = q.get(); p.join()
+        line += f" | read from child: {child_us:.1f} µs"
+        cap.buf.close(unlink=True)
+    print(line)
+    src.close()
+
+if __name__ == "__main__":
+    main()
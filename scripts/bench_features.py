@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_features.py  – FeatureExtractor против прежних функций mvp1_core
+
+На записанных пакетах (gsi_logs/*.jsonl.gz или старые *.json) замеряет
+мкс/пакет трёх путей:
+• legacy    – код ядра до FeatureExtractor как есть: update_deaths на каждый
+              пакет (смерти – в deque по time.time()) и тик rule_engine
+              (gold_adv / core_ids / … заново, recent_deaths_window(15));
+• extractor – FeatureExtractor.update()+vector() только на 12 базовых
+              признаках (ROLLING подменены пустышкой) – сравнение с legacy;
+• +rolling  – то же с трендами ROLLING, как в mvp1_core (LIVE_FEATURES).
+Сверка: 11 базовых признаков – с legacy; recent_deaths у legacy шёл по
+часам стены, поэтому он сверяется с полным просмотром по clock_time.
+
+  python bench_features.py gsi_logs --repeat 5
+"""
+
+from __future__ import annotations
+import argparse, collections, sys, time
+
+from features import (DEATH_WINDOW, FEATURES, ROLLING_FEATURES, FeatureExtractor, core_ids,
+                      gold_adv, roshan_alive, team_of_player, towers_dire_t3_down, xp_adv)
+from gsi_replay import load_packets
+
+RECENT = FEATURES.index("recent_deaths")
+
+# --- mvp1_core до FeatureExtractor (без правок) ------------------------------#
+death_buffer = collections.deque(maxlen=200)   # (timestamp)
+last_alive   = {}                              # steamid -> bool
+
+def now_ts() -> int: return int(time.time())
+
+def update_deaths(gsi: dict):
+    ts = now_ts()
+    for sid, p in gsi.get("allplayers", {}).items():
+        alive = p.get("alive", True)
+        was   = last_alive.get(sid, True)
+        if was and not alive:
+            death_buffer.append(ts)
+        last_alive[sid] = alive
+
+def recent_deaths_window(sec=15) -> int:
+    cut = now_ts() - sec
+    return sum(1 for d in death_buffer if d >= cut)
+
+def legacy_vector(gsi: dict, my_team: int) -> list:
+    """Тело тика rule_engine – вектор в порядке FEATURES."""
+    gold     = gold_adv(gsi)
+    xp       = xp_adv(gsi)
+
+    our_alive = enemy_alive = our_dead = enemy_dead = 0
+    for p in gsi.get("allplayers", {}).values():
+        alive = p.get("alive", True)
+        if team_of_player(p) == my_team:
+            our_alive  += alive
+            our_dead   += (not alive)
+        else:
+            enemy_alive  += alive
+            enemy_dead   += (not alive)
+
+    cores = core_ids(gsi)
+    our_core_alive    = sum(last_alive.get(sid, True) for sid in cores["R" if my_team==2 else "D"])
+    enemy_core_alive  = sum(last_alive.get(sid, True) for sid in cores["D" if my_team==2 else "R"])
+    enemy_core_dead   = 2 - enemy_core_alive
+
+    return [gold, xp, our_dead, enemy_dead, our_alive, enemy_alive,
+            our_core_alive, enemy_core_alive, enemy_core_dead,
+            roshan_alive(gsi), recent_deaths_window(15), towers_dire_t3_down(gsi)]
+
+def run_legacy(packets) -> list:
+    death_buffer.clear(); last_alive.clear()
+    my_team, out = None, []
+    for _, gsi in packets:
+        update_deaths(gsi)
+        if my_team is None:
+            my_team = gsi.get("player", {}).get("team", 2)
+        out.append(legacy_vector(gsi, my_team))
+    return out
+
+# ---------------------------------------------------------------------------#
+class NoRolling:
+    """Rolling‑пустышка: FeatureExtractor считает только базовые признаки."""
+    zeros = [0.0] * len(ROLLING_FEATURES)
+
+    def push(self, t, values): pass
+    def event(self, src, t): pass
+    def values(self, now): return self.zeros
+    def clear(self): pass
+
+def run_extractor(packets, rolling: bool) -> list:
+    fx = FeatureExtractor()
+    if not rolling: fx.rolling = NoRolling()
+    out = []
+    for _, gsi in packets:
+        fx.update(gsi); out.append(fx.vector())
+    return out
+
+def reference_recent(packets, window: float = DEATH_WINDOW[0]) -> list:
+    """recent_deaths по clock_time полным просмотром (сброс – новый матч / время назад)."""
+    out, deaths, alive, now, match = [], [], {}, 0, None
+    for _, gsi in packets:
+        m = gsi.get("map", {})
+        if m.get("matchid") is not None and m["matchid"] != match:
+            match, deaths, alive, now = m["matchid"], [], {}, 0
+        if m.get("clock_time") is not None:
+            if m["clock_time"] < now: deaths = []
+            now = m["clock_time"]
+        for sid, p in gsi.get("allplayers", {}).items():
+            a = p.get("alive", True)
+            if alive.get(sid, True) and not a: deaths.append(now)
+            alive[sid] = a
+        out.append(sum(1 for d in deaths if now - window <= d <= now))
+    return out
+
+def check(packets, out_l, out_f) -> int:
+    bad = 0
+    for i, (a, b, r) in enumerate(zip(out_l, out_f, reference_recent(packets))):
+        b = b[:len(FEATURES)].tolist()
+        want = [float(x) for x in a]; want[RECENT] = float(r)
+        if want != b:
+            bad += 1
+            if bad <= 5:
+                diff = {f: (x, y) for f, x, y in zip(FEATURES, want, b) if x != y}
+                print(f"mismatch @ packet {i}: {diff}", file=sys.stderr)
+    return bad
+
+def run(packets, repeat: int):
+    paths = {"legacy": run_legacy,
+             "extractor": lambda p: run_extractor(p, rolling=False),
+             "+rolling": lambda p: run_extractor(p, rolling=True)}
+    best = dict.fromkeys(paths, float("inf"))
+    outs = {}
+    for _ in range(repeat):
+        for name, fn in paths.items():
+            t0 = time.perf_counter()
+            outs[name] = fn(packets)
+            best[name] = min(best[name], time.perf_counter() - t0)
+    bad = check(packets, outs["legacy"], outs["extractor"]) \
+        + check(packets, outs["legacy"], outs["+rolling"])
+    return best, bad
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="+", help="gsi_logs/, *.json, *.jsonl.gz")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--limit", type=int, default=None)
+    a = ap.parse_args()
+
+    packets = load_packets(a.paths)[:a.limit]
+    if not packets:
+        print("⚠ no packets", file=sys.stderr); sys.exit(1)
+    best, bad = run(packets, a.repeat)
+    us = {k: v / len(packets) * 1e6 for k, v in best.items()}
+    print(f"packets: {len(packets)} | legacy: {us['legacy']:.1f} µs | "
+          f"extractor: {us['extractor']:.1f} µs (×{us['legacy'] / us['extractor']:.2f}) | "
+          f"+rolling: {us['+rolling']:.1f} µs (trends +{us['+rolling'] - us['extractor']:.1f} µs) | "
+          f"mismatches: {bad}")
+    sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_fetch.py  – fetch_matches.py --workers против локальной заглушки OpenDota
+
+Заглушка (в этом же процессе) отдаёт publicMatches страницами и матчи; каждый
+--every‑й запрос матча – 429 с Retry-After. Сам fetch_matches.py запускается
+как есть (--api-url на заглушку) и проверяется:
+1. 429: после каждого 429 с Retry-After: R ни один поток не приходит раньше,
+   чем через R с (общая пауза TokenBucket.backoff, а не повтор одного потока);
+2. возобновление: первый запуск убивается (SIGKILL), когда на диске
+   --kill-after матчей; второй – продолжает по .fetch_queue.json без
+   повторного листинга и докачивает остальное;
+3. без повторов: матч, уже лежавший на диске к обрыву, не скачивается снова;
+   повторно – только те, что были в полёте; в итоге на диске ровно --count.
+Печатает время, матчей/мин, число 429; код выхода 1, если проверка не прошла.
+
+  python bench_fetch.py --count 200 --workers 8
+"""
+
+from __future__ import annotations
+import argparse, collections, json, pathlib, re, subprocess, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HERE = pathlib.Path(__file__).resolve().parent
+TOP = 10_000_000                      # match_id первой страницы publicMatches
+
+# ---------------------------------------------------------------------------#
+class Server(ThreadingHTTPServer):
+    # очередь accept по умолчанию (5) переполняется – SYN повторяется через 1 с,
+    # и запрос, отправленный до 429, приходит посреди паузы
+    request_queue_size = 128
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):   # убитый клиент – не ошибка
+            super().handle_error(request, client_address)
+
+
+class Stub:
+    def __init__(self, every: int, retry_after: int):
+        self.every, self.retry_after = every, retry_after
+        self.lock = threading.Lock()
+        self.log: list = []                          # (время, путь, код)
+        self.served = collections.Counter()          # match_id → сколько раз отдан 200
+        self.n = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"            # keep‑alive, как у настоящего API
+
+            def log_message(self, *a): pass
+
+            def do_GET(self):
+                code, body = stub.handle(urlparse(self.path))
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                if code == 429: self.send_header("Retry-After", str(stub.retry_after))
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers(); self.wfile.write(data)
+
+        self.http = Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.http.server_address[1]}"
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def handle(self, u):
+        now = time.monotonic()
+        if u.path.endswith("/publicMatches"):
+            lt = int(parse_qs(u.query).get("less_than_match_id", [TOP + 1])[0])
+            body = [{"match_id": m, "avg_rank_tier": 80} for m in range(lt - 1, lt - 101, -1)]
+            with self.lock: self.log.append((now, "list", 200))
+            return 200, body
+        m = re.search(r"/matches/(\d+)$", u.path)
+        if not m:
+            return 404, None
+        mid = int(m.group(1))
+        with self.lock:
+            self.n += 1
+            code = 429 if self.n % self.every == 0 else 200
+            if code == 200: self.served[mid] += 1
+            self.log.append((now, "match", code))
+        return code, ({"match_id": mid, "duration": 1800, "players": []}
+                      if code == 200 else None)
+
+    def early(self, start: float, end: float, slack: float = 0.1) -> list:
+        """
+        Запросы, пришедшие в (t + slack, t + R − slack) после 429 в момент t;
+        только в пределах одного запуска [start, end) – новый процесс паузы не знает.
+        """
+        with self.lock: log = [r for r in self.log if start <= r[0] < end]
+        bad = []
+        for t, _, code in log:
+            if code != 429: continue
+            bad += [(round(t2 - t, 3)) for t2, _, _ in log
+                    if t + slack < t2 < t + self.retry_after - slack]
+        return bad
+
+# ---------------------------------------------------------------------------#
+def launch(stub: Stub, out: pathlib.Path, a) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, str(HERE / "fetch_matches.py"), "--count", str(a.count),
+         "--min-rank", "0", "--workers", str(a.workers), "--rate", str(a.rate),
+         "--api-url", stub.url, "--api-key", "", "--out", str(out)],
+        cwd=out, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+def on_disk(out: pathlib.Path) -> set:
+    return {int(p.stem) for p in out.glob("*.json") if p.stem.isdigit()}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--rate", type=float, default=6000, help="запросов/мин у fetch_matches")
+    ap.add_argument("--every", type=int, default=40, help="каждый N‑й запрос матча – 429")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--kill-after", type=int, default=None,
+                    help="матчей на диске до обрыва первого запуска (по умолчанию count/3)")
+    ap.add_argument("--timeout", type=float, default=120)
+    a = ap.parse_args()
+
+    stub, fails = Stub(a.every, a.retry_after), []
+    kill_after = a.kill_after or a.count // 3
+    with tempfile.TemporaryDirectory() as tmp:
+        out = pathlib.Path(tmp)
+        t0 = time.monotonic()
+
+        # --- запуск 1: обрыв посреди закачки --------------------------------
+        p = launch(stub, out, a)
+        while len(on_disk(out)) < kill_after and p.poll() is None \
+                and time.monotonic() - t0 < a.timeout:
+            time.sleep(0.01)
+        p.kill(); p.wait()
+        t_kill = time.monotonic()
+        before = on_disk(out)
+        served_before = stub.served.copy()
+        lists_before = sum(1 for _, kind, _ in stub.log if kind == "list")
+        if not (out / ".fetch_queue.json").exists():
+            fails.append("no .fetch_queue.json after the interrupted run")
+
+        # --- запуск 2: возобновление ----------------------------------------
+        p = launch(stub, out, a)
+        try:
+            log, _ = p.communicate(timeout=a.timeout)
+        except subprocess.TimeoutExpired:
+            p.kill(); log, _ = p.communicate(); fails.append("second run timed out")
+        dt = time.monotonic() - t0
+        after = on_disk(out)
+        lists_after = sum(1 for _, kind, _ in stub.log if kind == "list") - lists_before
+
+    n429 = sum(1 for _, _, code in stub.log if code == 429)
+    again = sorted(m for m in before if stub.served[m] > 1)
+    in_flight = sorted(m for m, k in stub.served.items() if k > 1 and m not in before)
+    early = stub.early(t0, t_kill) + stub.early(t_kill, float("inf"))
+    print(f"matches: {len(after)}/{a.count} | interrupted at {len(before)} | "
+          f"{dt:.1f}s ({len(after) / max(dt, 1e-9) * 60:.0f}/min) | 429: {n429} | "
+          f"re-fetched in flight: {len(in_flight)}")
+
+    if "resume:" not in log: fails.append("second run did not resume from the queue")
+    if lists_after: fails.append(f"second run listed publicMatches again ({lists_after} pages)")
+    if len(after) != a.count: fails.append(f"{len(after)} matches on disk, expected {a.count}")
+    if again: fails.append(f"matches saved before the interruption fetched again: {again[:5]}")
+    if any(k > 2 for k in stub.served.values()): fails.append("a match was fetched 3+ times")
+    if not n429: fails.append("no 429 was served – raise --count or lower --every")
+    if early: fails.append(f"{len(early)} requests arrived inside Retry-After: {early[:5]} s")
+    if not served_before: fails.append("first run downloaded nothing before the kill")
+
+    for f in fails: print("✗", f, file=sys.stderr)
+    sys.exit(1 if fails else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_minimap.py  – укладывается ли minimap.MinimapFeatures в интервал захвата
+
+Кадры – записанные (видео / .npy / картинки через screenshot.FileSource) или
+синтетические: тёмная карта, N красных и M зелёных иконок 10×10 плюс мелкие
+«крипы» 3×3 – для них известны правильные ответы, проверяется и точность.
+Печатает мс/кадр (p50 / p99 / max) и долю от screenshot.INTERVAL; код выхода 1,
+если p99 не влезает в интервал или синтетика посчитана неверно.
+
+  python bench_minimap.py --frames 500
+  python bench_minimap.py --source minimap.mp4
+"""
+
+from __future__ import annotations
+import argparse, sys, time
+import numpy as np
+
+import screenshot
+from minimap import MinimapFeatures
+
+ICON = 10
+
+def synthetic(n: int, seed: int = 0):
+    """[(кадр BGR, {"enemy": k, "ally": m})]"""
+    rng = np.random.default_rng(seed)
+    h, w = screenshot.H, screenshot.W
+    out = []
+    for _ in range(n):
+        f = rng.integers(0, 50, (h, w, 3), dtype=np.uint8)
+        truth, taken = {}, np.zeros((h, w), bool)
+        for team, bgr in (("enemy", (30, 30, 230)), ("ally", (40, 220, 40))):
+            k = int(rng.integers(0, 6)); placed = 0
+            for _ in range(k):
+                for _ in range(20):                      # без наложения иконок
+                    y, x = rng.integers(0, h - ICON), rng.integers(0, w - ICON)
+                    if not taken[max(y-2, 0):y+ICON+2, max(x-2, 0):x+ICON+2].any():
+                        taken[y:y+ICON, x:x+ICON] = True
+                        f[y:y+ICON, x:x+ICON] = bgr; placed += 1; break
+            for _ in range(int(rng.integers(0, 8))):   # крипы – не считаются
+                y, x = rng.integers(0, h - 3), rng.integers(0, w - 3)
+                if not taken[max(y-2, 0):y+5, max(x-2, 0):x+5].any():
+                    taken[y:y+3, x:x+3] = True; f[y:y+3, x:x+3] = bgr
+            truth[team] = placed
+        out.append((f, truth))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", default=None)
+    ap.add_argument("--frames", type=int, default=500)
+    a = ap.parse_args()
+
+    if a.source:
+        src = screenshot.FileSource(a.source, loop=False)
+        frames = []
+        import cv2
+        try:
+            while len(frames) < a.frames:
+                frames.append((cv2.cvtColor(src.read(), cv2.COLOR_BGRA2BGR), None))
+        except EOFError:
+            pass
+        src.close()
+    else:
+        frames = synthetic(a.frames)
+
+    fx = MinimapFeatures(frames[0][0].shape)
+    fx.compute(frames[0][0])                          # прогрев
+    ms, wrong = [], 0
+    for f, truth in frames:
+        t0 = time.perf_counter()
+        feats = fx.compute(f)
+        ms.append((time.perf_counter() - t0) * 1e3)
+        if truth and any(feats[f"minimap_{t}"] != k for t, k in truth.items()):
+            wrong += 1
+    s = sorted(ms)
+    q = lambda p: s[min(len(s) - 1, int(p * len(s)))]
+    budget = screenshot.INTERVAL * 1e3
+    print(f"frames: {len(ms)} {frames[0][0].shape[1]}×{frames[0][0].shape[0]} | "
+          f"p50 {q(.5):.3f} ms  p99 {q(.99):.3f} ms  max {s[-1]:.3f} ms | "
+          f"{q(.99) / budget:.1%} of {budget:.0f} ms interval | features: {len(fx.names)}"
+          + ("" if a.source else f" | wrong counts: {wrong}"))
+    sys.exit(1 if q(.99) > budget or wrong else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_startup.py  – холодный старт mvp1_core и serve_model (регрессия)
+
+1. импорт модуля в свежем интерпретаторе во временном каталоге (лучший из
+   --repeat): мс, тяжёлые модули, которых при импорте быть не должно
+   (cv2 / mss / lightgbm / …), и файлы, которые импорт создал (gsi_logs/ …);
+2. запуск процесса: через сколько мс /gsi ответил 200 (serve_model – любой
+   ответ /ready), через сколько /ready → 200, для ядра – через сколько пакет,
+   принятый до готовности модели, превратился в подсказку (/hint seq ≥ 1).
+
+Код выхода 1, если вышли за бюджет или что‑то не поднялось.
+
+  python bench_startup.py --model data/models/aegis_lgbm_v3.pkl
+  python bench_startup.py --model data/models/aegis_lgbm_v3.npz --import-budget-ms 300
+"""
+
+from __future__ import annotations
+import argparse, json, os, pathlib, subprocess, sys, tempfile, time
+import urllib.error, urllib.request
+
+HERE = pathlib.Path(__file__).resolve().parent
+HEAVY = ("cv2", "mss", "lightgbm", "sklearn", "pandas", "joblib", "requests")
+
+PACKET = json.dumps({"map": {"matchid": "bench", "clock_time": 0},
+                     "player": {"team": 2, "steamid": "bench"}}).encode()
+
+# ---------------------------------------------------------------------------#
+def import_ms(module: str, env: dict) -> tuple[float, list, list]:
+    """(мс, тяжёлые модули, файлы, которые импорт создал в cwd) – cwd временный."""
+    code = ("import json, sys, time; t = time.perf_counter(); import {m}; "
+            "ms = (time.perf_counter() - t) * 1e3; "
+            "print(json.dumps([ms, [h for h in {heavy!r} if h in sys.modules]]))"
+            ).format(m=module, heavy=HEAVY)
+    env = {**env, "PYTHONPATH": os.pathsep.join(filter(None, [str(HERE), env.get("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        created = sorted(p.name for p in pathlib.Path(cwd).iterdir())
+    ms, heavy = json.loads(out.strip().splitlines()[-1])
+    return ms, heavy, created
+
+def status(url: str, data: bytes | None = None) -> int | None:
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=1) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None                               # ещё не слушает
+
+def wait(pred, t0: float, timeout: float, proc) -> float | None:
+    """мс от t0 до первого pred() == True; None – таймаут или процесс умер."""
+    while time.perf_counter() - t0 < timeout:
+        if pred(): return (time.perf_counter() - t0) * 1e3
+        if proc.poll() is not None: return None
+        time.sleep(0.005)
+    return None
+
+def launch(argv, env, cwd):
+    return subprocess.Popen([sys.executable, *argv], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+# ---------------------------------------------------------------------------#
+def core_start(model: pathlib.Path, port: int, env: dict, timeout: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as cwd:     # gsi_logs/ – во временный каталог
+        t0 = time.perf_counter()
+        p = launch([str(HERE / "mvp1_core.py"), "--backend", "local", "--model", str(model),
+                    "--engine", "event", "--port", str(port)], env, cwd)
+        try:
+            listen = wait(lambda: status(base + "/gsi", PACKET) == 200, t0, timeout, p)
+            ready = wait(lambda: status(base + "/ready") == 200, t0, timeout, p)
+            def hinted():
+                with urllib.request.urlopen(base + "/hint", timeout=1) as r:
+                    return json.load(r)["seq"] >= 1
+            hint = wait(hinted, t0, timeout, p) if ready else None
+            report = {}
+            if ready:
+                with urllib.request.urlopen(base + "/ready", timeout=1) as r:
+                    report = json.load(r)
+        finally:
+            p.terminate(); p.wait(5)
+    return {"listen_ms": listen, "ready_ms": ready, "first_hint_ms": hint, "startup": report}
+
+def serve_start(model: pathlib.Path, port: int, env: dict, timeout: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    env = {**env, "AEGIS_MODEL": str(model), "AEGIS_PORT": str(port)}
+    t0 = time.perf_counter()
+    p = launch([str(HERE / "serve_model.py")], env, HERE)
+    try:
+        listen = wait(lambda: status(base + "/ready") is not None, t0, timeout, p)
+        ready = wait(lambda: status(base + "/ready") == 200, t0, timeout, p)
+        report = {}
+        if ready:
+            with urllib.request.urlopen(base + "/ready", timeout=1) as r:
+                report = json.load(r)
+    finally:
+        p.terminate(); p.wait(5)
+    return {"listen_ms": listen, "ready_ms": ready, "startup": report}
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", type=pathlib.Path, default=pathlib.Path("data/models/aegis_lgbm_v3.pkl"))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--import-budget-ms", type=float, default=500,
+                    help="импорт mvp1_core (serve_model – ×2, FastAPI сам по себе тяжёлый)")
+    ap.add_argument("--listen-budget-ms", type=float, default=1000,
+                    help="запуск → первый принятый пакет / ответ сервера")
+    ap.add_argument("--ready-budget-ms", type=float, default=15000)
+    ap.add_argument("--core-port", type=int, default=5077)
+    ap.add_argument("--serve-port", type=int, default=8077)
+    ap.add_argument("--skip-serve", action="store_true", help="только mvp1_core")
+    a = ap.parse_args()
+
+    model = a.model.resolve()
+    env = {**os.environ, "AEGIS_MODEL": str(model)}
+    fails = []
+
+    modules = [("mvp1_core", a.import_budget_ms)]
+    if not a.skip_serve: modules.append(("serve_model", 2 * a.import_budget_ms))
+    for m, budget in modules:
+        runs = [import_ms(m, env) for _ in range(a.repeat)]
+        ms = min(r[0] for r in runs)
+        # serve_model грузит модель фоновым потоком сразу после импорта – его
+        # тяжёлые модули появляются в sys.modules законно
+        heavy = runs[0][1] if m == "mvp1_core" else []
+        created = runs[0][2]
+        print(f"import {m:<12} {ms:7.1f} ms  (budget {budget:.0f})"
+              + (f"  heavy: {', '.join(heavy)}" if heavy else "")
+              + (f"  created: {', '.join(created)}" if created else ""))
+        if ms > budget: fails.append(f"import {m}: {ms:.0f} > {budget:.0f} ms")
+        if heavy: fails.append(f"import {m} pulls in {heavy}")
+        if created: fails.append(f"import {m} creates {created} in the working directory")
+
+    runs = [("mvp1_core", core_start(model, a.core_port, env, a.ready_budget_ms / 1e3 + 5))]
+    if not a.skip_serve:
+        runs.append(("serve_model", serve_start(model, a.serve_port, env,
+                                                a.ready_budget_ms / 1e3 + 5)))
+    fmt = lambda v: "   —  " if v is None else f"{v:6.0f}"
+    for name, r in runs:
+        print(f"start  {name:<12} listen {fmt(r['listen_ms'])} ms | ready {fmt(r['ready_ms'])} ms"
+              + (f" | first hint {fmt(r['first_hint_ms'])} ms" if "first_hint_ms" in r else "")
+              + f" | {json.dumps(r['startup'], ensure_ascii=False)}")
+        for key, budget in (("listen_ms", a.listen_budget_ms), ("ready_ms", a.ready_budget_ms)):
+            if r[key] is None or r[key] > budget:
+                fails.append(f"{name} {key}: {fmt(r[key]).strip()} (budget {budget:.0f})")
+        if "first_hint_ms" in r and r["first_hint_ms"] is None:
+            fails.append(f"{name}: packet accepted before /ready never produced a hint")
+
+    for f in fails: print("✗", f, file=sys.stderr)
+    sys.exit(1 if fails else 0)
+
+if __name__ == "__main__":
+    main()
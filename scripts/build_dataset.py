@@ -14,12 +14,28 @@ build_dataset.py  • “logic‑v3”
 • TAKE_ROSHAN     – Рошан жив, врагов мёртвых ≥3, у нас ≥2 core живы
 • CONTEST_ROSHAN  – Рошан жив, обе команды ≥2 core живы, смертей ≥2 за 15 с
 • SIEGE           – gold_adv > +10k и у Dire разрушено ≥1 T3 башен
+Пороги и порядок – таблица rules.RULES (label / label_np собраны из неё);
+переразметить готовый датасет без сырых матчей – relabel.py.
+
+Кроме 12 мгновенных признаков – тренды features.ROLLING (gold_adv_d60,
+gold_adv_m180, our_deaths_30, …): оба движка считают их целым матчем
+features.rolling_np (вживую ту же таблицу ROLLING ведёт features.Rolling).
 """
 
 from __future__ import annotations
-import argparse, json, pathlib, sys
+import argparse, hashlib, os, pathlib, shutil, sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
+import match_store, snapshot_io
+from features import DEATH_WINDOW, ROLLING, ROLLING_FEATURES, rolling_np
+from rules import label, label_np, rules_hash
+
+# версия колонок + отпечаток таблицы правил – входит в ключ кэша;
+# ручную часть менять при правке snapshots(), правила и ROLLING учитываются сами
+LABEL_RULES = f"logic-v3.1+{rules_hash()}"
+
 # ---------------------------------------------------------------------------#
 def series(players, key, length, default=0):
     arr = [0]*length
@@ -51,49 +67,35 @@ def richest_ids(match, n=2):
 def is_dead(pid, t, table, resp=40):
     return any(d <= t < d+resp for d in table.get(pid, []))
 
-# -------------- Label rules -------------------------------------------------#
-def label(row):
-    if row["recent_deaths"] >= 6:
-        return "TEAMFIGHT"
-
-    if row["roshan_alive"]:
-        if row["enemy_core_dead"] >= 1 and row["our_core_alive"] >= 2:
-            return "TAKE_ROSHAN"
-        if row["our_core_alive"] >= 2 and row["enemy_core_alive"] >= 2 and row["recent_deaths"] >= 2:
-            return "CONTEST_ROSHAN"
-
-    if row["gold_adv"] > 10000 and row["towers_dire_t3_down"]:
-        return "SIEGE"
-
-    if row["gold_adv"] > 4000 and row["enemy_dead_tot"] <= 1:
-        return "PUSH"
-
-    if row["gold_adv"] < -4000 and row["our_dead_tot"] <= 1:
-        return "DEFEND"
-
-    # GANK – у нас минимум 3 живых, у врага core‑solo, и недавних смертей <2
-    if (row["our_alive"] >= 3 and row["enemy_core_alive"] == 1
-        and row["recent_deaths"] < 2):
-        return "GANK"
+def death_events(match):  # [(время, ряд ROLLING)] по возрастанию; our – Radiant
+    return sorted((d, "our_deaths" if p["isRadiant"] else "enemy_deaths")
+                  for p in match["players"] for d in p.get("death_times") or [])
 
-    # STACK – nobody dead, игра ровная
-    if row["our_dead_tot"] == 0 and row["enemy_dead_tot"] == 0 \
-       and abs(row["gold_adv"]) <= 2000:
-        return "STACK"
-
-    return "FARM"
+def trends(match, t, g_adv, x_adv):
+    """
+    Скользящие признаки на тиках t – одни на оба движка: ряд по секундам 0…dur
+    и смерти сторон → features.rolling_np (разности / cumsum / searchsorted).
+    """
+    sec = np.minimum(np.arange(max(match["duration"], 1))//60, len(g_adv)-1)
+    ev = death_events(match)
+    return rolling_np(t, {"gold_adv": np.asarray(g_adv)[sec], "xp_adv": np.asarray(x_adv)[sec]},
+                      {k: np.asarray([d for d, s in ev if s == k], dtype=float)
+                       for k in ("our_deaths", "enemy_deaths")})
 
 # ---------------------------------------------------------------------------#
-def snapshots(match, step):
+def snapshots(match, step, window=DEATH_WINDOW):
+    before, after = window      # recent_deaths: смерти в [t − before, t + after]
     dur = match["duration"]
     g_adv, x_adv = gold_xp_adv(match)
     deaths = deaths_map(match)
     cores  = richest_ids(match, 2)
     rosh = [e["time"] for e in match.get("objectives",[])
             if e.get("type")=="CHAT_MESSAGE_ROSHAN_KILL"]
+    trend = trends(match, range(0, dur, step), g_adv, x_adv)
+    trend = list(zip(*(trend[f].tolist() for f in ROLLING_FEATURES)))
 
     rows=[]
-    for t in range(0,dur,step):
+    for k, t in enumerate(range(0,dur,step)):
         idx = min(t//60, len(g_adv)-1)
         ga, xa = g_adv[idx], x_adv[idx]
 
@@ -112,7 +114,7 @@ def snapshots(match, step):
         for kill in rosh:
             if kill<=t<kill+600: roshan_alive=0
 
-        recent = sum(1 for arr in deaths.values() for d in arr if t-7<=d<=t+7)
+        recent = sum(1 for arr in deaths.values() for d in arr if t-before<=d<=t+after)
 
         t3_mask = 0b111000   #  bits 3‑5 (T3)
         towers_down = (match.get("tower_status_dire",0)&t3_mask)==0
@@ -129,26 +131,168 @@ def snapshots(match, step):
             recent_deaths=recent,
             towers_dire_t3_down=int(towers_down),
         )
+        row.update(zip(ROLLING_FEATURES, trend[k]))
         row["label"]=label(row)
         rows.append(row)
     return rows
 
 # ---------------------------------------------------------------------------#
-def build(raw: pathlib.Path, out: pathlib.Path, step:int):
-    rows, skipped= [],0
-    for fp in raw.glob("*.json"):
+def covered(starts, ends, t):
+    """Сколько полуинтервалов [start, end) накрывает каждый тик t (searchsorted)."""
+    return (np.searchsorted(np.sort(starts), t, side="right")
+            - np.searchsorted(np.sort(ends), t, side="right"))
+
+def snapshots_np(match, step, window=DEATH_WINDOW) -> pd.DataFrame:
+    """То же, что snapshots(), но целым матчем в NumPy‑массивах: O(ticks + deaths·log)."""
+    before, after = window
+    dur = match["duration"]
+    g_adv, x_adv = gold_xp_adv(match)
+    deaths = deaths_map(match)
+    cores  = richest_ids(match, 2)
+    rosh = np.asarray([e["time"] for e in match.get("objectives",[])
+                       if e.get("type")=="CHAT_MESSAGE_ROSHAN_KILL"], dtype=float)
+
+    t = np.arange(0, dur, step)
+    idx = np.minimum(t//60, len(g_adv)-1)
+
+    z = np.zeros(len(t), dtype=np.int64)
+    our_alive, enemy_alive, our_dead, enemy_dead = z.copy(), z.copy(), z.copy(), z.copy()
+    our_core_dead, enemy_core_dead = z.copy(), z.copy()
+    for p in match["players"]:
+        d = np.asarray(deaths.get(p["account_id"], []), dtype=float)
+        dead = (covered(d, d + p.get("respawn_time",40), t) > 0).astype(np.int64)
+        if p["isRadiant"]:
+            our_dead += dead; our_alive += 1 - dead
+            if p["account_id"] in cores["R"]: our_core_dead += dead
+        else:
+            enemy_dead += dead; enemy_alive += 1 - dead
+            if p["account_id"] in cores["D"]: enemy_core_dead += dead
+
+    roshan_alive = (covered(rosh, rosh + 600, t) == 0).astype(np.int64)
+
+    # [t − before, t + after]: все смерти одним отсортированным массивом
+    alld = np.sort(np.asarray([d for arr in deaths.values() for d in arr], dtype=float))
+    recent = (np.searchsorted(alld, t + after, side="right")
+              - np.searchsorted(alld, t - before, side="left"))
+
+    t3_mask = 0b111000
+    towers_down = int((match.get("tower_status_dire",0)&t3_mask)==0)
+
+    trend = trends(match, t, g_adv, x_adv)
+
+    cols = dict(
+        match_id=np.full(len(t), match["match_id"]), t=t,
+        gold_adv=np.asarray(g_adv)[idx], xp_adv=np.asarray(x_adv)[idx],
+        our_alive=our_alive, enemy_alive=enemy_alive,
+        our_dead_tot=our_dead, enemy_dead_tot=enemy_dead,
+        our_core_alive=2-our_core_dead,
+        enemy_core_alive=2-enemy_core_dead,
+        enemy_core_dead=enemy_core_dead,
+        roshan_alive=roshan_alive,
+        recent_deaths=recent.astype(np.int64),
+        towers_dire_t3_down=np.full(len(t), towers_down),
+        **trend,
+    )
+    cols["label"] = label_np(cols)
+    return pd.DataFrame(cols)
+
+ENGINES = {
+    "python": lambda match, step, window=DEATH_WINDOW: pd.DataFrame(snapshots(match, step, window)),
+    "numpy":  snapshots_np,
+}
+
+# -------------- Per-match cache ---------------------------------------------#
+def cache_key(data: bytes, step: int, window=DEATH_WINDOW) -> str:
+    h = hashlib.sha1(data)
+    h.update(f"|step={step}|deaths={window[0]},{window[1]}|rules={LABEL_RULES}"
+             f"|rolling={ROLLING}".encode())
+    return h.hexdigest()
+
+def load_cached(fn: pathlib.Path) -> pd.DataFrame:
+    with np.load(fn) as z:
+        df = pd.DataFrame({k: z[k] for k in z.files})
+    if "label" in df: df["label"] = df["label"].astype(object)
+    return df
+
+def save_cached(fn: pathlib.Path, df: pd.DataFrame):
+    tmp = fn.with_name(fn.name + f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:       # атомарно: параллельные воркеры не видят полуфайл
+        np.savez(f, **{c: (df[c].to_numpy().astype(str) if c == "label" else df[c].to_numpy())
+                       for c in df.columns})
+    os.replace(tmp, fn)
+
+def match_table(rec: match_store.Record, step: int, engine: str,
+                cache: pathlib.Path | None, window=DEATH_WINDOW) -> pd.DataFrame:
+    """Снапшоты одного матча; при наличии кэша – по хэшу байтов записи."""
+    fn = cache / f"{cache_key(rec.blob, step, window)}.npz" if cache else None
+    if fn and fn.exists():
+        return load_cached(fn)
+    df = ENGINES[engine](rec.load(), step, window)
+    if fn: save_cached(fn, df)
+    return df
+
+def build_shard(files, step, engine, cache, window=DEATH_WINDOW):
+    """Один шард файлов корпуса → (DataFrame | None, skipped). Работает и в воркере."""
+    frames, skipped = [], 0
+    for fp in files:
         try:
-            rows.extend(snapshots(json.loads(fp.read_text()), step))
+            for rec in match_store.iter_records(fp):
+                try:
+                    df = match_table(rec, step, engine, cache, window)
+                    if len(df): frames.append(df)
+                except Exception as e:
+                    skipped+=1; print("skip",rec.name,e,file=sys.stderr)
         except Exception as e:
             skipped+=1; print("skip",fp.name,e,file=sys.stderr)
+    return (pd.concat(frames, ignore_index=True) if frames else None), skipped
+
+def shards(files, n, max_files=64):
+    k = min(-(-len(files)//n), max_files) if files else 1
+    return [files[i:i+k] for i in range(0, len(files), k)]
+
+def iter_shards(files, step, engine, workers, cache, window=DEATH_WINDOW):
+    """(DataFrame | None, skipped) по шардам в исходном порядке файлов."""
+    if workers <= 1:
+        for part in shards(files, 1):
+            yield build_shard(part, step, engine, cache, window)
+        return
+    # шардов больше, чем воркеров – длинные матчи не тормозят хвост; в полёте
+    # держим не больше 2×workers шардов, чтобы память не росла с корпусом
+    parts = shards(files, workers*4)
+    with ProcessPoolExecutor(workers) as ex:
+        pending = []
+        for part in parts:
+            pending.append(ex.submit(build_shard, part, step, engine, cache, window))
+            if len(pending) >= 2*workers:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+# ---------------------------------------------------------------------------#
+def build(raw: pathlib.Path, out: pathlib.Path, step:int, engine:str="python",
+          workers:int=1, cache:pathlib.Path|None=None, fmt:str|None=None,
+          row_group:int=snapshot_io.ROW_GROUP, window=DEATH_WINDOW):
+    files = match_store.sources(raw)
+    if cache: cache.mkdir(parents=True, exist_ok=True)
+
+    skipped, balance = 0, pd.Series(0, index=snapshot_io.LABELS)
+    # окно recent_deaths едет с датасетом – train_model пишет его в bundle
+    with snapshot_io.open_writer(out, fmt, row_group,
+                                 meta={"death_window": list(window)}) as w:
+        for df, n in iter_shards(files, step, engine, workers, cache, window):
+            skipped += n
+            if df is None: continue
+            balance = balance.add(df["label"].value_counts(), fill_value=0)
+            w.write(df)
+        w.flush(); rows = w.rows
 
     if not rows:
+        shutil.rmtree(out) if out.is_dir() else out.unlink(missing_ok=True)
         print("⚠ no rows – проверьте data/raw"); sys.exit(1)
 
-    df=pd.DataFrame(rows)
-    print("LABEL BALANCE:\n",df["label"].value_counts())
-    df.to_csv(out,index=False)
-    print(f"✓ dataset saved → {out} | rows: {len(df):,}  skipped: {skipped}")
+    balance = balance[balance > 0].astype(int).sort_values(ascending=False)
+    print("LABEL BALANCE:\n",balance.rename("count").rename_axis("label"))
+    print(f"✓ dataset saved → {out} | rows: {rows:,}  skipped: {skipped}")
 
 # ---------------------------------------------------------------------------#
 if __name__=="__main__":
@@ -156,5 +300,21 @@ if __name__=="__main__":
     p.add_argument("--raw",type=pathlib.Path,default=pathlib.Path("data/raw"))
     p.add_argument("--out",type=pathlib.Path,default=pathlib.Path("data/snapshots/dataset_v3.csv"))
     p.add_argument("--step",type=int,default=5)
+    p.add_argument("--engine",choices=sorted(ENGINES),default="python",
+                   help="numpy – векторный движок, те же колонки и метки")
+    p.add_argument("--workers",type=int,default=1,help="процессов для шардов data/raw")
+    p.add_argument("--cache",type=pathlib.Path,default=None,
+                   help="каталог кэша снапшотов по хэшу файла + step + LABEL_RULES "
+                        "(по умолчанию выключен), напр. data/cache/snapshots")
+    p.add_argument("--format",choices=sorted(snapshot_io.WRITERS),default=None,
+                   help="csv / parquet / feather / snap (каталог под memmap); "
+                        "по умолчанию – по расширению --out")
+    p.add_argument("--row-group",type=int,default=snapshot_io.ROW_GROUP,
+                   help="строк в одном сбрасываемом блоке")
+    p.add_argument("--death-window",default=f"{DEATH_WINDOW[0]},{DEATH_WINDOW[1]}",
+                   help="recent_deaths: игровых секунд до,после тика; по умолчанию – как "
+                        "вживую; записывается в метаданные датасета")
     a=p.parse_args(); a.out.parent.mkdir(parents=True,exist_ok=True)
-    build(a.raw,a.out,a.step)
+    window=tuple(int(x) for x in a.death_window.split(","))
+    build(a.raw,a.out,a.step,a.engine,a.workers,a.cache,
+          a.format,a.row_group,window)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+features.py  – 12 признаков LightGBM v3 из GSI‑пакетов
+
+• чистые функции (team_of_player, gold_adv, core_ids, …) – как были в
+  mvp1_core; по ним сверяется bench_features.py
+• FeatureExtractor – состояние между пакетами: слот на игрока (команда,
+  net worth, alive), core'ы пересчитываются только при смене net worth /
+  состава, смерти – по переходу alive → dead, T3‑башни – по памятке имён.
+  vector() – float32‑массив фиксированной раскладки FEATURES.
+
+recent_deaths считается в игровом времени (map.clock_time) в окне
+DEATH_WINDOW – одном на build_dataset и вживую: будущего нет, поэтому смерти
+в [t − 14, t]. Пауза и реплей с любой скоростью на окно не влияют.
+
+Скользящие признаки (тренд) – одна таблица ROLLING на оба пути: офлайн
+rolling_np() – разности и кумулятивные суммы по ряду «значение на каждую
+игровую секунду», вживую Rolling – кольцо на секунды окна и окно событий,
+O(1) на пакет. vector() отдаёт FEATURES + ROLLING_FEATURES (LIVE_FEATURES).
+"""
+
+from __future__ import annotations
+import collections
+from typing import Dict, List
+import numpy as np
+
+FEATURES = [
+    "gold_adv", "xp_adv",
+    "our_dead_tot", "enemy_dead_tot",
+    "our_alive", "enemy_alive",
+    "our_core_alive", "enemy_core_alive", "enemy_core_dead",
+    "roshan_alive", "recent_deaths", "towers_dire_t3_down",
+]
+
+# скользящие признаки: (имя, ряд, вид, окно в игровых секундах)
+#   delta – x(t) − x(t − w);  mean – среднее x по секундам (t − w, t];
+#   count – событий ряда за [t − w, t]. До начала ряда x равен первому значению.
+ROLLING = [
+    ("gold_adv_d60",    "gold_adv",     "delta", 60),
+    ("xp_adv_d60",      "xp_adv",       "delta", 60),
+    ("gold_adv_m180",   "gold_adv",     "mean",  180),
+    ("our_deaths_30",   "our_deaths",   "count", 30),
+    ("enemy_deaths_30", "enemy_deaths", "count", 30),
+]
+ROLLING_FEATURES = [name for name, *_ in ROLLING]
+LIVE_FEATURES = FEATURES + ROLLING_FEATURES
+IDX = {f: i for i, f in enumerate(LIVE_FEATURES)}
+
+# окно recent_deaths в игровых секундах: (до, после) тика, границы включены.
+# Одно на build_dataset и mvp1_core: вживую будущего нет, поэтому «после» – 0;
+# build_dataset пишет окно в метаданные датасета, train_model – в bundle,
+# mvp1_core сверяет его со своим
+DEATH_WINDOW = (14, 0)
+
+def check_death_window(trained, live: float = DEATH_WINDOW[0]):
+    """Окно, на котором учили модель (до, после), против живого; None – bundle старый."""
+    if trained is None: return
+    before, after = (float(x) for x in trained)
+    if (before, after) == (float(live), 0.0): return
+    hint = f" or run mvp1_core --death-window {before:g}" if after == 0 else ""
+    raise ValueError(f"model was trained with recent_deaths window ({before:g}, {after:g}), "
+                     f"the live core counts ({live:g}, 0): retrain on build_dataset "
+                     f"--death-window {live:g},0{hint}")
+
+# --- чистые функции ---------------------------------------------------------#
+def team_of_player(p: dict) -> int:
+    # team: 2 – Radiant, 3 – Dire (по GSI)
+    return p.get("team") or p.get("team2") or 0
+
+def gold_adv(gsi: dict) -> int:
+    # попробуем взять готовое поле, иначе считаем “на коленке”
+    map_blk = gsi.get("map", {})
+    if "radiant_gold_adv" in map_blk:
+        return map_blk["radiant_gold_adv"]
+    adv = 0
+    for p in gsi.get("allplayers", {}).values():
+        side = 1 if team_of_player(p) == 2 else -1
+        adv += p.get("net_worth", p.get("gold", 0)) * side
+    return adv
+
+def xp_adv(gsi: dict) -> int:
+    return gsi.get("map", {}).get("radiant_xp_adv", 0)
+
+def core_ids(gsi: dict, n=2):
+    rad, dire = [], []
+    for sid, p in gsi.get("allplayers", {}).items():
+        t = team_of_player(p)
+        nw = p.get("net_worth", p.get("gold", 0))
+        (rad if t == 2 else dire).append((nw, sid))
+    rad_ids  = [sid for _, sid in sorted(rad,  reverse=True)[:n]]
+    dire_ids = [sid for _, sid in sorted(dire, reverse=True)[:n]]
+    return {"R": rad_ids, "D": dire_ids}
+
+def towers_dire_t3_down(gsi: dict):
+    # buildings[].name содержит 'dota_badguys_tower3_*'
+    blds = gsi.get("map", {}).get("buildings", [])
+    t3   = [b for b in blds if "_tower3_" in b.get("name","")]
+    return int(all(b.get("health",1) == 0 for b in t3)) if t3 else 0
+
+def roshan_alive(gsi: dict):
+    rs = gsi.get("map", {}).get("roshan_state", "")
+    return 1 if rs == "alive" else 0
+
+def rolling_np(t, series: Dict[str, np.ndarray], events: Dict[str, np.ndarray]):
+    """
+    Офлайн (build_dataset.snapshots_np): t – тики (целые секунды ≥ 0),
+    series – значение ряда на каждую секунду 0…max(t), events – отсортированные
+    времена событий. → {имя: массив по тикам} в порядке ROLLING.
+    """
+    t = np.asarray(t, dtype=np.int64)
+    out = {}
+    for name, src, kind, w in ROLLING:
+        if kind == "count":
+            e = events[src]
+            out[name] = (np.searchsorted(e, t, side="right")
+                         - np.searchsorted(e, t - w, side="left"))
+            continue
+        x = np.asarray(series[src], dtype=np.float64)
+        xp = np.concatenate([np.full(w, x[0]), x])        # секунда s → xp[s + w]
+        if kind == "delta":
+            out[name] = xp[t + w] - xp[t]
+        else:
+            cs = np.concatenate([[0.0], np.cumsum(xp)])
+            out[name] = (cs[t + w + 1] - cs[t + 1]) / w
+    return out
+
+# ---------------------------------------------------------------------------#
+class SecondRing:
+    """
+    Ряд «значение на каждую игровую секунду» за последние span секунд: кольцо
+    на span + 1 ячеек и сумма по нему. Секунды между пакетами получают прежнее
+    значение (пропуск длиннее окна – не больше span + 1 записей), поэтому
+    push / delta / mean – O(1) на пакет. Время назад – ряд начинается заново.
+    """
+
+    def __init__(self, span: int):
+        self.span, self.n = span, span + 1
+        self.clear()
+
+    def clear(self):
+        self.buf, self.total, self.t = [0.0] * self.n, 0.0, None
+
+    def push(self, t: int, v: float):
+        v, prev = float(v), self.t
+        if prev is None or t < prev:                    # до начала ряда – первое значение
+            self.buf, self.total, self.t = [v] * self.n, v * self.n, t
+            return
+        n, buf = self.n, self.buf
+        if t > prev + 1:                                # секунды без пакетов
+            last = buf[prev % n]
+            for s in range(max(prev + 1, t - self.span), t):
+                i = s % n; self.total += last - buf[i]; buf[i] = last
+        i = t % n; self.total += v - buf[i]; buf[i] = v
+        self.t = t
+
+    def delta(self) -> float:
+        if self.t is None: return 0.0
+        return self.buf[self.t % self.n] - self.buf[(self.t - self.span) % self.n]
+
+    def mean(self) -> float:
+        if self.t is None: return 0.0
+        return (self.total - self.buf[(self.t - self.span) % self.n]) / self.span
+
+
+class GameTimeWindow:
+    """
+    События в игровом времени, окно [now − span, now]. Время монотонно, поэтому
+    deque отсортирован: вставка справа, истечение слева – O(1) амортизированно,
+    без потолка на историю. Время назад (новый матч) – окно сбрасывается.
+    """
+
+    def __init__(self, span: float):
+        self.span = span
+        self.q: collections.deque = collections.deque()
+
+    def add(self, t: float):
+        if self.q and t < self.q[-1]:
+            self.q.clear()
+        self.q.append(t)
+
+    def count(self, now: float) -> int:
+        cut, q = now - self.span, self.q
+        while q and q[0] < cut:
+            q.popleft()
+        return len(q)
+
+    def clear(self):
+        self.q.clear()
+
+
+class Rolling:
+    """Живая половина ROLLING: SecondRing на delta/mean, GameTimeWindow на count."""
+
+    def __init__(self, table=ROLLING):
+        self.items = [(src, kind, GameTimeWindow(w) if kind == "count" else SecondRing(w))
+                      for _, src, kind, w in table]            # порядок таблицы
+        self.rings = [(src, r) for src, kind, r in self.items if kind != "count"]
+        self.windows: Dict[str, list] = {}                     # ряд событий → окна
+        for src, kind, win in self.items:
+            if kind == "count": self.windows.setdefault(src, []).append(win)
+
+    def push(self, t: int, row):
+        for src, ring in self.rings:
+            ring.push(t, row[src])
+
+    def event(self, src: str, t: float):
+        for win in self.windows.get(src, ()):
+            win.add(t)
+
+    def values(self, now: float) -> List[float]:
+        return [o.delta() if kind == "delta" else o.mean() if kind == "mean" else o.count(now)
+                for _, kind, o in self.items]
+
+    def clear(self):
+        for _, _, o in self.items: o.clear()
+
+
+class _Slot:
+    __slots__ = ("team", "nw", "alive")
+
+    def __init__(self):
+        self.team, self.nw, self.alive = 0, None, True
+
+
+class FeatureExtractor:
+    """
+    update(gsi) – на каждый пакет (в /gsi), vector() – на тик движка.
+    my_team берётся из первого пакета матча (player.team, по умолчанию 2).
+    death_window – сколько игровых секунд назад считать смерти.
+    """
+
+    def __init__(self, death_window: float = DEATH_WINDOW[0]):
+        self.deaths = GameTimeWindow(death_window)
+        self.rolling = Rolling()
+        self.t3_names: Dict[str, bool] = {}      # имя здания → это T3?
+        self.vec = np.zeros(len(LIVE_FEATURES), dtype=np.float32)
+        self.packets = 0
+        self.reset()
+
+    def reset(self, match=None):
+        self.match, self.now, self.my_team = match, 0, None
+        self.slots: Dict[str, _Slot] = {}
+        self.roster: tuple = ()                  # steamid'ы последнего пакета
+        self.cores: Dict[int, List[_Slot]] = {2: [], 3: []}
+        self.deaths.clear(); self.rolling.clear()
+
+    def update(self, gsi: dict):
+        m = gsi.get("map", {})
+        match = m.get("matchid")
+        if match is not None and match != self.match:
+            self.reset(match)
+        if m.get("clock_time") is not None:      # без map (меню) – время стоит
+            if m["clock_time"] < self.now:       # перемотка реплея назад
+                self.deaths.clear(); self.rolling.clear()
+            self.now = m["clock_time"]
+        now, slots = self.now, self.slots
+        if self.my_team is None:
+            self.my_team = gsi.get("player", {}).get("team", 2)
+        players = gsi.get("allplayers", {})
+
+        roster = tuple(players)
+        dirty = roster != self.roster
+        self.roster = roster
+        our_alive = enemy_alive = our_dead = enemy_dead = 0
+        adv = 0
+        for sid, p in players.items():
+            s = slots.get(sid)
+            if s is None:
+                s = slots[sid] = _Slot(); dirty = True
+            team = p.get("team") or p.get("team2") or 0
+            nw = p.get("net_worth", p.get("gold", 0))
+            alive = p.get("alive", True)
+            if team != s.team or nw != s.nw:
+                s.team, s.nw, dirty = team, nw, True
+            if s.alive and not alive:
+                self.deaths.add(now)
+                self.rolling.event("our_deaths" if team == self.my_team else "enemy_deaths", now)
+            s.alive = alive
+            if team == self.my_team:
+                our_alive += alive; our_dead += (not alive)
+            else:
+                enemy_alive += alive; enemy_dead += (not alive)
+            adv += nw if team == 2 else -nw
+        if dirty:
+            self._cores()
+
+        mine = 2 if self.my_team == 2 else 3
+        our_core_alive   = sum(s.alive for s in self.cores[mine])
+        enemy_core_alive = sum(s.alive for s in self.cores[5 - mine])
+
+        v = self.vec
+        v[0] = ga = m["radiant_gold_adv"] if "radiant_gold_adv" in m else adv
+        v[1] = xa = m.get("radiant_xp_adv", 0)
+        v[2], v[3], v[4], v[5] = our_dead, enemy_dead, our_alive, enemy_alive
+        v[6], v[7], v[8] = our_core_alive, enemy_core_alive, 2 - enemy_core_alive
+        v[9] = 1 if m.get("roshan_state", "") == "alive" else 0
+        v[11] = self._t3(m.get("buildings", []))
+        self.rolling.push(int(now), {"gold_adv": ga, "xp_adv": xa})
+        self.packets += 1
+
+    def _cores(self, n: int = 2):
+        # тот же порядок, что у core_ids: (net worth, steamid) по убыванию
+        rad, dire = [], []
+        for sid in self.roster:
+            s = self.slots[sid]
+            (rad if s.team == 2 else dire).append((s.nw, sid))
+        self.cores = {2: [self.slots[sid] for _, sid in sorted(rad,  reverse=True)[:n]],
+                      3: [self.slots[sid] for _, sid in sorted(dire, reverse=True)[:n]]}
+
+    def _t3(self, blds) -> int:
+        names, seen, down = self.t3_names, False, True
+        for b in blds:
+            name = b.get("name", "")
+            is_t3 = names.get(name)
+            if is_t3 is None:
+                is_t3 = names[name] = "_tower3_" in name
+            if is_t3:
+                seen = True
+                if b.get("health", 1) != 0: down = False
+        return int(seen and down)
+
+    def recent_deaths(self) -> int:
+        return self.deaths.count(self.now)
+
+    def vector(self) -> np.ndarray:
+        """Копия вектора в порядке LIVE_FEATURES (окна – на последний clock_time)."""
+        self.vec[IDX["recent_deaths"]] = self.recent_deaths()
+        self.vec[len(FEATURES):] = self.rolling.values(self.now)
+        return self.vec.copy()
+
+    def as_dict(self, vec: np.ndarray | None = None) -> Dict[str, float]:
+        vec = self.vector() if vec is None else vec
+        return dict(zip(LIVE_FEATURES, vec.tolist()))
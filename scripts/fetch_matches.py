@@ -3,32 +3,45 @@
 """
 fetch_matches.py  • v4  (June‑2025)
 
-Скачивает N high‑MMR игр и сохраняет их JSON в data/raw/.
+Скачивает N high‑MMR игр и сохраняет их в data/raw/ (формат – match_store.py).
 
 CLI:
   --count     <int>   (default 1000)
   --min-rank  <int>   avg_rank_tier threshold (default 70)
   --api-key   <str>   OpenDota API‑key (или перем. окруж. OD_API_KEY)
   --out       <dir>   куда класть .json (default data/raw)
+  --workers   <int>   >0 – параллельная закачка с общим лимитером и очередью
+  --rate      <int>   запросов/мин для лимитера (default 60 без ключа, 1200 с ключом)
+  --api-url   <url>   база API (или OD_API_URL) – например, локальная заглушка
+  --format    <str>   json | jsonl.gz | jsonl.zst | bin  (default json)
+  --prune             хранить только поля, которые читает build_dataset
 
 Пример:
   $env:OD_API_KEY = e1c74fdf-c58a-4f09-b777-4b0937475907   # PowerShell
-  python fetch_matches.py --count 3500 --min-rank 70
+  python fetch_matches.py --count 3500 --min-rank 70 --workers 16
+
+В режиме --workers состояние хранится в <out>/.fetch_queue.json
+(pending / done / failed): упавший запуск продолжает без повторного листинга.
 """
 
 from __future__ import annotations
-import argparse, json, pathlib, time, os, sys, random, requests
+import argparse, json, pathlib, time, os, sys, random, threading, requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from match_store import FORMATS, MatchStore
 
-OD_API = "https://api.opendota.com/api"
+OD_API = os.getenv("OD_API_URL", "https://api.opendota.com/api")
+QUEUE_FILE = ".fetch_queue.json"
 
 def GET(endpoint: str, api_key: str | None = None,
-        params: dict | None = None, retry: int = 5):
+        params: dict | None = None, retry: int = 5, api_url: str = OD_API):
     params = params.copy() if params else {}
     if api_key:
         params["api_key"] = api_key
     backoff = 2
     for attempt in range(1, retry + 1):
-        r = requests.get(f"{OD_API}/{endpoint.lstrip('/')}", params=params, timeout=20)
+        r = requests.get(f"{api_url.rstrip('/')}/{endpoint.lstrip('/')}", params=params,
+                         timeout=20)
         if r.status_code == 429:
             delay = backoff + random.random()
             print(f"[429] retry {attempt}/{retry} in {delay:.1f}s", file=sys.stderr)
@@ -43,14 +56,14 @@ def GET(endpoint: str, api_key: str | None = None,
             print(f"[{r.status_code}] retry in {delay:.1f}s", file=sys.stderr)
             time.sleep(delay); backoff *= 2
 
-def page_public_matches(less_than: int | None, key: str | None):
+def page_public_matches(less_than: int | None, key: str | None, api_url: str = OD_API):
     params = {"less_than_match_id": less_than} if less_than else {}
-    return GET("publicMatches", key, params)
+    return GET("publicMatches", key, params, api_url=api_url)
 
-def collect_ids(n: int, min_rank: int, key: str | None):
+def collect_ids(n: int, min_rank: int, key: str | None, api_url: str = OD_API):
     ids, seen, last = [], set(), None
     while len(ids) < n:
-        batch = page_public_matches(last, key)
+        batch = page_public_matches(last, key, api_url)
         if not batch: break
         for m in batch:
             mid = m["match_id"]; last = mid
@@ -62,13 +75,180 @@ def collect_ids(n: int, min_rank: int, key: str | None):
         time.sleep(0.5 if key else 1.1)      # throttle
     return ids
 
-def save_match(mid: int, out: pathlib.Path, key: str | None):
-    fn = out / f"{mid}.json"
-    if fn.exists(): return
-    data = GET(f"matches/{mid}", key)
-    fn.write_text(json.dumps(data, indent=2))
+def save_match(mid: int, store: MatchStore, key: str | None, api_url: str = OD_API):
+    if store.has(mid): return
+    data = GET(f"matches/{mid}", key, api_url=api_url)
+    store.put(mid, data)
     print("saved", mid)
 
+# --------------------------------------------------------------------------- #
+# ─── Параллельный режим ──────────────────────────────────────────────────── #
+class TokenBucket:
+    """
+    Общий для всех потоков лимитер: rate запросов/мин, burst токенов.
+    429 → пауза для всех потоков + rate/2; после серии успехов rate
+    плавно возвращается к целевому (AIMD).
+    """
+
+    def __init__(self, per_min: float, burst: int | None = None):
+        self.target = self.rate = per_min / 60.0
+        self.burst = burst or max(1, int(self.target))
+        self.tokens, self.last = float(self.burst), time.monotonic()
+        self.paused_until, self.ok = 0.0, 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1; return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self, delay: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.rate = max(self.target / 16, self.rate / 2)
+            self.tokens, self.ok = 0.0, 0
+
+    def success(self):
+        with self.lock:
+            self.ok += 1
+            if self.rate < self.target and self.ok >= 20:
+                self.rate = min(self.target, self.rate * 1.25); self.ok = 0
+
+
+class Client:
+    """Пул keep‑alive соединений + общий лимитер + повторы на 429/5xx."""
+
+    def __init__(self, base: str, key: str | None, bucket: TokenBucket,
+                 workers: int = 8, retry: int = 5):
+        self.base, self.key, self.bucket, self.retry = base.rstrip("/"), key, bucket, retry
+        self.s = requests.Session()
+        ad = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 4))
+        self.s.mount("http://", ad); self.s.mount("https://", ad)
+
+    def get(self, endpoint: str, params: dict | None = None):
+        params = dict(params or {})
+        if self.key:
+            params["api_key"] = self.key
+        backoff = 2
+        for attempt in range(1, self.retry + 1):
+            self.bucket.acquire()
+            r = self.s.get(f"{self.base}/{endpoint.lstrip('/')}", params=params, timeout=20)
+            if r.status_code == 429 or r.status_code >= 500:
+                if attempt == self.retry:
+                    r.raise_for_status()
+                ra = r.headers.get("Retry-After", "")
+                delay = float(ra) if ra.isdigit() else backoff + random.random()
+                print(f"[{r.status_code}] retry {attempt}/{self.retry} in {delay:.1f}s",
+                      file=sys.stderr)
+                self.bucket.backoff(delay); backoff *= 2; continue
+            r.raise_for_status()
+            self.bucket.success()
+            return r.json()
+
+
+class FetchQueue:
+    """pending / done / failed id матчей, периодически сохраняется на диск (атомарно)."""
+
+    def __init__(self, path: pathlib.Path, every: int = 25):
+        self.path, self.every, self.dirty = path, every, 0
+        self.pending, self.done, self.failed = [], set(), {}
+        self.lock = threading.Lock()
+        if path.exists():
+            st = json.loads(path.read_text())
+            self.pending = st.get("pending", [])
+            self.done = set(st.get("done", []))
+            self.failed = {int(k): v for k, v in st.get("failed", {}).items()}
+
+    def add(self, ids):
+        with self.lock:
+            known = self.done | set(self.pending) | set(self.failed)
+            self.pending += [m for m in ids if m not in known]
+        self.save()
+
+    def retry_failed(self):
+        with self.lock:
+            self.pending += list(self.failed); self.failed.clear()
+
+    def mark(self, mid: int, err: str | None = None):
+        with self.lock:
+            if err is None: self.done.add(mid); self.failed.pop(mid, None)
+            else:           self.failed[mid] = err
+            self.dirty += 1
+            flush = self.dirty >= self.every
+        if flush: self.save()
+
+    def todo(self):
+        with self.lock:
+            return [m for m in self.pending if m not in self.done and m not in self.failed]
+
+    def save(self):
+        with self.lock:
+            self.pending = [m for m in self.pending if m not in self.done and m not in self.failed]
+            st = {"pending": self.pending, "done": sorted(self.done),
+                  "failed": {str(k): v for k, v in self.failed.items()}}
+            self.dirty = 0
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(st))
+            os.replace(tmp, self.path)
+
+
+def collect_ids_rl(n: int, min_rank: int, client: Client):
+    """collect_ids без фиксированного sleep – темп задаёт общий лимитер."""
+    ids, seen, last = [], set(), None
+    while len(ids) < n:
+        batch = client.get("publicMatches", {"less_than_match_id": last} if last else {})
+        if not batch: break
+        for m in batch:
+            mid = m["match_id"]; last = mid
+            if mid in seen: continue
+            seen.add(mid)
+            if m.get("avg_rank_tier", 0) >= min_rank:
+                ids.append(mid)
+                if len(ids) >= n: break
+    return ids
+
+def fetch_one(mid: int, store: MatchStore, client: Client):
+    if not store.has(mid):
+        store.put(mid, client.get(f"matches/{mid}"))
+    return mid
+
+def download(ids, store: MatchStore, client: Client, queue: FetchQueue, workers: int):
+    t0, n = time.monotonic(), 0
+    with ThreadPoolExecutor(workers) as ex:
+        futs = {ex.submit(fetch_one, mid, store, client): mid for mid in ids}
+        for f in as_completed(futs):
+            mid = futs[f]
+            try:
+                f.result(); queue.mark(mid); n += 1
+                print("saved", mid)
+            except Exception as e:
+                queue.mark(mid, str(e)); print("skip", mid, e, file=sys.stderr)
+    queue.save()
+    dt = time.monotonic() - t0
+    print(f"✓ {n}/{len(ids)} matches in {dt:.1f}s ({n / max(dt, 1e-9) * 60:.0f}/min) "
+          f"| failed total: {len(queue.failed)}")
+
+def run_parallel(args, store: MatchStore):
+    rate = args.rate or (1200 if args.api_key else 60)
+    client = Client(args.api_url, args.api_key, TokenBucket(rate), args.workers)
+    queue = FetchQueue(args.out / QUEUE_FILE)
+    if args.retry_failed:
+        queue.retry_failed()
+    if queue.todo() and not args.relist:
+        print(f"resume: {len(queue.todo())} pending in {queue.path}")
+    else:
+        queue.add(collect_ids_rl(args.count, args.min_rank, client))
+        print(f"collected {len(queue.todo())} new match ids; downloading…")
+    download(queue.todo(), store, client, queue, args.workers)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--count",     type=int, default=1000)
@@ -76,6 +256,17 @@ def main():
     ap.add_argument("--api-key",   type=str,
                     default=os.getenv("OD_API_KEY", "").strip('"').strip("'"))
     ap.add_argument("--out",       type=pathlib.Path, default=pathlib.Path("data/raw"))
+    ap.add_argument("--workers",   type=int, default=0,
+                    help=">0 – параллельная закачка через общий лимитер и очередь")
+    ap.add_argument("--rate",      type=float, default=None, help="запросов/мин")
+    ap.add_argument("--api-url",   type=str, default=OD_API)
+    ap.add_argument("--format",    choices=FORMATS, default="json",
+                    help="json / jsonl.gz / jsonl.zst / bin – см. match_store.py")
+    ap.add_argument("--prune",     action="store_true",
+                    help="хранить только поля, которые читает build_dataset")
+    ap.add_argument("--relist",    action="store_true",
+                    help="заново собрать id, даже если в очереди есть pending")
+    ap.add_argument("--retry-failed", action="store_true")
     args = ap.parse_args()
 
     args.out.mkdir(parents=True, exist_ok=True)
@@ -84,11 +275,15 @@ def main():
     else:
         print("⚠ no API‑key — будет лимит 60 rq/min", file=sys.stderr)
 
-    ids = collect_ids(args.count, args.min_rank, args.api_key)
+    store = MatchStore(args.out, args.format, args.prune)
+    if args.workers > 0:
+        return run_parallel(args, store)
+
+    ids = collect_ids(args.count, args.min_rank, args.api_key, args.api_url)
     print(f"collected {len(ids)} match ids; downloading…")
 
     for mid in ids:
-        try:    save_match(mid, args.out, args.api_key)
+        try:    save_match(mid, store, args.api_key, args.api_url)
         except Exception as e: print("skip", mid, e, file=sys.stderr)
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+flat_model.py  – LightGBM → плоские NumPy‑массивы и предиктор без lightgbm
+
+Экспорт (нужны joblib + lightgbm, один раз после train_model.py):
+  python flat_model.py --model data/models/aegis_lgbm_v3.pkl \
+                       --out   data/models/aegis_lgbm_v3.npz [--quantize]
+
+Все деревья склеены в общие массивы узлов: feature, threshold, left, right,
+default_left, missing_type; ребёнок < 0 – это лист ~idx в leaf_value.
+FlatModel.predict(X) обходит все деревья сразу для пачки строк (шаг – один
+уровень для всех ещё не дошедших до листа пар строка×дерево) и возвращает вероятности как Booster.predict; argmax совпадает с
+model.predict. Для рантайма нужен только numpy.
+
+--quantize: пороги – float32, округлённые вниз (для float32‑строк, как у
+LocalPredictor, сравнение x <= порог даёт те же ветки), индексы – самый узкий
+int; листья остаются float64 – предсказания не меняются, .npz меньше.
+"""
+
+from __future__ import annotations
+import argparse, pathlib
+import numpy as np
+
+MISSING = {"None": 0, "Zero": 1, "NaN": 2}
+ZERO_THRESHOLD = 1e-35          # kZeroThreshold в LightGBM
+CHUNK = 512                     # строк за проход: (CHUNK × n_trees) индексов в памяти
+
+# ---------------------------------------------------------------------------#
+def flatten(dump: dict, num_iteration: int | None = None) -> dict:
+    """booster.dump_model() → dict плоских массивов."""
+    k = dump.get("num_tree_per_iteration", 1)
+    trees = dump["tree_info"]
+    if num_iteration:
+        trees = trees[:num_iteration * k]
+    feat, thr, left, right, dleft, mtype, leaves, roots = [], [], [], [], [], [], [], []
+
+    def walk(node) -> int:
+        if "leaf_value" in node:
+            leaves.append(node["leaf_value"])
+            return ~(len(leaves) - 1)
+        if node.get("decision_type", "<=") != "<=":
+            raise NotImplementedError("categorical splits are not supported")
+        i = len(feat)
+        feat.append(node["split_feature"]); thr.append(node["threshold"])
+        dleft.append(bool(node.get("default_left", True)))
+        mtype.append(MISSING[node.get("missing_type", "None")])
+        left.append(0); right.append(0)
+        left[i] = walk(node["left_child"]); right[i] = walk(node["right_child"])
+        return i
+
+    depth = lambda n: 0 if "leaf_value" in n else \
+        1 + max(depth(n["left_child"]), depth(n["right_child"]))
+    for t in trees:
+        roots.append(walk(t["tree_structure"]))
+    return dict(
+        feature=np.asarray(feat, dtype=np.int32), threshold=np.asarray(thr, dtype=np.float64),
+        left=np.asarray(left, dtype=np.int32), right=np.asarray(right, dtype=np.int32),
+        default_left=np.asarray(dleft, dtype=bool), missing_type=np.asarray(mtype, dtype=np.int8),
+        leaf_value=np.asarray(leaves, dtype=np.float64), root=np.asarray(roots, dtype=np.int32),
+        num_class=np.int32(k),
+        max_depth=np.int32(max((depth(t["tree_structure"]) for t in trees), default=0)),
+        objective=np.asarray(str(dump.get("objective", ""))),
+    )
+
+def quantize(arr: dict) -> dict:
+    """Пороги → float32 вниз (x <= t ⇔ x <= t32 для любого float32 x), индексы → узкий int."""
+    thr = arr["threshold"]
+    t32 = thr.astype(np.float32)
+    up = t32.astype(np.float64) > thr
+    t32[up] = np.nextafter(t32[up], np.float32(-np.inf))
+    small = lambda a: a.astype(np.int16) if a.size and np.abs(a).max() < 2**15 else a
+    return dict(arr, threshold=t32, feature=small(arr["feature"]),
+                left=small(arr["left"]), right=small(arr["right"]), root=small(arr["root"]))
+
+def export(model, encoder, features, out: pathlib.Path, num_iteration: int | None = None,
+           quantize_thresholds: bool = False, death_window=None):
+    """LGBMClassifier | Booster (+ LabelEncoder) → .npz для FlatModel."""
+    booster = getattr(model, "booster_", model)
+    arr = flatten(booster.dump_model(num_iteration=num_iteration), num_iteration)
+    if quantize_thresholds:
+        arr = quantize(arr)
+    classes = getattr(model, "classes_", None)
+    if classes is None:
+        classes = list(range(max(int(arr["num_class"]), 2)))
+    labels = encoder.inverse_transform(classes) if encoder is not None else classes
+    if death_window is not None:
+        arr["death_window"] = np.asarray(death_window, dtype=np.float64)
+    np.savez_compressed(out, features=np.asarray(features, dtype=str),
+                        labels=np.asarray([str(l) for l in labels], dtype=str), **arr)
+    return out
+
+# ---------------------------------------------------------------------------#
+class FlatModel:
+    def __init__(self, arr: dict):
+        for k in ("feature", "threshold", "left", "right", "default_left",
+                  "missing_type", "leaf_value", "root"):
+            setattr(self, k, arr[k])
+        self.num_class = int(arr["num_class"])
+        self.max_depth = int(arr["max_depth"])
+        self.features = [str(f) for f in arr["features"]]
+        self.labels = [str(l) for l in arr["labels"]]
+        self.death_window = tuple(arr["death_window"].tolist()) if "death_window" in arr else None
+        self.n_trees = len(self.root)
+        self.has_zero_missing = bool((self.missing_type == 1).any())
+        self.child = np.stack([self.right, self.left], axis=1)   # [узел, go_left]
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "FlatModel":
+        with np.load(path) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def raw_score(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        out = np.empty((len(X), self.num_class))
+        for s in range(0, len(X), CHUNK):
+            out[s:s+CHUNK] = self._raw_chunk(X[s:s+CHUNK])
+        return out
+
+    def _raw_chunk(self, X) -> np.ndarray:
+        n, T = len(X), self.n_trees
+        node = np.tile(self.root, n)                     # пара (строка, дерево) → узел
+        leaf = np.where(node < 0, ~node, 0)
+        pos = np.flatnonzero(node >= 0)                  # ещё не дошедшие до листа
+        nd, row = node[pos], pos // T
+        plain = not self.has_zero_missing and not np.isnan(X).any()
+        while len(pos):
+            x = X[row, self.feature[nd]]
+            if plain:
+                go_left = x <= self.threshold[nd]
+            else:
+                # NumericalDecision: NaN → 0 (кроме missing=NaN); «пропуск» → default_left
+                mt, nan = self.missing_type[nd], np.isnan(x)
+                x = np.where(nan & (mt != 2), 0.0, x)
+                miss = ((mt == 1) & (np.abs(x) <= ZERO_THRESHOLD)) | ((mt == 2) & nan)
+                go_left = np.where(miss, self.default_left[nd], x <= self.threshold[nd])
+            nd = self.child[nd, go_left.view(np.int8)]
+            done = nd < 0
+            leaf[pos[done]] = ~nd[done]
+            keep = ~done
+            pos, nd, row = pos[keep], nd[keep], row[keep]
+        # деревья идут итерация за итерацией: tree = it * num_class + class
+        return self.leaf_value[leaf].reshape(n, -1, self.num_class).sum(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        """Как Booster.predict: softmax (мультикласс) или sigmoid (бинарная)."""
+        raw = self.raw_score(X)
+        if self.num_class == 1:
+            return 1.0 / (1.0 + np.exp(-raw[:, 0]))
+        e = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser(description="экспорт bundle .pkl → плоский .npz")
+    ap.add_argument("--model", type=pathlib.Path, default=pathlib.Path("data/models/aegis_lgbm_v3.pkl"))
+    ap.add_argument("--out",   type=pathlib.Path, default=None)
+    ap.add_argument("--quantize", action="store_true", help="пороги float32, узкие индексы")
+    a = ap.parse_args()
+
+    from predictor import load_bundle
+    model, encoder, features, num_iteration, death_window = load_bundle(a.model)
+    out = export(model, encoder, features, a.out or a.model.with_suffix(".npz"),
+                 num_iteration, quantize_thresholds=a.quantize, death_window=death_window)
+    fm = FlatModel.load(out)
+    print(f"✓ flat model → {out} | trees: {fm.n_trees}  nodes: {len(fm.feature)}  "
+          f"depth: {fm.max_depth}  {out.stat().st_size / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
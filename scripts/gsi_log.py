@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gsi_log.py  – фоновая запись GSI‑пакетов
+
+Поток запроса только кладёт пакет в ограниченную очередь (submit) и сразу
+отвечает "OK"; фоновый поток пачками пишет их в сжатые JSONL‑сегменты,
+по одному на матч:
+
+  gsi_logs/<matchid>-0001.jsonl.gz   строка = {"ts": unix‑время приёма, "gsi": пакет}
+
+Сегмент ротируется после segment_bytes несжатых байт; после каждой пачки –
+gzip flush, так что оборванный файл читается до последней пачки. Открыто не
+больше MAX_OPEN сегментов (LRU); вытесненный или оставшийся от прошлого
+запуска сегмент дописывается ("ab" – ещё один gzip‑member) до того же
+предела, новый файл – только при ротации или если последний оборван. Переполнение
+очереди не блокирует приём: пакет отбрасывается и считается в dropped.
+observe(секунды) – если задан, зовётся после каждой пачки (время записи на диск).
+"""
+
+from __future__ import annotations
+import atexit, gzip, json, pathlib, queue, re, threading, time, zlib
+from typing import Any, Callable, Dict
+
+SEGMENT_BYTES = 16 * 2**20
+MAX_QUEUE     = 10_000
+BATCH         = 512
+MAX_OPEN      = 4               # открытых сегментов одновременно (LRU)
+
+# ---------------------------------------------------------------------------#
+def match_key(payload: dict) -> str:
+    mid = str(payload.get("map", {}).get("matchid") or "nomatch")
+    return re.sub(r"[^0-9A-Za-z_]", "_", mid)
+
+
+def intact_size(path: pathlib.Path, opener: Callable = gzip.open,
+                errors: tuple = (EOFError, OSError, zlib.error)) -> int | None:
+    """
+    Несжатый размер сегмента; None – поток оборван или испорчен (дописывать
+    нельзя). opener / errors – другой кодек тех же member'ов (match_store: zstd).
+    """
+    n = 0
+    try:
+        with opener(path) as f:
+            while chunk := f.read(1 << 20):
+                n += len(chunk)
+    except errors:
+        return None
+    return n
+
+
+class _Segment:
+    def __init__(self, root: pathlib.Path, key: str):
+        self.root, self.key = root, key
+        seqs = [int(m.group(1)) for p in root.glob(f"{key}-*.jsonl.gz")
+                if (m := re.search(r"-(\d+)\.jsonl\.gz$", p.name))]
+        self.seq = max(seqs, default=0)
+        self.f = None
+        # последний файл прошлого запуска: целый – дописываем, оборванный – новый
+        self.size = intact_size(self.path()) if self.seq else 0
+
+    def path(self) -> pathlib.Path:
+        return self.root / f"{self.key}-{self.seq:04d}.jsonl.gz"
+
+    def write(self, lines: list[bytes], limit: int):
+        if self.f is not None and self.size >= limit:
+            self.close()
+        if self.f is None:
+            if not self.seq or self.size is None or self.size >= limit:
+                self.seq += 1; self.size = 0
+            self.f = gzip.open(self.path(), "ab", compresslevel=5)
+        data = b"".join(lines)
+        self.f.write(data); self.f.flush(); self.size += len(data)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close(); self.f = None
+
+
+class GsiLogWriter:
+    def __init__(self, root: pathlib.Path = pathlib.Path("gsi_logs"),
+                 max_queue: int = MAX_QUEUE, segment_bytes: int = SEGMENT_BYTES,
+                 batch: int = BATCH, observe: Callable[[float], None] | None = None):
+        self.root = root; root.mkdir(parents=True, exist_ok=True)
+        self.observe = observe
+        self.q: queue.Queue = queue.Queue(max_queue)
+        self.segment_bytes, self.batch = segment_bytes, batch
+        self.segments: Dict[str, _Segment] = {}           # открытые, LRU
+        self.closed: Dict[str, _Segment] = {}             # вытесненные: номер и размер
+        self.enqueued = self.written = self.dropped = self.batches = self.errors = 0
+        self.lock = threading.Lock()                       # счётчики из потоков Flask
+        self.t = threading.Thread(target=self._run, name="gsi-log", daemon=True)
+        self.t.start()
+        atexit.register(self.close)
+
+    # --- поток запроса ------------------------------------------------------
+    def submit(self, payload: dict) -> bool:
+        try:
+            self.q.put_nowait((time.time(), payload)); ok = True
+        except queue.Full:
+            ok = False
+        with self.lock:
+            if ok: self.enqueued += 1
+            else:  self.dropped += 1
+        return ok
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enqueued": self.enqueued, "written": self.written,
+                "dropped": self.dropped, "batches": self.batches,
+                "errors": self.errors, "queue_depth": self.q.qsize(),
+                "queue_max": self.q.maxsize, "open_segments": len(self.segments)}
+
+    def close(self, timeout: float = 5.0):
+        if self.t.is_alive():
+            self.q.put(None); self.t.join(timeout)
+
+    # --- фоновый поток ------------------------------------------------------
+    def _run(self):
+        stop = False
+        while not stop:
+            items = [self.q.get()]
+            while len(items) < self.batch:
+                try: items.append(self.q.get_nowait())
+                except queue.Empty: break
+            if None in items:
+                stop = True; items = [i for i in items if i is not None]
+            t0 = time.perf_counter()
+            self._write(items)
+            if self.observe is not None and items:
+                self.observe(time.perf_counter() - t0)
+        for seg in self.segments.values(): seg.close()
+        self.segments.clear()
+
+    def _write(self, items):
+        groups: Dict[str, list] = {}
+        for ts, payload in items:
+            try:
+                line = json.dumps({"ts": ts, "gsi": payload}, ensure_ascii=False,
+                                  separators=(",", ":")).encode("utf-8") + b"\n"
+            except (TypeError, ValueError):
+                self.errors += 1; continue
+            groups.setdefault(match_key(payload), []).append(line)
+        for key, lines in groups.items():
+            seg = self.segments.pop(key, None) or self.closed.pop(key, None) \
+                or _Segment(self.root, key)
+            self.segments[key] = seg                       # в конец – самый свежий
+            try:
+                seg.write(lines, self.segment_bytes); self.written += len(lines)
+            except OSError:
+                self.errors += len(lines)
+        self.batches += 1
+        while len(self.segments) > MAX_OPEN:
+            key = next(iter(self.segments))
+            seg = self.closed[key] = self.segments.pop(key)
+            seg.close()
+
+
+def iter_log(path: pathlib.Path):
+    """(ts, payload) из сегмента .jsonl.gz; оборванный хвост молча отбрасывается."""
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    yield rec["ts"], rec["gsi"]
+        except (EOFError, OSError, json.JSONDecodeError):
+            return
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gsi_replay.py  – реплей записанных GSI‑пакетов в /gsi + замер задержки
+
+Источники: старые gsi_logs/*.json (время – из имени файла) и сегменты
+gsi_logs/*.jsonl.gz (gsi_log.py). Пакеты шлются в порядке записи:
+  --speed 1    реальное время
+  --speed 10   в 10 раз быстрее
+  --speed 0    без пауз (максимум)
+
+Задержка пакет → подсказка: /gsi отвечает заголовком X-Aegis-Seq, /hint
+отдаёт seq пакета, по которому посчитана подсказка. Наблюдатель опрашивает
+/hint каждые --poll-ms и для каждого нового seq считает (время появления −
+время отправки этого пакета). --watch sse вместо опроса слушает /hint/stream
+(пуш только при смене подсказки – меряется доставка). Плюс: пакетов/с, CPU% и
+RSS процесса ядра (--pid).
+
+--sessions N – те же пакеты от N «игроков» (auth.token replay-0…N-1) вперемешку:
+нагрузка на многосессионное ядро.
+
+Регрессия:
+  python gsi_replay.py gsi_logs --speed 0 --out bench.json
+  python gsi_replay.py gsi_logs --speed 0 --baseline bench.json --tolerance 0.2
+  (код выхода 1, если p50/p99 задержки или пакеты/с хуже базы больше чем на 20 %)
+"""
+
+from __future__ import annotations
+import argparse, json, os, pathlib, sys, threading, time
+from datetime import datetime, timezone
+
+import requests
+
+from gsi_log import iter_log
+
+# ---------------------------------------------------------------------------#
+def load_packets(paths) -> list[tuple[float, dict]]:
+    """(ts, payload) из файлов/каталогов, отсортированные по времени приёма."""
+    out = []
+    for p in map(pathlib.Path, paths):
+        files = sorted(p.iterdir()) if p.is_dir() else [p]
+        for fp in files:
+            if fp.name.endswith(".jsonl.gz"):
+                out.extend(iter_log(fp))
+            elif fp.suffix == ".json":
+                try:
+                    ts = datetime.strptime(fp.stem, "%Y%m%d_%H%M%S_%f") \
+                                 .replace(tzinfo=timezone.utc).timestamp()
+                except ValueError:
+                    ts = fp.stat().st_mtime
+                out.append((ts, json.loads(fp.read_text(encoding="utf-8"))))
+    out.sort(key=lambda x: x[0])
+    return out
+
+def fan_out(packets, n: int) -> list[tuple[float, dict]]:
+    """Каждый пакет – n раз, от n разных сессий (для многосессионного mvp1_core)."""
+    if n <= 1: return packets
+    return [(ts, {**p, "auth": {"token": f"replay-{k}"}}) for ts, p in packets for k in range(n)]
+
+def pct(xs, p):
+    if not xs: return None
+    s = sorted(xs)
+    return s[min(len(s) - 1, int(p * len(s)))]
+
+# ---------------------------------------------------------------------------#
+class ProcSampler:
+    """CPU% и RSS процесса ядра: psutil, если есть, иначе /proc (Linux)."""
+
+    def __init__(self, pid: int | None):
+        self.pid, self.ps = pid, None
+        if pid:
+            try:
+                import psutil
+                self.ps = psutil.Process(pid)
+            except ImportError:
+                pass
+        self.cpu0 = self.wall0 = None
+        self.rss_max = 0
+
+    def _cpu(self) -> float:
+        if self.ps is not None:
+            t = self.ps.cpu_times(); return t.user + t.system
+        f = open(f"/proc/{self.pid}/stat").read().rsplit(")", 1)[1].split()
+        return (int(f[11]) + int(f[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss(self) -> int:
+        if self.ps is not None:
+            return self.ps.memory_info().rss
+        for ln in open(f"/proc/{self.pid}/status"):
+            if ln.startswith("VmRSS:"):
+                return int(ln.split()[1]) * 1024
+        return 0
+
+    def start(self):
+        if self.pid:
+            self.cpu0, self.wall0 = self._cpu(), time.monotonic()
+
+    def sample(self):
+        if self.pid:
+            self.rss_max = max(self.rss_max, self._rss())
+
+    def result(self):
+        if not self.pid: return {}
+        return {"cpu_pct": round(100 * (self._cpu() - self.cpu0) /
+                                 max(time.monotonic() - self.wall0, 1e-9), 1),
+                "rss_max_mb": round(self.rss_max / 2**20, 1)}
+
+# ---------------------------------------------------------------------------#
+def replay(packets, url: str, speed: float, poll_ms: float, pid: int | None,
+           settle: float = 1.0, watch_mode: str = "poll") -> dict:
+    base = url.rstrip("/")
+    sent: dict[int, float] = {}
+    lat: list[float] = []
+    stop = threading.Event()
+    proc = ProcSampler(pid)
+
+    def seen(seq, now):
+        if seq in sent: lat.append((now - sent[seq]) * 1e3)
+
+    def watch_sse():
+        with requests.get(f"{base}/hint/stream", stream=True, timeout=(2, 30)) as r:
+            lines = r.iter_lines(chunk_size=1, decode_unicode=True)
+            while not stop.is_set():
+                ln = next(lines, None)
+                if ln is None: break
+                if ln.startswith("data:") and '"seq"' in ln:
+                    seen(json.loads(ln[5:]).get("seq"), time.perf_counter())
+                proc.sample()
+
+    def watch():
+        if watch_mode == "sse": return watch_sse()
+        s, last = requests.Session(), None
+        while not stop.is_set():
+            try:
+                seq = s.get(f"{base}/hint", timeout=1).json().get("seq")
+            except Exception:
+                seq = None
+            now = time.perf_counter()
+            if seq is not None and seq != last:
+                last = seq; seen(seq, now)
+            proc.sample()
+            time.sleep(poll_ms / 1e3)
+
+    th = threading.Thread(target=watch, daemon=True); th.start()
+    if watch_mode == "sse": time.sleep(0.2)           # подписка до первого пакета
+    s, errors = requests.Session(), 0
+    proc.start()
+    t0, ts0 = time.perf_counter(), packets[0][0]
+    for ts, payload in packets:
+        if speed > 0:
+            delay = (ts - ts0) / speed - (time.perf_counter() - t0)
+            if delay > 0: time.sleep(delay)
+        t_send = time.perf_counter()
+        try:
+            r = s.post(f"{base}/gsi", json=payload, timeout=5)
+            seq = r.headers.get("X-Aegis-Seq")
+            if seq is not None: sent[int(seq)] = t_send
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - t0
+    time.sleep(settle)                                # ждём подсказку по хвосту
+    stop.set(); th.join(2)
+
+    return {"packets": len(packets), "errors": errors, "elapsed_s": round(elapsed, 3),
+            "pps": round(len(packets) / max(elapsed, 1e-9), 1),
+            "hint_updates": len(lat),
+            "latency_ms": {k: (round(v, 2) if v is not None else None) for k, v in
+                           {"p50": pct(lat, .5), "p90": pct(lat, .9), "p99": pct(lat, .99),
+                            "max": pct(lat, 1.0)}.items()},
+            **proc.result()}
+
+def regressions(rep: dict, base: dict, tol: float) -> list[str]:
+    bad = []
+    for k in ("p50", "p99"):
+        a, b = rep["latency_ms"].get(k), base["latency_ms"].get(k)
+        if a is not None and b and a > b * (1 + tol):
+            bad.append(f"latency {k}: {a} ms > {b} ms × {1 + tol:.2f}")
+    if base.get("pps") and rep["pps"] < base["pps"] * (1 - tol):
+        bad.append(f"pps: {rep['pps']} < {base['pps']} × {1 - tol:.2f}")
+    return bad
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="+", help="gsi_logs/, *.json, *.jsonl.gz")
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--speed", type=float, default=1.0, help="1 – реальное время, 0 – максимум")
+    ap.add_argument("--poll-ms", type=float, default=2.0)
+    ap.add_argument("--watch", choices=["poll", "sse"], default="poll", help="как следить за подсказкой")
+    ap.add_argument("--pid", type=int, default=None, help="PID mvp1_core для CPU/RSS")
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--sessions", type=int, default=1, help="размножить пакеты на N сессий")
+    ap.add_argument("--out", type=pathlib.Path, default=None)
+    ap.add_argument("--baseline", type=pathlib.Path, default=None)
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    a = ap.parse_args()
+
+    packets = fan_out(load_packets(a.paths)[:a.limit], a.sessions)
+    if not packets:
+        print("⚠ no packets", file=sys.stderr); sys.exit(1)
+    rep = replay(packets, a.url, a.speed, a.poll_ms, a.pid, watch_mode=a.watch)
+    rep["speed"], rep["watch"], rep["sessions"] = a.speed, a.watch, a.sessions
+    print(json.dumps(rep, indent=2))
+    if a.out:
+        a.out.write_text(json.dumps(rep, indent=2))
+    if a.baseline:
+        bad = regressions(rep, json.loads(a.baseline.read_text()), a.tolerance)
+        for b in bad: print("REGRESSION", b, file=sys.stderr)
+        sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,20 @@
 # -*- coding: utf-8 -*-
 """
 Упрощённый HTTP-сервер для приёма Game State Integration от Dota 2.
-• Логирует каждый POST-пакет в ./gsi_logs/UTC-метка.json
+• Логирует каждый POST-пакет в ./gsi_logs/<matchid>-NNNN.jsonl.gz
+  (фоновый поток, пачками – см. gsi_log.py; /stats – счётчики очереди)
 • Печатает IP источника, размер пакета и текущий game_clock
 """
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 from pathlib import Path
 from datetime import datetime
-import json
+
+from gsi_log import GsiLogWriter
 
 app = Flask(__name__)
 LOG_DIR = Path("gsi_logs")
-LOG_DIR.mkdir(exist_ok=True)
+LOG_WRITER = GsiLogWriter(LOG_DIR)
 
 @app.route("/gsi", methods=["POST"])
 def handle_gsi():
@@ -22,9 +24,7 @@ def handle_gsi():
 
     payload = request.get_json(force=True)
     ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
-    (LOG_DIR / f"{ts}.json").write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    LOG_WRITER.submit(payload)
 
     map_time = payload.get("map", {}).get("clock_time")
     print(
@@ -34,6 +34,11 @@ def handle_gsi():
     return "OK", 200
 
 
+@app.route("/stats")
+def stats():
+    return jsonify(LOG_WRITER.stats())
+
+
 if __name__ == "__main__":
     # 0.0.0.0 → слушаем и localhost, и 192.168.x.x
     app.run(host="0.0.0.0", port=5000, threaded=True)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+hint_bus.py  – рассылка подсказок подписчикам по Server‑Sent Events
+
+rule_engine зовёт publish(msg) при смене подсказки; каждый GET /hint/stream
+получает свою маленькую очередь. Медленный клиент не тормозит остальных:
+при переполнении из его очереди выбрасывается самое старое сообщение.
+Новый подписчик сразу получает последнюю подсказку; без событий раз в
+heartbeat секунд уходит event: ping (по нему оверлей понимает, что канал жив).
+"""
+
+from __future__ import annotations
+import json, queue, threading, time
+from typing import Any, Dict, Iterator
+
+HEARTBEAT = 10.0
+MAX_PENDING = 8
+
+# ---------------------------------------------------------------------------#
+def sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class HintBus:
+    def __init__(self, heartbeat: float = HEARTBEAT, max_pending: int = MAX_PENDING):
+        self.heartbeat, self.max_pending = heartbeat, max_pending
+        self.lock = threading.Lock()
+        self.subs: set = set()
+        self.last: str | None = None
+        self.published = self.dropped = 0
+
+    def publish(self, msg: Dict[str, Any]):
+        data = json.dumps(msg, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            self.last = data; self.published += 1
+            subs = list(self.subs)
+        for q in subs:
+            while True:
+                try:
+                    q.put_nowait(data); break
+                except queue.Full:
+                    try: q.get_nowait()
+                    except queue.Empty: pass
+                    with self.lock: self.dropped += 1
+
+    def subscribe(self) -> queue.Queue:
+        q: queue.Queue = queue.Queue(self.max_pending)
+        with self.lock:
+            self.subs.add(q)
+            if self.last is not None: q.put_nowait(self.last)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self.lock:
+            self.subs.discard(q)
+
+    def stream(self) -> Iterator[str]:
+        """Генератор тела text/event-stream; отписка – при обрыве соединения."""
+        q = self.subscribe()
+        try:
+            yield "retry: 1000\n\n"
+            while True:
+                try:
+                    yield sse("hint", q.get(timeout=self.heartbeat))
+                except queue.Empty:
+                    yield sse("ping", json.dumps({"ts": time.time()}))
+        finally:
+            self.unsubscribe(q)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"subscribers": len(self.subs), "published": self.published,
+                    "dropped": self.dropped}
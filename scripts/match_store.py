@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+match_store.py  – хранилище сырых матчей OpenDota
+
+Форматы (--format):
+  json        <mid>.json, indent=2 – как раньше
+  jsonl.gz    сегменты matches-NNNNNN.jsonl.gz, один gzip‑member на матч
+  jsonl.zst   то же на zstd (нужен пакет zstandard)
+  bin         <mid>.bin – урезанная бинарная запись: JSON‑заголовок + сырые
+              NumPy‑буферы под zlib (всегда с --prune)
+
+--prune оставляет только то, что читает build_dataset: match_id, duration,
+objectives[type,time], tower_status_dire и players[*].{PLAYER_FIELDS}.
+
+Чтение: sources(raw) → файлы всех форматов, iter_records(fp) → Record
+(name, blob, kind) с .load(); iter_matches(raw) – просто (name, match).
+Сегмент, оборванный посреди записи, читается до последнего целого матча.
+MatchStore при открытии проверяет последний сегмент (gsi_log.intact_size):
+оборванный больше не дописывается, а матчи, записанные в него, но не
+попавшие в .store_ids, вносятся в индекс – повторно они не скачиваются.
+
+Конвертация существующего корпуса:
+  python match_store.py --raw data/raw --out data/raw_zst --format jsonl.zst --prune
+"""
+
+from __future__ import annotations
+import argparse, gzip, io, json, os, pathlib, re, struct, sys, threading, zlib
+from typing import Iterator, NamedTuple
+
+from gsi_log import intact_size
+
+PLAYER_FIELDS = ("gold_t", "xp_t", "death_times", "isRadiant",
+                 "account_id", "total_gold", "respawn_time")
+MATCH_FIELDS  = ("match_id", "duration", "tower_status_dire")
+LIST_FIELDS   = ("gold_t", "xp_t", "death_times")
+
+FORMATS  = ("json", "jsonl.gz", "jsonl.zst", "bin")
+SUFFIXES = {".json": "json", ".jsonl.gz": "jsonl.gz",
+            ".jsonl.zst": "jsonl.zst", ".bin": "bin"}
+
+SEGMENT_SIZE = 500
+IDS_FILE = ".store_ids"
+
+# ---------------------------------------------------------------------------#
+def prune(match: dict) -> dict:
+    """Урезаем ответ OpenDota до полей, которые потребляет пайплайн."""
+    out = {k: match[k] for k in MATCH_FIELDS if k in match}
+    if "objectives" in match:
+        out["objectives"] = [{k: e[k] for k in ("type", "time") if k in e}
+                             for e in match["objectives"] or []]
+    out["players"] = [{k: p[k] for k in PLAYER_FIELDS if k in p}
+                      for p in match.get("players", [])]
+    return out
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("jsonl.zst требует пакет zstandard (pip install zstandard)") from e
+    return zstandard
+
+class _ZstdFrames(io.RawIOBase):
+    """
+    zstd‑frame'ы сегмента подряд – как gzip.open для member'ов: оборванный
+    последний frame – EOFError (stream_reader молча теряет его), мусор – ZstdError.
+    """
+
+    def __init__(self, fp: pathlib.Path):
+        self.zstd, self.f = _zstd(), open(fp, "rb")
+        self.d, self.buf, self.pos, self.err = None, b"", 0, None
+
+    def readable(self): return True
+
+    def readinto(self, b) -> int:
+        while self.pos == len(self.buf):
+            if self.err is not None: raise self.err
+            chunk = self.f.read(1 << 16)
+            if not chunk:
+                if self.d is not None:
+                    raise EOFError("zstd segment ended in the middle of a frame")
+                return 0
+            out = []
+            try:
+                while chunk:
+                    if self.d is None: self.d = self.zstd.ZstdDecompressor().decompressobj()
+                    out.append(self.d.decompress(chunk))
+                    chunk = b""
+                    if self.d.eof: chunk, self.d = self.d.unused_data, None
+            except self.zstd.ZstdError as e:      # сначала отдаём целые frame'ы до него
+                if not out: raise
+                self.err = e
+            self.buf, self.pos = b"".join(out), 0
+        n = min(len(b), len(self.buf) - self.pos)
+        b[:n] = self.buf[self.pos:self.pos + n]; self.pos += n
+        return n
+
+    def close(self):
+        self.f.close(); super().close()
+
+def _open_segment(fp: pathlib.Path, kind: str):
+    return gzip.open(fp, "rb") if kind == "jsonl.gz" else io.BufferedReader(_ZstdFrames(fp))
+
+def _errors(kind: str) -> tuple:
+    """Чем кодек сообщает об оборванном / испорченном member'е."""
+    return (EOFError, OSError, zlib.error) + ((_zstd().ZstdError,) if kind == "jsonl.zst" else ())
+
+def kind_of(fp: pathlib.Path) -> str | None:
+    name = fp.name.lower()
+    for suf, kind in SUFFIXES.items():
+        if name.endswith(suf):
+            return kind
+    return None
+
+# -------------- bin: урезанная бинарная запись ------------------------------#
+# MAGIC + zlib( u32 len(header) | header JSON | сырые буферы полей игроков ).
+# Для каждого поля игрока state: 0 – ключа нет, 1 – None, 2 – значение,
+# поэтому .load() возвращает ровно тот же dict, что и prune(match).
+MAGIC = b"AGM1"
+
+def encode_bin(match: dict) -> bytes:
+    import numpy as np
+    m = prune(match); ps = m.pop("players")
+    head, bufs = {"m": m, "n": len(ps), "f": {}}, []
+    for f in PLAYER_FIELDS:
+        state = [0 if f not in p else 1 if p[f] is None else 2 for p in ps]
+        vals = [p[f] for p, s in zip(ps, state) if s == 2]
+        lens = [len(v) for v in vals] if f in LIST_FIELDS else None
+        if lens is not None: vals = [x for v in vals for x in v]
+        a = np.asarray(vals if vals else [], dtype=None if vals else np.int64)
+        head["f"][f] = [state, lens, a.dtype.str, a.nbytes]
+        bufs.append(a.tobytes())
+    hj = json.dumps(head, separators=(",", ":")).encode()
+    return MAGIC + zlib.compress(struct.pack("<I", len(hj)) + hj + b"".join(bufs), 6)
+
+def decode_bin(blob: bytes) -> dict:
+    import numpy as np
+    if blob[:4] != MAGIC: raise ValueError("not an Aegis match record")
+    raw = zlib.decompress(blob[4:])
+    hl = struct.unpack_from("<I", raw)[0]
+    head = json.loads(raw[4:4+hl]); off = 4 + hl
+    m, players = head["m"], [{} for _ in range(head["n"])]
+    for f in PLAYER_FIELDS:
+        state, lens, dt, nb = head["f"][f]
+        vals = np.frombuffer(raw, dtype=dt, count=nb // np.dtype(dt).itemsize,
+                             offset=off).tolist(); off += nb
+        if lens is not None:
+            flat, vals, i = vals, [], 0
+            for ln in lens:
+                vals.append(flat[i:i+ln]); i += ln
+        it = iter(vals)
+        for p, s in zip(players, state):
+            if s: p[f] = next(it) if s == 2 else None
+    m["players"] = players
+    return m
+
+# ---------------------------------------------------------------------------#
+class Record(NamedTuple):
+    name: str       # имя для логов: файл или файл:строка
+    blob: bytes     # сырые байты записи – по ним считается ключ кэша
+    kind: str
+
+    def load(self) -> dict:
+        return decode_bin(self.blob) if self.kind == "bin" else json.loads(self.blob)
+
+def sources(raw: pathlib.Path) -> list[pathlib.Path]:
+    """Все файлы корпуса любого формата (порядок – как у raw.glob; служебные .* мимо)."""
+    return [fp for fp in raw.iterdir()
+            if fp.is_file() and not fp.name.startswith(".") and kind_of(fp)]
+
+def iter_records(fp: pathlib.Path) -> Iterator[Record]:
+    kind = kind_of(fp)
+    if kind in ("json", "bin"):
+        yield Record(fp.name, fp.read_bytes(), kind); return
+    with _open_segment(fp, kind) as lines:
+        try:
+            for i, line in enumerate(lines):
+                if line.strip():
+                    yield Record(f"{fp.name}:{i+1}", line, "json")
+        except _errors(kind) as e:            # оборванный member: сегмент кончается на нём
+            print("truncated", fp.name, e, file=sys.stderr)
+
+def iter_matches(raw: pathlib.Path) -> Iterator[tuple[str, dict]]:
+    for fp in sources(raw):
+        for rec in iter_records(fp):
+            yield rec.name, rec.load()
+
+# ---------------------------------------------------------------------------#
+class MatchStore:
+    """Запись матчей в выбранном формате; потокобезопасно (для --workers)."""
+
+    def __init__(self, out: pathlib.Path, fmt: str = "json", prune: bool = False,
+                 segment_size: int = SEGMENT_SIZE):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format {fmt!r}, expected one of {FORMATS}")
+        self.out, self.fmt, self.prune = out, fmt, prune or fmt == "bin"
+        self.segment_size, self.lock = segment_size, threading.Lock()
+        self.ids: set[int] = set(); self.seg, self.seg_n = 0, 0
+        if fmt.startswith("jsonl"):
+            idf = out / IDS_FILE
+            text = idf.read_text() if idf.exists() else ""
+            for ln in text.splitlines():
+                try:
+                    mid, seg = (int(x) for x in ln.split(":"))
+                except ValueError:
+                    continue                           # строка, оборванная на записи
+                self.ids.add(mid)
+                if seg > self.seg: self.seg, self.seg_n = seg, 0
+                if seg == self.seg: self.seg_n += 1
+            if text and not text.endswith("\n"):
+                with open(idf, "a") as f: f.write("\n")
+            self._recover()
+
+    def _recover(self):
+        """
+        Обрыв мог оставить в последнем сегменте недописанный member (дописывать
+        после него нельзя – чтение остановится на нём) или целый матч без строки
+        в .store_ids (запись индекса идёт после сегмента).
+        """
+        seqs = [int(m.group(1)) for p in self.out.glob(f"matches-*.{self.fmt}")
+                if (m := re.fullmatch(rf"matches-(\d+)\.{re.escape(self.fmt)}", p.name))]
+        if max(seqs, default=0) > self.seg:          # сегмент начат, индекс не успел
+            self.seg, self.seg_n = max(seqs), 0
+        fp = self.segment(self.seg)
+        if not self.seg or not fp.exists(): return
+        n = sum(1 for _ in iter_records(fp))
+        if n > self.seg_n:
+            lost = [mid for mid in (rec.load()["match_id"] for rec in iter_records(fp))
+                    if mid not in self.ids]
+            with open(self.out / IDS_FILE, "a") as f:
+                f.writelines(f"{mid}:{self.seg}\n" for mid in lost)
+            self.ids.update(lost); self.seg_n = n
+        if intact_size(fp, lambda p: _open_segment(p, self.fmt), _errors(self.fmt)) is None:
+            self.seg_n = self.segment_size             # следующий матч – в новый сегмент
+
+    def segment(self, seg: int) -> pathlib.Path:
+        return self.out / f"matches-{seg:06d}.{self.fmt}"
+
+    def path(self, mid: int) -> pathlib.Path:
+        return self.out / f"{mid}.{self.fmt}"
+
+    def has(self, mid: int) -> bool:
+        if self.fmt.startswith("jsonl"):
+            return mid in self.ids
+        return self.path(mid).exists()
+
+    def put(self, mid: int, data: dict):
+        if self.prune: data = prune(data)
+        if self.fmt == "json":
+            self._atomic(self.path(mid), json.dumps(data, indent=2).encode())
+        elif self.fmt == "bin":
+            self._atomic(self.path(mid), encode_bin(data))
+        else:
+            line = json.dumps(data, separators=(",", ":")).encode() + b"\n"
+            # один member/frame на матч: обрыв портит максимум последнюю запись
+            blob = (gzip.compress(line) if self.fmt == "jsonl.gz"
+                    else _zstd().ZstdCompressor(level=10).compress(line))
+            with self.lock:
+                if mid in self.ids: return
+                if self.seg == 0 or self.seg_n >= self.segment_size:
+                    self.seg, self.seg_n = self.seg + 1, 0
+                with open(self.segment(self.seg), "ab") as f:
+                    f.write(blob)
+                with open(self.out / IDS_FILE, "a") as f:
+                    f.write(f"{mid}:{self.seg}\n")
+                self.ids.add(mid); self.seg_n += 1
+
+    @staticmethod
+    def _atomic(fn: pathlib.Path, blob: bytes):
+        tmp = fn.with_name(fn.name + ".tmp")     # без полуфайлов при обрыве
+        tmp.write_bytes(blob)
+        os.replace(tmp, fn)
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser(description="перепаковать сырой корпус в другой формат")
+    ap.add_argument("--raw",    type=pathlib.Path, default=pathlib.Path("data/raw"))
+    ap.add_argument("--out",    type=pathlib.Path, required=True)
+    ap.add_argument("--format", choices=FORMATS, default="jsonl.zst")
+    ap.add_argument("--prune",  action="store_true")
+    ap.add_argument("--segment-size", type=int, default=SEGMENT_SIZE)
+    a = ap.parse_args(); a.out.mkdir(parents=True, exist_ok=True)
+
+    store, n, skipped = MatchStore(a.out, a.format, a.prune, a.segment_size), 0, 0
+    for fp in sources(a.raw):
+        for rec in iter_records(fp):
+            try:
+                m = rec.load(); store.put(m["match_id"], m); n += 1
+            except Exception as e:
+                skipped += 1; print("skip", rec.name, e, file=sys.stderr)
+    size = lambda d: sum(f.stat().st_size for f in d.iterdir() if f.is_file())
+    print(f"✓ {n} matches → {a.out} ({a.format}) | skipped: {skipped} | "
+          f"{size(a.raw)/2**20:.1f} MB → {size(a.out)/2**20:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py  – счётчики, гистограммы и сэмплирующий профайлер для живых сервисов
+
+Без зависимостей. Метрики регистрируются в REGISTRY; render() отдаёт их в
+текстовом формате Prometheus 0.0.4 (GET /metrics в mvp1_core и serve_model):
+• Counter   – только растёт (inc) или функция над уже существующим счётчиком
+              (ENGINE["ticks"], GsiLogWriter.dropped)
+• Gauge     – set(v) или функция, которая читается в момент запроса
+              (глубина очереди, число подписчиков)
+• Histogram – бакеты в секундах; observe(s) / with h.time(): …
+У метрики с labelnames значения берутся через .labels("ingest").
+
+SamplingProfiler – включается по запросу (/profile/start … /profile/stop):
+поток раз в interval снимает стеки всех потоков через sys._current_frames и
+копит свёрнутые стеки – текст для flamegraph.pl / speedscope и топ функций.
+"""
+
+from __future__ import annotations
+import bisect, collections, sys, threading, time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# секунды: 50 мкс … 2.5 с
+BUCKETS = (5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5)
+
+def _fmt(v: float) -> str:
+    if v == float("inf"): return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+# ---------------------------------------------------------------------------#
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def _child(self) -> "_Metric":
+        return type(self)(self.name, self.help)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            for key, child in sorted(self.children.items()):
+                out += child._samples(key, self.labelnames)
+        else:
+            out += self._samples((), ())
+        return out
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Callable[[], float] | None = None):
+        super().__init__(name, help, labelnames)
+        self.value, self.fn = 0.0, fn
+
+    def set(self, v: float): self.value = v
+
+    def _samples(self, key, names):
+        try:
+            v = self.fn() if self.fn is not None else self.value
+        except Exception:
+            v = float("nan")
+        return [f"{self.name}{_labels(names, key)} {_fmt(v)}"]
+
+
+class Counter(Gauge):
+    kind = "counter"
+
+    def inc(self, n: float = 1):
+        with self.lock: self.value += n
+
+    def set(self, v: float):
+        raise TypeError("counter only goes up – inc() or fn=")
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)         # последний – +Inf
+        self.sum, self.count = 0.0, 0
+
+    def _child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, s: float):
+        i = bisect.bisect_left(self.buckets, s)
+        with self.lock:
+            self.counts[i] += 1; self.sum += s; self.count += 1
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def _samples(self, key, names):
+        with self.lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        out, acc = [], 0
+        for le, c in zip(self.buckets + (float("inf"),), counts):
+            acc += c
+            bound = 'le="' + _fmt(le) + '"'
+            out.append(f"{self.name}_bucket{_labels(names, key, bound)} {acc}")
+        out.append(f"{self.name}_sum{_labels(names, key)} {_fmt(total)}")
+        out.append(f"{self.name}_count{_labels(names, key)} {n}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("h", "t0")
+
+    def __init__(self, h: Histogram): self.h = h
+
+    def __enter__(self):
+        self.t0 = time.perf_counter(); return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, m: _Metric) -> _Metric:
+        with self.lock:
+            return self.metrics.setdefault(m.name, m)      # повторная регистрация – та же
+
+    def counter(self, name, help, labelnames=(), fn=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            ms = list(self.metrics.values())
+        return "\n".join(line for m in ms for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# вершина стека «поток ждёт» – в топ не попадает (в folded остаётся)
+IDLE = {"wait", "select", "poll", "accept", "sleep", "_wait_for_tstate_lock",
+        "readinto", "recv_into", "get"}
+
+# ---------------------------------------------------------------------------#
+class SamplingProfiler:
+    """Стеки всех потоков (кроме своего) раз в interval; ~накладные – один обход кадров."""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval, self.max_depth = interval, max_depth
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples, self.started, self.elapsed = 0, None, 0.0
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> bool:
+        if self.running: return False
+        self.stacks.clear(); self.samples, self.elapsed = 0, 0.0
+        self.stopped.clear(); self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self) -> bool:
+        if not self.running: return False
+        self.stopped.set(); self.thread.join(1.0)
+        self.elapsed = time.perf_counter() - self.started
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for tid, frame in sys._current_frames().items():
+                if tid == me: continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    c = frame.f_code
+                    stack.append(f"{c.co_name} ({c.co_filename.rsplit('/', 1)[-1]}:{c.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Свёрнутые стеки: «поток;внешняя;…;внутренняя N» – вход flamegraph.pl."""
+        return "".join(f"{s} {n}\n" for s, n in self.stacks.most_common())
+
+    def _busy(self):
+        for s, k in list(self.stacks.items()):
+            frames = s.split(";")[1:]
+            if frames and frames[-1].split(" ", 1)[0] not in IDLE:
+                yield frames, k
+
+    def top(self, n: int = 25) -> List[dict]:
+        """
+        Функции по сэмплам работающих потоков (вершина не из IDLE): self – на
+        вершине стека, total – где‑либо в стеке; pct – от всех рабочих сэмплов.
+        """
+        own, total = collections.Counter(), collections.Counter()
+        for frames, k in self._busy():
+            own[frames[-1]] += k
+            for f in set(frames): total[f] += k
+        hits = max(sum(own.values()), 1)
+        return [{"function": f, "self": c, "total": total[f],
+                 "self_pct": round(100 * c / hits, 1), "total_pct": round(100 * total[f] / hits, 1)}
+                for f, c in own.most_common(n)]
+
+    def report(self, n: int = 25) -> dict:
+        elapsed = self.elapsed if not self.running else time.perf_counter() - self.started
+        busy = sum(k for _, k in self._busy())
+        return {"running": self.running, "samples": self.samples,
+                "seconds": round(elapsed, 2), "interval": self.interval,
+                "busy_stacks": busy, "idle_stacks": sum(self.stacks.values()) - busy,
+                "top": self.top(n)}
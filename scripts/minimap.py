@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+minimap.py  – признаки с кадра миникарты (screenshot.FrameBuffer)
+
+Иконки героев ищутся по цвету (HSV): враги – красные, союзники – зелёные
+(цвета миникарты Dota по умолчанию). На кадр:
+• minimap_{enemy,ally}             – сколько иконок видно
+• minimap_{enemy,ally}_<region>    – иконки по зонам карты REGIONS
+  (сетка 3×3: верх/низ – по лесу вдоль линий, база – свой угол)
+• minimap_{enemy,ally}_g<r><c>     – доля «цветных» пикселей в клетке
+  грубой сетки GRID×GRID (занятость, 0‥1)
+
+Кадровые буферы (HSV, маски, метки компонент) выделяются один раз;
+stats / centroids компонент переиспользуются, пока число пятен на маске не
+меняется, остальное – массивы по числу иконок. MinimapWorker считает в своём
+потоке по новым кадрам буфера, не на запросе; mvp1_core только подмешивает
+последний dict в вектор признаков.
+"""
+
+from __future__ import annotations
+import threading, time
+from typing import Callable, Dict
+import numpy as np
+
+# зоны карты по клеткам 3×3 (строка 0 – верх кадра, Dire – справа сверху)
+REGIONS = ["top", "mid", "bot", "rad_base", "dire_base"]
+CELL_REGION = np.array([[0, 0, 4],
+                        [0, 1, 2],
+                        [3, 2, 2]], dtype=np.intp)
+GRID = 3
+MIN_AREA = 12            # px: меньше – точки крипов/вардов, не герои
+
+# HSV (OpenCV: H 0‥179): (нижняя, верхняя) границы; красный – два диапазона
+COLORS = {
+    "enemy": [((0, 120, 120), (8, 255, 255)), ((172, 120, 120), (179, 255, 255))],
+    "ally":  [((45, 120, 120), (85, 255, 255))],
+}
+
+def feature_names(grid: int = GRID):
+    names = []
+    for team in COLORS:
+        names.append(f"minimap_{team}")
+        names += [f"minimap_{team}_{r}" for r in REGIONS]
+        names += [f"minimap_{team}_g{i}{j}" for i in range(grid) for j in range(grid)]
+    return names
+
+# ---------------------------------------------------------------------------#
+class MinimapFeatures:
+    """Кадр BGR (H×W×3) → dict признаков; буферы под размер кадра выделяются один раз."""
+
+    def __init__(self, shape, grid: int = GRID, min_area: int = MIN_AREA):
+        import cv2
+        self.cv2, self.grid, self.min_area = cv2, grid, min_area
+        h, w = shape[:2]
+        self.h, self.w = h, w
+        self.hsv  = np.empty((h, w, 3), dtype=np.uint8)
+        self.tmp  = np.empty((h, w), dtype=np.uint8)
+        self.mask = {t: np.empty((h, w), dtype=np.uint8) for t in COLORS}
+        self.labels = np.empty((h, w), dtype=np.int32)
+        # stats / centroids: cv2 пишет в них, пока число компонент то же, иначе – новые
+        self.stats = {t: np.empty((1, 5), dtype=np.int32) for t in COLORS}
+        self.cent  = {t: np.empty((1, 2), dtype=np.float64) for t in COLORS}
+        self.lo = {t: [np.array(lo, np.uint8) for lo, _ in rs] for t, rs in COLORS.items()}
+        self.hi = {t: [np.array(hi, np.uint8) for _, hi in rs] for t, rs in COLORS.items()}
+        # занятость: обрезаем до кратного grid и суммируем блоками
+        self.gh, self.gw = h // grid, w // grid
+        self.names = feature_names(grid)
+
+    def _mask(self, team: str) -> np.ndarray:
+        cv2, m = self.cv2, self.mask[team]
+        for k, (lo, hi) in enumerate(zip(self.lo[team], self.hi[team])):
+            if k == 0:
+                cv2.inRange(self.hsv, lo, hi, dst=m)
+            else:
+                cv2.inRange(self.hsv, lo, hi, dst=self.tmp)
+                cv2.bitwise_or(m, self.tmp, dst=m)
+        return m
+
+    def compute(self, frame: np.ndarray) -> Dict[str, float]:
+        cv2, g = self.cv2, self.grid
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        out: Dict[str, float] = {}
+        for team in COLORS:
+            m = self._mask(team)
+            n, _, stats, cent = cv2.connectedComponentsWithStats(
+                m, self.labels, self.stats[team], self.cent[team], 8, cv2.CV_32S)
+            self.stats[team], self.cent[team] = stats, cent
+            keep = stats[1:, cv2.CC_STAT_AREA] >= self.min_area      # 0 – фон
+            c = cent[1:][keep]
+            rn, cn = CELL_REGION.shape             # сетка зон, не grid занятости
+            rows = np.minimum((c[:, 1] * rn / self.h).astype(np.intp), rn - 1)
+            cols = np.minimum((c[:, 0] * cn / self.w).astype(np.intp), cn - 1)
+            per = np.bincount(CELL_REGION[rows, cols], minlength=len(REGIONS))
+            occ = m[:self.gh * g, :self.gw * g].reshape(g, self.gh, g, self.gw) \
+                   .sum(axis=(1, 3), dtype=np.int64) / (255.0 * self.gh * self.gw)
+            out[f"minimap_{team}"] = int(keep.sum())
+            for r, v in zip(REGIONS, per.tolist()):
+                out[f"minimap_{team}_{r}"] = v
+            for (i, j), v in np.ndenumerate(occ):
+                out[f"minimap_{team}_g{i}{j}"] = round(float(v), 3)
+        return out
+
+
+class MinimapWorker:
+    """
+    Поток: ждёт новый seq в FrameBuffer, копирует кадр (read), считает признаки.
+    features – последний dict (подмена ссылки атомарна), on_update(features) –
+    после каждого изменения (mvp1_core будит движок).
+    """
+
+    def __init__(self, buf, poll: float = 0.02, on_update: Callable | None = None, **kw):
+        self.buf, self.poll, self.on_update = buf, poll, on_update
+        self.fx = MinimapFeatures(buf.shape, **kw)
+        self.frame = np.empty(buf.shape, dtype=np.uint8)
+        self.features: Dict[str, float] = {}
+        self.seq = 0
+        self.frames, self.busy_ms, self.max_ms = 0, 0.0, 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="minimap", daemon=True)
+
+    def start(self) -> "MinimapWorker":
+        self.thread.start(); return self
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.buf.seq == self.seq:
+                self.stopped.wait(self.poll); continue
+            self.seq, frame = self.buf.read(self.frame)
+            t0 = time.perf_counter()
+            feats = self.fx.compute(frame)
+            ms = (time.perf_counter() - t0) * 1e3
+            self.frames += 1; self.busy_ms += ms; self.max_ms = max(self.max_ms, ms)
+            if feats != self.features:
+                self.features = feats
+                if self.on_update: self.on_update(feats)
+
+    def stop(self):
+        self.stopped.set(); self.thread.join(1.0)
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "seq": self.seq,
+                "avg_ms": round(self.busy_ms / max(self.frames, 1), 3),
+                "max_ms": round(self.max_ms, 3), "features": self.features}
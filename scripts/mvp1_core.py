@@ -4,36 +4,94 @@
 Aegis Assistant — MVP 2
 • принимает GSI (/gsi)
 • считает 12 фич для LightGBM v3
-• запрашивает /predict → отдаёт подсказку браузерному оверлею (/hint)
+• запрашивает модель → отдаёт подсказку браузерному оверлею:
+  /hint/stream – SSE‑пуш {hint, label, confidence, ts, seq} сразу при смене
+                 подсказки (+ event: ping раз в 10 с); /hint – как раньше, опросом
+  --backend remote (default) – /predict serve_model.py через keep‑alive сессию
+  --backend local            – тот же bundle .pkl прямо в процессе
+• /latency – задержка инференса за тик (p50 / p99 / max, мс)
+  --engine poll (default) – опрос STATE раз в 0.5 с
+  --engine event          – /gsi будит движок сразу; пачка пакетов схлопывается
+                            до последнего, неизменный вектор признаков не гоняется
+                            через модель повторно
+• пакеты пишутся фоном в gsi_logs/<matchid>-NNNN.jsonl.gz (gsi_log.py),
+  /log_stats – очередь / записано / отброшено
+• сессии: у каждого игрока (auth.token из cfg GSI, иначе player.steamid) свои
+  признаки и подсказка – /hint/<session>, /hint/<session>/stream, /sessions.
+  Все сессии тика – один батч в модель (predict_batch). /hint и /hint/stream
+  без сессии – последняя подсказка любой сессии (один игрок – как раньше)
+• миникарта: поток minimap.py считает по новым кадрам захвата иконки героев
+  по зонам и сетку занятости; в вектор сессии (--minimap-session, по умолчанию –
+  во все) идут только те ключи minimap_*, что есть в FEATURES модели, и только
+  их изменение будит движок; /minimap – последние признаки
+• /metrics – Prometheus: гистограммы стадий aegis_core_stage_seconds{stage=
+  ingest|log_write|features|inference|publish}, отказы модели по причинам,
+  глубины очередей; --profile включает /profile/start, /profile/stop,
+  /profile (топ функций) и /profile/folded (стеки для flamegraph)
+• холодный старт: /gsi принимает пакеты сразу после запуска; модель (и захват
+  с --capture / --capture-source) грузятся фоном – cv2 / mss / lightgbm /
+  requests импортируются только там. Пока модели нет (грузится, нет файла,
+  serve_model не поднят) – подсказки по таблице rules.py, модель перезапрашивается
+  раз в --model-retry с. /ready – 503, пока модели нет, затем 200; в обоих случаях
+  отчёт STARTUP (мс от запуска по этапам, predictor_error). bench_startup.py
+  проверяет бюджет импорта и время до первого принятого пакета.
 """
 
 from __future__ import annotations
-from flask import Flask, request, jsonify, abort
+import time
+T0 = time.perf_counter()   # отчёт о старте считается отсюда
+
+from flask import Flask, Response, request, jsonify, abort
 from flask_cors import CORS
-from datetime import datetime, UTC
 from pathlib import Path
-import json, threading, time, requests, collections
+import argparse, threading
+
+from features import DEATH_WINDOW as TRAIN_WINDOW, LIVE_FEATURES, FeatureExtractor, check_death_window
+from gsi_log import GsiLogWriter
+from hint_bus import HintBus
+from predictor import DEFAULT_MODEL, DEFAULT_URL, RulePredictor, make_predictor
+from metrics import CONTENT_TYPE, REGISTRY, SamplingProfiler
 
-import screenshot      # ваш модуль «делаем скриншот миникарты»
+# --- метрики ----------------------------------------------------------------#
+STAGE = REGISTRY.histogram("aegis_core_stage_seconds", "Duration of a core pipeline stage",
+                           ("stage",))
+ST_INGEST, ST_LOG, ST_FX, ST_INFER, ST_PUBLISH = (
+    STAGE.labels(s) for s in ("ingest", "log_write", "features", "inference", "publish"))
+FALLBACK = REGISTRY.counter("aegis_core_fallbacks_total",
+                            "Model calls that failed and fell back to the rules table", ("reason",))
+PACKETS = REGISTRY.counter("aegis_core_gsi_packets_total", "GSI packets accepted")
+PROFILER = None            # SamplingProfiler при --profile
 
 # ---------------------------------------------------------------------------#
 app = Flask(__name__)
 CORS(app)
-LOG = Path("gsi_logs"); LOG.mkdir(exist_ok=True)
+LOG = None                         # GsiLogWriter – создаётся в __main__, импорт без побочек
+BUS = HintBus()                    # /hint/stream – подсказки всех сессий
 
-STATE: dict = {}           # последняя GSI‑снимка
-HINT  = "..."              # текст в оверлее
+HINT  = "..."              # последняя подсказка любой сессии (для /hint)
+HINT_LABEL, HINT_CONF = None, None   # метка модели и её вероятность
 LOCK  = threading.Lock()
+NEW   = threading.Condition(LOCK)   # /gsi → rule_engine (--engine event)
+SEQ      = 0               # номер последнего принятого пакета (X-Aegis-Seq), общий
+HINT_SEQ  = 0              # пакет, по которому посчитан HINT (для gsi_replay.py)
+PREDICTOR = None           # RulePredictor, затем LocalPredictor | RemotePredictor
+FALLBACKS = 0              # сколько раз модель не ответила → правила RULES
+RULES = None               # RulePredictor: до загрузки модели и при её отказе
+ENGINE = {"mode": None, "ticks": 0, "skipped": 0,   # skipped – вектор не изменился
+          "batches": 0, "max_batch": 0}
+SESSIONS: dict = {}        # ключ сессии → Session
+DIRTY: set = set()         # сессии с пакетами, ещё не посчитанными движком
+DEATH_WINDOW = TRAIN_WINDOW[0]
+SESSION_TTL  = 600         # с без пакетов и подписчиков → сессия удаляется
+MINIMAP = None             # MinimapWorker (если захват включён)
+MINIMAP_SESSION = None     # чья это миникарта; None – подмешивать во все сессии
+MINIMAP_KEYS: tuple = ()   # minimap_* из FEATURES модели; прочие в вектор не идут
+MINIMAP_LAST = None        # их значения при последнем пересчёте сессий
+CAPTURE = None             # screenshot.Capture (--capture / --capture-source)
+READY = threading.Event()  # модель загружена (до того движок идёт на правилах)
+STARTUP: dict = {}         # этап → мс от T0 (+ ошибки фоновой загрузки)
 
 # --- постоянные -------------------------------------------------------------#
-FEATURES = [
-    "gold_adv", "xp_adv",
-    "our_dead_tot", "enemy_dead_tot",
-    "our_alive", "enemy_alive",
-    "our_core_alive", "enemy_core_alive", "enemy_core_dead",
-    "roshan_alive", "recent_deaths", "towers_dire_t3_down",
-]
-
 LABEL2TXT = {
     "FARM":   "💰 Фарм",
     "STACK":  "📦 Стак",
@@ -43,135 +101,370 @@ LABEL2TXT = {
 }
 
 # --- вспомогалки ------------------------------------------------------------#
-death_buffer = collections.deque(maxlen=200)   # (timestamp)
-last_alive   = {}                              # steamid -> bool
-
 def now_ts() -> int: return int(time.time())
 
-def team_of_player(p: dict) -> int:
-    # team: 2 – Radiant, 3 – Dire (по GSI)
-    return p.get("team") or p.get("team2") or 0
-
-def gold_adv(gsi: dict) -> int:
-    # попробуем взять готовое поле, иначе считаем “на коленке”
-    map_blk = gsi.get("map", {})
-    if "radiant_gold_adv" in map_blk:
-        return map_blk["radiant_gold_adv"]
-    adv = 0
-    for p in gsi.get("allplayers", {}).values():
-        side = 1 if team_of_player(p) == 2 else -1
-        adv += p.get("net_worth", p.get("gold", 0)) * side
-    return adv
-
-def xp_adv(gsi: dict) -> int:
-    return gsi.get("map", {}).get("radiant_xp_adv", 0)
-
-def core_ids(gsi: dict, n=2):
-    rad, dire = [], []
-    for sid, p in gsi.get("allplayers", {}).items():
-        t = team_of_player(p)
-        nw = p.get("net_worth", p.get("gold", 0))
-        (rad if t == 2 else dire).append((nw, sid))
-    rad_ids  = [sid for _, sid in sorted(rad,  reverse=True)[:n]]
-    dire_ids = [sid for _, sid in sorted(dire, reverse=True)[:n]]
-    return {"R": rad_ids, "D": dire_ids}
-
-def update_deaths(gsi: dict):
-    ts = now_ts()
-    for sid, p in gsi.get("allplayers", {}).items():
-        alive = p.get("alive", True)
-        was   = last_alive.get(sid, True)
-        if was and not alive:
-            death_buffer.append(ts)
-        last_alive[sid] = alive
-
-def recent_deaths_window(sec=15) -> int:
-    cut = now_ts() - sec
-    return sum(1 for d in death_buffer if d >= cut)
-
-def towers_dire_t3_down(gsi: dict):
-    # buildings[].name содержит 'dota_badguys_tower3_*'
-    blds = gsi.get("map", {}).get("buildings", [])
-    t3   = [b for b in blds if "_tower3_" in b.get("name","")]
-    return int(all(b.get("health",1) == 0 for b in t3)) if t3 else 0
-
-def roshan_alive(gsi: dict):
-    rs = gsi.get("map", {}).get("roshan_state", "")
-    return 1 if rs == "alive" else 0
+def session_key(payload: dict) -> str:
+    return str(payload.get("auth", {}).get("token")
+               or payload.get("player", {}).get("steamid") or "default")
+
+
+class Session:
+    """Всё, что раньше было глобальным на один процесс, – на одного игрока."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.fx = FeatureExtractor(DEATH_WINDOW)   # признаки обновляются на каждый пакет
+        self.state: dict = {}                      # последняя GSI‑снимка
+        self.seq = 0                               # пакет, лежащий в state
+        self.hint, self.label, self.conf, self.hint_seq = "...", None, None, 0
+        self.last_vec = self.last_pred = None        # что и кем посчитано последним
+        self.bus = HintBus()
+        self.seen = time.monotonic()
+
+    def info(self) -> dict:
+        return {"session": self.key, "hint": self.hint, "label": self.label,
+                "confidence": self.conf, "seq": self.hint_seq}
+
+def get_session(key: str) -> Session:
+    """Под LOCK: сессия по ключу (создаётся, даже если пакетов ещё не было)."""
+    s = SESSIONS.get(key)
+    if s is None:
+        s = SESSIONS[key] = Session(key)
+    return s
 
 # ---------------------------------------------------------------------------#
 @app.route("/gsi", methods=["POST"])
 def handle_gsi():
+    t0 = time.perf_counter()
     if not request.is_json: abort(400, "Need JSON")
     payload = request.get_json(force=True)
 
-    ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S_%f")
-    (LOG / f"{ts}.json").write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    if LOG is not None: LOG.submit(payload)   # запись на диск – в фоновом потоке
 
+    global SEQ
     with LOCK:
-        STATE.clear(); STATE.update(payload)
-    update_deaths(payload)
-    return "OK", 200
+        s = get_session(session_key(payload))
+        s.state = payload               # новый dict, старый не трогаем – копия не нужна
+        t1 = time.perf_counter()
+        s.fx.update(payload)            # слоты игроков / смерти / core – инкрементально
+        ST_FX.observe(time.perf_counter() - t1)
+        SEQ += 1; s.seq = seq = SEQ
+        s.seen = time.monotonic()
+        DIRTY.add(s.key)
+        NEW.notify()
+    PACKETS.inc()
+    ST_INGEST.observe(time.perf_counter() - t0)
+    return "OK", 200, {"X-Aegis-Seq": str(seq)}
+
+def sse_response(bus: HintBus):
+    return Response(bus.stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/hint")
-def get_hint(): return jsonify({"hint": HINT, "ts": now_ts()})
+def get_hint(): return jsonify({"hint": HINT, "label": HINT_LABEL, "confidence": HINT_CONF,
+                                "ts": now_ts(), "seq": HINT_SEQ})
+
+@app.route("/hint/stream")
+def hint_stream(): return sse_response(BUS)
+
+@app.route("/hint/subscribers")
+def get_subscribers(): return jsonify(BUS.stats())
+
+@app.route("/hint/<session>")
+def get_session_hint(session):
+    with LOCK:
+        s = SESSIONS.get(session)
+    if s is None: abort(404, "unknown session")
+    return jsonify({**s.info(), "ts": now_ts()})
+
+@app.route("/hint/<session>/stream")
+def session_stream(session):
+    with LOCK:
+        s = get_session(session)        # оверлей может подключиться раньше игры
+    return sse_response(s.bus)
+
+@app.route("/sessions")
+def get_sessions():
+    now = time.monotonic()
+    with LOCK:
+        ss = list(SESSIONS.values())
+    return jsonify([{**s.info(), "packets": s.fx.packets, "idle_s": round(now - s.seen, 1),
+                     "subscribers": s.bus.stats()["subscribers"]} for s in ss])
+
+@app.route("/capture")
+def get_capture():
+    return jsonify(CAPTURE.stats() if CAPTURE else {"running": False})
+
+@app.route("/minimap")
+def get_minimap():
+    return jsonify(MINIMAP.stats() if MINIMAP else {"running": False})
+
+@app.route("/log_stats")
+def get_log_stats(): return jsonify(LOG.stats() if LOG else {"running": False})
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def profiler():
+    if PROFILER is None: abort(404, "start mvp1_core with --profile")
+    return PROFILER
+
+@app.route("/profile/start", methods=["GET", "POST"])
+def profile_start():
+    return jsonify({"started": profiler().start(), **PROFILER.report(0)})
+
+@app.route("/profile/stop", methods=["GET", "POST"])
+def profile_stop():
+    profiler().stop()
+    return jsonify(PROFILER.report(int(request.args.get("top", 25))))
+
+@app.route("/profile")
+def profile_report():
+    return jsonify(profiler().report(int(request.args.get("top", 25))))
+
+@app.route("/profile/folded")
+def profile_folded():
+    return Response(profiler().folded(), mimetype="text/plain")
+
+@app.route("/ready")
+def get_ready():
+    return jsonify({"ready": READY.is_set(), **STARTUP}), 200 if READY.is_set() else 503
+
+@app.route("/latency")
+def get_latency():
+    if PREDICTOR is None: return jsonify({"backend": None})
+    return jsonify({"backend": PREDICTOR.kind, "fallbacks": FALLBACKS,
+                    "engine": {**ENGINE, "sessions": len(SESSIONS)},
+                    **PREDICTOR.stats.summary()})
 
 # ---------------------------------------------------------------------------#
-def rule_engine():
-    global HINT
-    my_team = None           # определим один раз
+def _snapshot():
+    """Под LOCK: [(сессия, вектор, seq)] по сессиям с новыми пакетами."""
+    out = []
+    for key in DIRTY:
+        s = SESSIONS.get(key)
+        if s is not None and s.fx.packets:
+            out.append((s, s.fx.vector(), s.seq))
+    DIRTY.clear()
+    return out
+
+def minimap_changed(features):
+    """
+    Поток minimap: пересчитать сессии, к которым относятся признаки, – только
+    если поменялись те, что знает модель (пока их нет – векторы не трогаем).
+    """
+    global MINIMAP_LAST
+    cur = tuple(features.get(k) for k in MINIMAP_KEYS)
+    if not MINIMAP_KEYS or cur == MINIMAP_LAST: return
+    MINIMAP_LAST = cur
+    with LOCK:
+        for key, s in SESSIONS.items():
+            if s.fx.packets and minimap_for(s):
+                DIRTY.add(key)
+        if DIRTY: NEW.notify()
+
+def minimap_for(s: Session) -> bool:
+    return MINIMAP is not None and bool(MINIMAP_KEYS) and MINIMAP_SESSION in (None, s.key)
+
+def minimap_keys(p) -> tuple:
+    return tuple(f for f in getattr(p, "features", None) or () if f.startswith("minimap_"))
+
+def next_batch(mode: str):
+    if mode == "event":
+        with NEW:
+            # recent_deaths идёт по clock_time – без пакетов признаки не меняются
+            NEW.wait_for(lambda: DIRTY)
+            return _snapshot()
+    time.sleep(0.5)
+    with LOCK:
+        return _snapshot()
+
+def since_start() -> float:
+    return round((time.perf_counter() - T0) * 1e3, 1)
+
+def load_predictor(args) -> bool:
+    """
+    Одна попытка загрузить модель. Удалась – она подменяет правила, и сессии с
+    пакетами пересчитываются ею; нет – ошибка в STARTUP (/ready), движок на правилах.
+    """
+    global PREDICTOR, MINIMAP_KEYS, MINIMAP_LAST
+    try:
+        p = make_predictor(args.backend, args.model, args.predict_url, args.timeout)
+        if hasattr(p, "ready"): p.ready()            # remote: serve_model отвечает /ready
+        check_death_window(getattr(p, "death_window", None), DEATH_WINDOW)
+    except Exception as exc:
+        STARTUP["predictor_error"] = f"{type(exc).__name__}: {exc}"
+        return False
+    with LOCK:
+        PREDICTOR, MINIMAP_KEYS, MINIMAP_LAST = p, minimap_keys(p), None
+        DIRTY.update(k for k, s in SESSIONS.items() if s.fx.packets)
+        if DIRTY: NEW.notify()
+    STARTUP.pop("predictor_error", None)
+    STARTUP["predictor_ms"] = since_start()
+    READY.set(); STARTUP["ready_ms"] = since_start()
+    return True
+
+def start_subsystems(args):
+    """
+    Фоном, пока /gsi уже слушает: движок сразу на правилах rules.py, затем
+    модель, захват → миникарта. Модель не загрузилась (нет файла, serve_model
+    ещё не поднят) – повтор раз в --model-retry с, подсказки тем временем по
+    правилам. Пакеты, пришедшие раньше движка, ждут в DIRTY – первый тик их заберёт.
+    """
+    global PREDICTOR, RULES, CAPTURE, MINIMAP, MINIMAP_SESSION
+    PREDICTOR = RULES = RulePredictor()
+    threading.Thread(target=rule_engine, args=(args.engine,), name="rule-engine",
+                     daemon=True).start()
+    STARTUP["engine_ms"] = since_start()
+    loaded = load_predictor(args)
+    if args.capture or args.capture_source:
+        try:
+            import screenshot                       # cv2 / mss – только с захватом
+            CAPTURE = screenshot.start(args.capture_source, shared=args.shared_frames)
+            if not args.no_minimap:
+                from minimap import MinimapWorker
+                MINIMAP_SESSION = args.minimap_session
+                MINIMAP = MinimapWorker(CAPTURE.buf, on_update=minimap_changed).start()
+            STARTUP["capture_ms"] = since_start()
+        except Exception as exc:
+            STARTUP["capture_error"] = f"{type(exc).__name__}: {exc}"
+    print("startup:", ", ".join(f"{k} {v}" for k, v in STARTUP.items()), flush=True)
+    while not loaded:
+        time.sleep(args.model_retry)
+        if load_predictor(args):
+            print(f"model loaded after retries: ready_ms {STARTUP['ready_ms']}", flush=True)
+            loaded = True
+
+def register_gauges():
+    """Счётчики и очереди, которые уже есть в ENGINE / LOG / BUS – читаются при /metrics."""
+    for k in ("ticks", "skipped", "batches"):
+        REGISTRY.counter(f"aegis_core_engine_{k}_total", f"rule_engine {k}",
+                         fn=lambda k=k: ENGINE[k])
+    REGISTRY.gauge("aegis_core_engine_max_batch", "Largest batch sent to the model",
+                   fn=lambda: ENGINE["max_batch"])
+    REGISTRY.gauge("aegis_core_sessions", "Live sessions", fn=lambda: len(SESSIONS))
+    REGISTRY.gauge("aegis_core_dirty_sessions", "Sessions waiting for the engine",
+                   fn=lambda: len(DIRTY))
+    REGISTRY.gauge("aegis_core_log_queue_depth", "GSI log writer queue depth",
+                   fn=lambda: LOG.q.qsize() if LOG else 0)
+    REGISTRY.counter("aegis_core_log_written_total", "GSI packets written to disk",
+                     fn=lambda: LOG.written if LOG else 0)
+    REGISTRY.counter("aegis_core_log_dropped_total", "GSI packets dropped (log queue full)",
+                     fn=lambda: LOG.dropped if LOG else 0)
+    REGISTRY.gauge("aegis_core_sse_subscribers", "Global /hint/stream subscribers",
+                   fn=lambda: BUS.stats()["subscribers"])
+    REGISTRY.counter("aegis_core_sse_dropped_total", "Hints dropped for slow SSE clients",
+                     fn=lambda: BUS.dropped + sum(s.bus.dropped for s in list(SESSIONS.values())))
+    REGISTRY.counter("aegis_core_predict_calls_total", "Predictor calls (local or remote)",
+                     fn=lambda: PREDICTOR.stats.calls if PREDICTOR is not None else 0)
+
+register_gauges()
+
+def expire_sessions():
+    now = time.monotonic()
+    with LOCK:
+        for key in [k for k, s in SESSIONS.items() if now - s.seen > SESSION_TTL
+                    and not s.bus.stats()["subscribers"]]:
+            del SESSIONS[key]
+
+def rule_engine(mode: str = "poll"):
+    """PREDICTOR читается на каждый тик – load_predictor подменяет правила моделью на ходу."""
+    global FALLBACKS
+    ENGINE["mode"] = mode
+    next_gc = time.monotonic() + 60
 
     while True:
-        time.sleep(0.5)
-        with LOCK:
-            if not STATE: continue
-            gsi = STATE.copy()
-
-        if my_team is None:
-            my_team = gsi.get("player", {}).get("team", 2)  # 2 / 3
-
-        # --- вычисляем признаки ------------------------------------------
-        gold     = gold_adv(gsi)
-        xp       = xp_adv(gsi)
-
-        our_alive = enemy_alive = our_dead = enemy_dead = 0
-        for p in gsi.get("allplayers", {}).values():
-            alive = p.get("alive", True)
-            if team_of_player(p) == my_team:
-                our_alive  += alive
-                our_dead   += (not alive)
-            else:
-                enemy_alive  += alive
-                enemy_dead   += (not alive)
-
-        cores = core_ids(gsi)
-        our_core_alive    = sum(last_alive.get(sid, True) for sid in cores["R" if my_team==2 else "D"])
-        enemy_core_alive  = sum(last_alive.get(sid, True) for sid in cores["D" if my_team==2 else "R"])
-        enemy_core_dead   = 2 - enemy_core_alive
-
-        vec = dict(
-            gold_adv=gold, xp_adv=xp,
-            our_dead_tot=our_dead, enemy_dead_tot=enemy_dead,
-            our_alive=our_alive, enemy_alive=enemy_alive,
-            our_core_alive=our_core_alive,
-            enemy_core_alive=enemy_core_alive,
-            enemy_core_dead=enemy_core_dead,
-            roshan_alive=roshan_alive(gsi),
-            recent_deaths=recent_deaths_window(15),
-            towers_dire_t3_down=towers_dire_t3_down(gsi),
-        )
-
-        # --- запрос модели -----------------------------------------------
+        todo = []
+        batch = next_batch(mode)
+        predictor = PREDICTOR
+        for s, arr, seq in batch:
+            vec = dict(zip(LIVE_FEATURES, arr.tolist()))
+            if minimap_for(s):
+                mm = MINIMAP.features
+                vec.update((k, mm[k]) for k in MINIMAP_KEYS if k in mm)
+            ENGINE["ticks"] += 1
+            # подсказка та же – только отмечаем пакет (если её дал тот же предиктор)
+            if vec == s.last_vec and s.last_pred is predictor:
+                ENGINE["skipped"] += 1; mark(s, seq)
+                continue
+            s.last_vec, s.last_pred = vec, predictor
+            todo.append((s, vec, seq))
+        if time.monotonic() > next_gc:
+            expire_sessions(); next_gc = time.monotonic() + 60
+        if not todo: continue
+
+        # --- запрос модели: все сессии тика одним вызовом -----------------
+        t0 = time.perf_counter()
         try:
-            r = requests.post("http://127.0.0.1:8000/predict", json=vec, timeout=0.3)
-            label = r.json().get("action", "FARM")
-        except Exception:
-            label = "FARM"
+            if len(todo) == 1:
+                res = [predictor.predict_conf(todo[0][1])]
+            else:
+                res = predictor.predict_batch_conf([vec for _, vec, _ in todo])
+            ENGINE["batches"] += 1
+            ENGINE["max_batch"] = max(ENGINE["max_batch"], len(todo))
+        except Exception as exc:
+            res = RULES.predict_batch_conf([vec for _, vec, _ in todo]); FALLBACKS += 1
+            # requests.Timeout / ConnectTimeout / ReadTimeout – без импорта requests
+            FALLBACK.labels("timeout" if "Timeout" in type(exc).__name__ else "error").inc()
+            for s, _, _ in todo:
+                s.last_vec = None           # не залипаем на запасном ответе
+        t1 = time.perf_counter()
+        ST_INFER.observe(t1 - t0)
+
+        for (s, _, seq), (label, conf) in zip(todo, res):
+            publish(s, label, conf, seq)
+        ST_PUBLISH.observe(time.perf_counter() - t1)
 
-        HINT = LABEL2TXT.get(label, "🤔")
+def mark(s: Session, seq: int):
+    global HINT_SEQ
+    s.hint_seq = HINT_SEQ = seq
+
+def publish(s: Session, label: str, conf: float | None, seq: int):
+    """Новая подсказка сессии → /hint*, пуш в /hint/stream и /hint/<s>/stream, если поменялась."""
+    global HINT, HINT_LABEL, HINT_CONF
+    conf = round(conf, 3) if conf is not None else None
+    changed = (label, conf) != (s.label, s.conf)
+    s.hint, s.label, s.conf = LABEL2TXT.get(label, "🤔"), label, conf
+    HINT, HINT_LABEL, HINT_CONF = s.hint, label, conf
+    mark(s, seq)
+    if changed:
+        msg = {**s.info(), "ts": time.time()}
+        s.bus.publish(msg); BUS.publish(msg)
 
 # ---------------------------------------------------------------------------#
 if __name__ == "__main__":
-    screenshot.start()                                 # поток скриншота
-    threading.Thread(target=rule_engine, daemon=True).start()
-    app.run(host="0.0.0.0", port=5000, threaded=True)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", choices=["remote", "local"], default="remote")
+    ap.add_argument("--model", type=Path, default=DEFAULT_MODEL, help="bundle для --backend local")
+    ap.add_argument("--predict-url", default=DEFAULT_URL, help="для --backend remote")
+    ap.add_argument("--timeout", type=float, default=0.3)
+    ap.add_argument("--model-retry", type=float, default=5.0,
+                    help="с между попытками загрузить модель; до того – правила rules.py")
+    ap.add_argument("--engine", choices=["poll", "event"], default="poll")
+    ap.add_argument("--death-window", type=float, default=TRAIN_WINDOW[0],
+                    help="recent_deaths: игровых секунд назад; должно совпасть с окном "
+                         "bundle (build_dataset --death-window N,0)")
+    ap.add_argument("--port", type=int, default=5000)
+    ap.add_argument("--capture", action="store_true",
+                    help="захват миникарты с экрана (cv2 + mss); без него – только GSI")
+    ap.add_argument("--capture-source", default=None,
+                    help="видео / .npy / картинки вместо экрана (разработка без дисплея); "
+                         "включает захват")
+    ap.add_argument("--shared-frames", action="store_true",
+                    help="кадры миникарты – в multiprocessing.shared_memory")
+    ap.add_argument("--no-minimap", action="store_true", help="не считать признаки миникарты")
+    ap.add_argument("--minimap-session", default=None,
+                    help="ключ сессии (auth.token / steamid), чья это миникарта")
+    ap.add_argument("--profile", action="store_true",
+                    help="включить сэмплирующий профайлер (/profile/start, /profile/stop)")
+    args = ap.parse_args()
+
+    DEATH_WINDOW = args.death_window
+    STARTUP["import_ms"] = since_start()
+    LOG = GsiLogWriter(Path("gsi_logs"), observe=ST_LOG.observe)
+
+    if args.profile: PROFILER = SamplingProfiler()
+    threading.Thread(target=start_subsystems, args=(args,), name="startup", daemon=True).start()
+    STARTUP["listen_ms"] = since_start()
+    app.run(host="0.0.0.0", port=args.port, threaded=True)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+predictor.py  – бэкенды инференса для mvp1_core
+
+• LocalPredictor  – грузит тот же bundle aegis_lgbm_v3.pkl (model + encoder +
+                    features) прямо в процесс ядра, без HTTP; .npz – плоская
+                    модель flat_model.py без lightgbm/sklearn/joblib
+• RemotePredictor – прежний /predict serve_model.py, но через keep‑alive сессию
+• RulePredictor   – без модели: метка по таблице rules.py (mvp1_core, пока
+                    модель не загружена или недоступна)
+
+Оба копят задержку каждого вызова в LatencyStats (mvp1_core отдаёт её в /latency).
+predict(vec) → метка; predict_conf(vec) → (метка, вероятность этой метки | None);
+predict_batch_conf(rows) – то же для многих векторов одним вызовом модели
+(mvp1_core с несколькими сессиями). PredictionCache – LRU перед моделью
+(serve_model): соседние тики почти всегда шлют тот же вектор.
+"""
+
+from __future__ import annotations
+import collections, math, pathlib, threading, time
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_MODEL = pathlib.Path("data/models/aegis_lgbm_v3.pkl")
+DEFAULT_URL   = "http://127.0.0.1:8000/predict"
+
+# ---------------------------------------------------------------------------#
+def load_bundle(path: pathlib.Path):
+    """
+    bundle → (model, encoder | None, FEATURES, num_iteration | None,
+    death_window | None); понимает и «старый» голый .pkl. num_iteration – бюджет
+    деревьев (train_model --compact-tol), death_window – окно recent_deaths
+    (до, после), на котором учили; None – bundle старше этого поля.
+    """
+    import joblib
+    if not path.exists():
+        raise FileNotFoundError(f"Model file not found: {path.resolve()}")
+    bundle = joblib.load(path)
+    num_iteration = death_window = None
+    if isinstance(bundle, dict) and "model" in bundle:
+        model, encoder = bundle["model"], bundle.get("encoder")
+        features: List[str] = bundle.get("features") or []
+        num_iteration = bundle.get("num_iteration")
+        death_window = bundle.get("death_window")
+    else:
+        model, encoder, features = bundle, None, []
+    if not features:
+        features = getattr(model, "feature_name_", [
+            "gold_adv", "xp_adv", "our_dead_tot", "enemy_dead_tot"
+        ])
+    return model, encoder, list(features), num_iteration, death_window
+
+
+class LatencyStats:
+    """Последние n замеров (мс) + счётчики; summary() – для /latency."""
+
+    def __init__(self, n: int = 2048):
+        self.samples = collections.deque(maxlen=n)
+        self.calls = self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, ms: float, ok: bool = True):
+        with self.lock:
+            self.samples.append(ms); self.calls += 1; self.errors += (not ok)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            s, calls, errors = sorted(self.samples), self.calls, self.errors
+            last = self.samples[-1] if self.samples else None
+        q = lambda p: round(s[min(len(s) - 1, int(p * len(s)))], 4) if s else None
+        return {"calls": calls, "errors": errors,
+                "last_ms": round(last, 4) if last is not None else None,
+                "p50_ms": q(0.5), "p99_ms": q(0.99), "max_ms": q(1.0)}
+
+# ---------------------------------------------------------------------------#
+class LocalPredictor:
+    """
+    In‑process: строка float32 в порядке FEATURES бандла → booster.predict,
+    индекс класса → метка по заранее посчитанной таблице (без encoder на вызов).
+    Строка предвыделена на поток – FastAPI гоняет sync‑эндпоинты в пуле потоков.
+    """
+
+    kind = "local"
+
+    def __init__(self, model, encoder, features: List[str], labels: List[str] | None = None,
+                 num_iteration: int | None = None, death_window=None):
+        import numpy as np
+        self.np, self.features = np, list(features)
+        self.index = {f: i for i, f in enumerate(self.features)}
+        self.booster = getattr(model, "booster_", model)    # Booster или FlatModel
+        # FlatModel уже экспортирована с этим бюджетом – аргумент только для Booster
+        self.num_iteration = num_iteration
+        self.death_window = tuple(death_window) if death_window is not None else None
+        self.kw = {"num_iteration": num_iteration} \
+            if num_iteration and not hasattr(self.booster, "raw_score") else {}
+        if labels is None:
+            classes = getattr(model, "classes_", None)
+            if classes is None:
+                classes = list(range(len(encoder.classes_))) if encoder else []
+            labels = encoder.inverse_transform(classes) if encoder else classes
+        self.labels = [str(c) for c in labels]
+        self.label_arr = np.asarray(self.labels, dtype=object)
+        self.tls = threading.local()
+        self.stats = LatencyStats()
+
+    @classmethod
+    def load(cls, path: pathlib.Path = DEFAULT_MODEL) -> "LocalPredictor":
+        """.pkl – bundle с lightgbm; .npz – плоская модель flat_model (только numpy)."""
+        if path.suffix == ".npz":
+            from flat_model import FlatModel
+            fm = FlatModel.load(path)
+            return cls(fm, None, fm.features, fm.labels, death_window=fm.death_window)
+        model, encoder, features, num_iteration, death_window = load_bundle(path)
+        return cls(model, encoder, features, num_iteration=num_iteration,
+                   death_window=death_window)
+
+    def _row(self):
+        row = getattr(self.tls, "row", None)
+        if row is None:
+            row = self.tls.row = self.np.zeros((1, len(self.features)), dtype=self.np.float32)
+        return row
+
+    def _classes(self, p):
+        return p.argmax(axis=1) if p.ndim == 2 else (p > 0.5).astype(int)
+
+    def predict_conf(self, vec: Dict[str, Any]) -> Tuple[str, float]:
+        t0 = time.perf_counter()
+        row, get = self._row(), vec.get
+        for i, f in enumerate(self.features):
+            row[0, i] = get(f, 0)
+        p = self.booster.predict(row, **self.kw)[0]
+        if p.ndim:                                   # мультикласс: вероятности классов
+            idx = int(p.argmax()); conf = float(p[idx])
+        else:                                        # бинарная: p(класс 1)
+            idx = int(p > 0.5); conf = float(p if idx else 1 - p)
+        self.stats.add((time.perf_counter() - t0) * 1e3)
+        return self.labels[idx], conf
+
+    def predict(self, vec: Dict[str, Any]) -> str:
+        return self.predict_conf(vec)[0]
+
+    def matrix(self, rows) -> Any:
+        """Список dict'ов или списков значений (в порядке FEATURES) → float32 (n, F)."""
+        np = self.np
+        if rows and not isinstance(rows[0], dict):
+            X = np.asarray(rows, dtype=np.float32)
+            if X.ndim != 2 or X.shape[1] != len(self.features):
+                raise ValueError(f"expected rows of {len(self.features)} values in FEATURES order")
+            return X
+        X = np.zeros((len(rows), len(self.features)), dtype=np.float32)
+        for r, vec in enumerate(rows):
+            for f, v in vec.items():
+                i = self.index.get(f)
+                if i is not None: X[r, i] = v
+        return X
+
+    def predict_batch(self, rows) -> List[str]:
+        if not len(rows): return []
+        idx = self._classes(self.booster.predict(self.matrix(rows), **self.kw))
+        return self.label_arr[idx].tolist()
+
+    def predict_batch_conf(self, rows) -> List[Tuple[str, float]]:
+        if not len(rows): return []
+        t0, np = time.perf_counter(), self.np
+        p = self.booster.predict(self.matrix(rows), **self.kw)
+        if p.ndim == 2:
+            idx = p.argmax(axis=1); conf = p[np.arange(len(p)), idx]
+        else:
+            idx = (p > 0.5).astype(int); conf = np.where(idx == 1, p, 1 - p)
+        self.stats.add((time.perf_counter() - t0) * 1e3)
+        return list(zip(self.label_arr[idx].tolist(), conf.tolist()))
+
+
+class RemotePredictor:
+    """HTTP к serve_model через пул keep‑alive соединений (одна Session на процесс)."""
+
+    kind = "remote"
+    death_window = None            # из /ready serve_model (ready())
+    features: List[str] = []       # FEATURES модели – из /features (ready())
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 0.3):
+        import requests
+        self.url, self.timeout = url, timeout
+        self.batch_url = url.rstrip("/") + "_batch"          # …/predict → …/predict_batch
+        self.s = requests.Session()
+        self.s.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=4))
+        self.stats = LatencyStats()
+
+    def predict_conf(self, vec: Dict[str, Any]) -> Tuple[str, float | None]:
+        t0, ok = time.perf_counter(), False
+        try:
+            r = self.s.post(self.url, json=vec, timeout=self.timeout)
+            r.raise_for_status(); ok = True
+            j = r.json()
+            return j.get("action", "FARM"), j.get("confidence")
+        finally:
+            self.stats.add((time.perf_counter() - t0) * 1e3, ok)
+
+    def predict(self, vec: Dict[str, Any]) -> str:
+        return self.predict_conf(vec)[0]
+
+    def predict_batch_conf(self, rows) -> List[Tuple[str, float | None]]:
+        if not len(rows): return []
+        t0, ok = time.perf_counter(), False
+        try:
+            r = self.s.post(self.batch_url, json={"rows": rows}, timeout=self.timeout)
+            r.raise_for_status(); ok = True
+            j = r.json()
+            return list(zip(j["actions"], j.get("confidences") or [None] * len(rows)))
+        finally:
+            self.stats.add((time.perf_counter() - t0) * 1e3, ok)
+
+    def ready(self) -> Dict[str, Any]:
+        """
+        GET /ready и /features serve_model; не 200 (не поднят, модель грузится /
+        не загрузилась) – исключение. Отсюда death_window и FEATURES модели.
+        """
+        base, timeout = self.url.rsplit("/", 1)[0], max(self.timeout, 1.0)
+        r = self.s.get(base + "/ready", timeout=timeout)
+        r.raise_for_status()
+        j = r.json()
+        self.death_window = j.get("death_window")
+        r = self.s.get(base + "/features", timeout=timeout)
+        r.raise_for_status()
+        self.features = list(r.json()["features"])
+        return j
+
+
+class RulePredictor:
+    """Таблица правил rules.RULES над живым вектором; уверенности нет."""
+
+    kind = "rules"
+
+    def __init__(self):
+        import rules
+        self.label = rules.label
+        self.stats = LatencyStats()
+
+    def predict_conf(self, vec: Dict[str, Any]) -> Tuple[str, None]:
+        t0 = time.perf_counter()
+        label = self.label(vec)
+        self.stats.add((time.perf_counter() - t0) * 1e3)
+        return label, None
+
+    def predict(self, vec: Dict[str, Any]) -> str:
+        return self.predict_conf(vec)[0]
+
+    def predict_batch_conf(self, rows) -> List[Tuple[str, None]]:
+        return [self.predict_conf(vec) for vec in rows]
+
+
+def feature_key(vec, features: List[str], steps=None) -> tuple:
+    """
+    dict или список значений (в порядке FEATURES) → кортеж float, округлённых до
+    steps; null / строка / nan / не та длина → ValueError (serve_model → 422).
+    """
+    vals = [vec.get(f, 0) for f in features] if isinstance(vec, dict) else vec
+    if not isinstance(vals, (list, tuple)) or len(vals) != len(features):
+        raise ValueError(f"expected rows of {len(features)} values in FEATURES order")
+    out = []
+    for f, v, s in zip(features, vals, steps or [None] * len(features)):
+        try:
+            v = float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"{f}: expected a number, got {v!r}") from None
+        if not math.isfinite(v):
+            raise ValueError(f"{f}: expected a finite number, got {v!r}")
+        out.append(v if s is None else round(v / s) * s)
+    return tuple(out)
+
+
+class PredictionCache:
+    """
+    LRU по кортежу признаков в порядке FEATURES. quant – {признак: шаг}: значение
+    округляется до шага (gold_adv / xp_adv плывут медленно); промах считается на
+    уже округлённом векторе, поэтому ответ зависит только от ключа. Потокобезопасен.
+    hits / misses – по строкам; deduped – строки‑промахи, посчитанные одним
+    вызовом модели с одинаковой строкой той же пачки (входят в misses).
+    """
+
+    def __init__(self, features: List[str], maxsize: int = 4096,
+                 quant: Dict[str, float] | None = None):
+        self.features, self.maxsize = list(features), maxsize
+        self.quant = {f: s for f, s in (quant or {}).items() if f in self.features and s}
+        self.steps = [self.quant.get(f) for f in self.features]
+        self.data: "collections.OrderedDict[tuple, Any]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.deduped = 0
+
+    @staticmethod
+    def parse_quant(spec: str) -> Dict[str, float]:
+        """"gold_adv=250,xp_adv=250" → {"gold_adv": 250.0, "xp_adv": 250.0}"""
+        return {f.strip(): float(s) for f, s in
+                (kv.split("=", 1) for kv in spec.split(",") if kv.strip())}
+
+    def key(self, vec) -> tuple:
+        return feature_key(vec, self.features, self.steps)
+
+    def get_many(self, rows, compute) -> list:
+        """
+        rows → ответы по порядку; compute([ключ, …]) → [ответ, …] зовётся один
+        раз на все промахи (одинаковые ключи внутри пачки считаются однажды).
+        """
+        keys = [self.key(r) for r in rows]
+        out: list = [None] * len(keys)
+        miss: Dict[tuple, List[int]] = {}
+        with self.lock:
+            for i, k in enumerate(keys):
+                v = self.data.get(k)
+                if v is None:
+                    miss.setdefault(k, []).append(i)
+                else:
+                    self.data.move_to_end(k); out[i] = v
+            missed = sum(len(idx) for idx in miss.values())
+            self.misses += missed; self.hits += len(keys) - missed
+            self.deduped += missed - len(miss)
+        if miss:
+            res = compute(list(miss))
+            with self.lock:
+                for (k, idx), v in zip(miss.items(), res):
+                    for i in idx: out[i] = v
+                    self.data[k] = v
+                while len(self.data) > self.maxsize:
+                    self.data.popitem(last=False); self.evictions += 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            n = self.hits + self.misses
+            return {"size": len(self.data), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "deduped": self.deduped,
+                    "hit_rate": round(self.hits / n, 4) if n else None, "quant": self.quant}
+
+
+def make_predictor(backend: str, model: pathlib.Path = DEFAULT_MODEL,
+                   url: str = DEFAULT_URL, timeout: float = 0.3):
+    if backend == "local":
+        return LocalPredictor.load(model)
+    return RemotePredictor(url, timeout)
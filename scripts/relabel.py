@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+relabel.py  – новые правила меток поверх готового снапшот‑датасета
+
+Сырые матчи не нужны: колонки снапшотов уже есть, таблица правил
+(rules.py) компилируется в один np.select по всему датасету. Печатает
+баланс меток до / после и diff – какие метки во что перешли.
+
+  python relabel.py --dump > rules.json                 # текущая таблица
+  python relabel.py --data data/snapshots/dataset_v3.parquet --rules rules.json
+  python relabel.py --data … --rules rules.json --out data/snapshots/dataset_v4.parquet
+"""
+
+from __future__ import annotations
+import argparse, json, pathlib, time
+import pandas as pd
+
+import rules, snapshot_io
+
+# ---------------------------------------------------------------------------#
+def relabel(df: pd.DataFrame, table=rules.RULES, default=rules.DEFAULT) -> pd.Series:
+    missing = [c for c in rules.columns(table) if c not in df.columns]
+    if missing:
+        raise KeyError(f"dataset has no columns {missing} used by the rules")
+    return pd.Series(rules.compile_rules(table, default)(df), index=df.index, name="label")
+
+def report(old: pd.Series, new: pd.Series):
+    old, new = old.astype(str), new.astype(str)
+    bal = pd.DataFrame({"old": old.value_counts(), "new": new.value_counts()}) \
+            .fillna(0).astype(int)
+    bal["delta"] = bal["new"] - bal["old"]
+    print("LABEL BALANCE:\n", bal.sort_values("new", ascending=False))
+
+    changed = old != new
+    print(f"\nchanged: {int(changed.sum()):,} of {len(old):,} rows ({changed.mean():.2%})")
+    if changed.any():
+        diff = pd.crosstab(old[changed].rename("old"), new[changed].rename("new"))
+        print("old → new:\n", diff)
+
+# ---------------------------------------------------------------------------#
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", type=pathlib.Path,
+                    default=pathlib.Path("data/snapshots/dataset_v3.csv"),
+                    help="снапшоты: .csv / .parquet / .feather")
+    ap.add_argument("--rules", type=pathlib.Path, default=None,
+                    help="JSON таблицы правил (по умолчанию – rules.RULES)")
+    ap.add_argument("--out", type=pathlib.Path, default=None,
+                    help="сохранить переразмеченный датасет (формат – по расширению)")
+    ap.add_argument("--dump", action="store_true", help="вывести текущую таблицу JSON'ом")
+    a = ap.parse_args()
+
+    if a.dump:
+        d = rules.to_json()         # правило – одной строкой, удобно править руками
+        body = ",\n    ".join(json.dumps(r, ensure_ascii=False) for r in d["rules"])
+        print(f'{{\n  "default": {json.dumps(d["default"])},\n  "rules": [\n    {body}\n  ]\n}}')
+        return
+
+    table, default = rules.load(a.rules) if a.rules else (rules.RULES, rules.DEFAULT)
+    t0 = time.perf_counter()
+    df = snapshot_io.read_dataset(a.data)
+    t1 = time.perf_counter()
+    new = relabel(df, table, default)
+    t2 = time.perf_counter()
+    print(f"rows: {len(df):,} | read {t1 - t0:.2f}s  relabel {t2 - t1:.3f}s | "
+          f"rules {rules.rules_hash(table, default)}")
+    report(df["label"], new)
+
+    if a.out:
+        a.out.parent.mkdir(parents=True, exist_ok=True)
+        df["label"] = new
+        with snapshot_io.open_writer(a.out, meta=snapshot_io.read_meta(a.data)) as w:
+            w.write(df)
+        print(f"✓ relabeled dataset → {a.out}")
+
+if __name__ == "__main__":
+    main()
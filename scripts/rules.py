@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+rules.py  – правила макро‑меток одной таблицей (logic‑v3)
+
+RULES – упорядоченный список (метка, [(колонка, оператор, порог), …]):
+побеждает первая метка, у которой выполнены все условия, иначе DEFAULT.
+Колонка "abs(x)" – модуль x. Из одной таблицы собираются:
+• label(row)          – одна строка‑dict (build_dataset.snapshots)
+• compile_rules(...)  – колонки‑массивы → метки одним np.select
+                        (build_dataset.snapshots_np, relabel.py)
+• rules_hash(...)     – отпечаток таблицы, входит в ключ кэша снапшотов
+Таблица выгружается / читается JSON'ом – relabel.py --dump / --rules.
+"""
+
+from __future__ import annotations
+import hashlib, json, operator, pathlib
+from typing import Callable, Dict, List, Sequence, Tuple
+import numpy as np
+
+Rule = Tuple[str, List[Tuple[str, str, float]]]
+
+OPS: Dict[str, Callable] = {
+    ">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+DEFAULT = "FARM"
+RULES: List[Rule] = [
+    ("TEAMFIGHT",      [("recent_deaths", ">=", 6)]),
+    ("TAKE_ROSHAN",    [("roshan_alive", "!=", 0), ("enemy_core_dead", ">=", 1),
+                        ("our_core_alive", ">=", 2)]),
+    ("CONTEST_ROSHAN", [("roshan_alive", "!=", 0), ("our_core_alive", ">=", 2),
+                        ("enemy_core_alive", ">=", 2), ("recent_deaths", ">=", 2)]),
+    ("SIEGE",          [("gold_adv", ">", 10000), ("towers_dire_t3_down", "!=", 0)]),
+    ("PUSH",           [("gold_adv", ">", 4000), ("enemy_dead_tot", "<=", 1)]),
+    ("DEFEND",         [("gold_adv", "<", -4000), ("our_dead_tot", "<=", 1)]),
+    # GANK – у нас минимум 3 живых, у врага core‑solo, и недавних смертей <2
+    ("GANK",           [("our_alive", ">=", 3), ("enemy_core_alive", "==", 1),
+                        ("recent_deaths", "<", 2)]),
+    # STACK – nobody dead, игра ровная
+    ("STACK",          [("our_dead_tot", "==", 0), ("enemy_dead_tot", "==", 0),
+                        ("abs(gold_adv)", "<=", 2000)]),
+]
+
+# ---------------------------------------------------------------------------#
+def _value(c, col: str):
+    if col.startswith("abs(") and col.endswith(")"):
+        return abs(c[col[4:-1]])
+    return c[col]
+
+def columns(rules: Sequence[Rule] = RULES) -> List[str]:
+    """Колонки, которые читают правила (без abs())."""
+    out = []
+    for _, conds in rules:
+        for col, _, _ in conds:
+            col = col[4:-1] if col.startswith("abs(") else col
+            if col not in out: out.append(col)
+    return out
+
+def label(row, rules: Sequence[Rule] = RULES, default: str = DEFAULT) -> str:
+    for name, conds in rules:
+        if all(OPS[op](_value(row, col), v) for col, op, v in conds):
+            return name
+    return default
+
+def compile_rules(rules: Sequence[Rule] = RULES, default: str = DEFAULT):
+    """Таблица → f(c) : dict/DataFrame колонок → массив меток (object), порядок правил тот же."""
+    for name, conds in rules:
+        for col, op, _ in conds:
+            if op not in OPS: raise ValueError(f"{name}: unknown operator {op!r}")
+    names = [name for name, _ in rules]
+
+    def apply(c) -> np.ndarray:
+        cols = {col: np.asarray(c[col]) for col in columns(rules)}
+        conds = [np.logical_and.reduce([OPS[op](_value(cols, col), v) for col, op, v in cs])
+                 for _, cs in rules]
+        return np.select(conds, names, default=default).astype(object)
+    return apply
+
+label_np = compile_rules()
+
+# --- JSON -------------------------------------------------------------------#
+def to_json(rules: Sequence[Rule] = RULES, default: str = DEFAULT) -> dict:
+    return {"default": default,
+            "rules": [{"label": n, "when": [list(c) for c in cs]} for n, cs in rules]}
+
+def from_json(d: dict) -> Tuple[List[Rule], str]:
+    rules = [(r["label"], [tuple(c) for c in r["when"]]) for r in d["rules"]]
+    for name, conds in rules:
+        for c in conds:
+            if len(c) != 3 or c[1] not in OPS:
+                raise ValueError(f"{name}: bad condition {list(c)} – [колонка, оператор, порог]")
+    return rules, d.get("default", DEFAULT)
+
+def load(path: pathlib.Path) -> Tuple[List[Rule], str]:
+    return from_json(json.loads(pathlib.Path(path).read_text(encoding="utf-8")))
+
+def rules_hash(rules: Sequence[Rule] = RULES, default: str = DEFAULT) -> str:
+    blob = json.dumps(to_json(rules, default), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(blob.encode()).hexdigest()[:10]
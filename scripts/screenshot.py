@@ -1,31 +1,291 @@
 """
 Захватываем миникарту в правом‑нижнем углу экрана (16:9).
 – Точка (left, top) = (screen_w - W, screen_h - H)
-– Каждые 0.15 с кладём картинку в глобальную переменную LAST_MINIMAP.
-"""
-import cv2, numpy as np, os
-from mss import mss
-from time import sleep
-from threading import Thread
-import ctypes
+– Каждые 0.15 с кадр пишется в заранее выделенный двойной буфер FrameBuffer
+  (без новых массивов на кадр); неизменившийся кадр (сравнение по
+  прореженной сетке пикселей) не публикуется. LAST_MINIMAP – вид на последний кадр.
+
+Откуда брать:
+  геометрия экрана – windows_screen (ctypes.windll), mss_screen (любая ОС),
+                     fixed_screen(w, h) или своя функция () → (w, h)
+  кадры            – ScreenSource (mss, BGRA) или FileSource (видео / .npy /
+                     картинка / каталог картинок – разработка и бенчмарк без
+                     дисплея, см. bench_capture.py)
 
-# 1. Узнаём реальное разрешение рабочего стола
-user32 = ctypes.windll.user32
-SCREEN_W, SCREEN_H = user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+FrameBuffer(shape, shared=True) лежит в multiprocessing.shared_memory: другой
+процесс открывает его через FrameBuffer.attach(name, shape) и читает read().
+"""
+from __future__ import annotations
+import atexit, os, pathlib, sys, time
+import numpy as np
+from threading import Event, Thread
 
-# 2. Размер миникарты под стандартное 16:9 (поправьте при другом GUI‑scale)
+# Размер миникарты под стандартное 16:9 (поправьте при другом GUI‑scale)
 W, H = 300, 270
-MONITOR = {"left": SCREEN_W - W, "top": SCREEN_H - H, "width": W, "height": H}
+INTERVAL  = 0.15
+DIFF_STEP = 4          # сетка сравнения кадров: каждый 4‑й пиксель (иконка героя ~8 px)
+DIFF_TOL  = 24         # max |разница| канала в узлах сетки; не больше – «тот же кадр»
 
-LAST_MINIMAP = None  # глобальное хранилище картинки
+LAST_MINIMAP = None    # вид на последний опубликованный кадр (BGR); копия – last_minimap()
+BUFFER: "FrameBuffer | None" = None
+CAPTURE: "Capture | None" = None
 
-def capture_loop():
-    global LAST_MINIMAP
+# --- геометрия экрана -------------------------------------------------------#
+def windows_screen():
+    import ctypes
+    user32 = ctypes.windll.user32
+    return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+
+def mss_screen(monitor: int = 1):
+    from mss import mss
     with mss() as sct:
+        m = sct.monitors[monitor]
+        return m["width"], m["height"]
+
+def fixed_screen(w: int, h: int):
+    return lambda: (w, h)
+
+def default_screen():
+    return windows_screen() if sys.platform == "win32" else mss_screen()
+
+def minimap_region(screen=default_screen, w: int = W, h: int = H) -> dict:
+    sw, sh = screen()
+    return {"left": sw - w, "top": sh - h, "width": w, "height": h}
+
+# --- источники кадров (BGRA uint8, H×W×4) -----------------------------------#
+class ScreenSource:
+    """mss: байты снимка оборачиваются в массив без копии."""
+
+    def __init__(self, region: dict):
+        self.region, self.sct = region, None
+        self.shape = (region["height"], region["width"])
+
+    def read(self) -> np.ndarray:
+        if self.sct is None:                 # mss создаём в потоке захвата
+            from mss import mss
+            self.sct = mss()
+        shot = self.sct.grab(self.region)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(*self.shape, 4)
+
+    def close(self):
+        if self.sct is not None: self.sct.close()
+
+
+class FileSource:
+    """
+    Видео (cv2.VideoCapture), .npy (N×H×W×3|4), картинка или каталог картинок.
+    region – вырезать миникарту из полного кадра ("auto" – правый‑нижний
+    угол W×H, если кадр больше; None – кадр целиком); loop – крутить по кругу.
+    Кадры в памяти (кроме видео) – чтобы бенчмарк мерил конвейер, а не диск.
+    """
+
+    def __init__(self, path, region: dict | str | None = "auto", loop: bool = True):
+        import cv2
+        self.cv2, self.path, self.region, self.loop = cv2, pathlib.Path(path), region, loop
+        self.cap, self.frames, self.i = None, None, 0
+        p = self.path
+        if p.is_dir():
+            self.frames = [self._bgra(cv2.imread(str(f), cv2.IMREAD_UNCHANGED))
+                           for f in sorted(p.iterdir()) if f.suffix.lower() in (".png", ".jpg", ".bmp")]
+        elif p.suffix == ".npy":
+            self.frames = [self._bgra(f) for f in np.load(p)]
+        elif p.suffix.lower() in (".png", ".jpg", ".bmp"):
+            self.frames = [self._bgra(cv2.imread(str(p), cv2.IMREAD_UNCHANGED))]
+        else:
+            self.cap = cv2.VideoCapture(str(p))
+            if not self.cap.isOpened():
+                raise FileNotFoundError(f"cannot open video: {p}")
+            ok, first = self.cap.read()
+            if not ok: raise ValueError(f"empty video: {p}")
+            self.bgr = first; self.pending = True
+            crop = self._crop(first)
+            self.out = np.empty((*crop.shape[:2], 4), dtype=np.uint8)
+        if self.frames is not None and not self.frames:
+            raise ValueError(f"no frames in {p}")
+        self.shape = (self.frames[0] if self.frames is not None else self.out).shape[:2]
+
+    def _crop(self, img):
+        r = self.region
+        if r == "auto":
+            h, w = img.shape[:2]
+            if h <= H and w <= W: return img
+            r = minimap_region(fixed_screen(w, h))
+        return img if r is None else img[r["top"]:r["top"] + r["height"],
+                                         r["left"]:r["left"] + r["width"]]
+
+    def _bgra(self, img):
+        img = self._crop(img)
+        if img.ndim == 2:   return self.cv2.cvtColor(img, self.cv2.COLOR_GRAY2BGRA)
+        if img.shape[2] == 3: return self.cv2.cvtColor(img, self.cv2.COLOR_BGR2BGRA)
+        return np.ascontiguousarray(img)
+
+    def read(self) -> np.ndarray:
+        if self.frames is not None:
+            if self.i >= len(self.frames):
+                if not self.loop: raise EOFError
+                self.i = 0
+            self.i += 1
+            return self.frames[self.i - 1]
+        if self.pending:
+            self.pending = False
+        else:
+            ok, _ = self.cap.read(self.bgr)          # декодируем в тот же буфер
+            if not ok:
+                if not self.loop: raise EOFError
+                self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, _ = self.cap.read(self.bgr)
+                if not ok: raise EOFError
+        self.cv2.cvtColor(self._crop(self.bgr), self.cv2.COLOR_BGR2BGRA, dst=self.out)
+        return self.out
+
+    def close(self):
+        if self.cap is not None: self.cap.release()
+
+# --- публикация: двойной буфер ----------------------------------------------#
+class FrameBuffer:
+    """
+    Два кадра + заголовок [seq, индекс готового кадра]. Писатель один: пишет в
+    свободный кадр, затем публикует индекс и seq – читатели без блокировок.
+    Кадр seq становится свободным (back) сразу после следующей публикации, и
+    писатель может начать его переписывать, поэтому read() принимает копию,
+    только если seq после np.copyto не изменился, иначе копирует заново.
+    """
+
+    HEADER = 64
+
+    def __init__(self, shape, shared: bool = False, name: str | None = None, _create: bool = True):
+        self.shape = tuple(shape)
+        size = self.HEADER + 2 * int(np.prod(self.shape))
+        self.shm = None
+        if shared or name:
+            from multiprocessing import shared_memory
+            self.shm = shared_memory.SharedMemory(name=name, create=_create,
+                                                  size=size if _create else 0)
+            buf = self.shm.buf
+        else:
+            buf = bytearray(size)
+        self.head = np.ndarray((2,), dtype=np.uint64, buffer=buf)
+        self.frames = np.ndarray((2, *self.shape), dtype=np.uint8, buffer=buf, offset=self.HEADER)
+        if _create: self.head[:] = 0
+
+    @classmethod
+    def attach(cls, name: str, shape) -> "FrameBuffer":
+        return cls(shape, name=name, _create=False)
+
+    @property
+    def name(self) -> str | None:
+        return self.shm.name if self.shm is not None else None
+
+    @property
+    def seq(self) -> int:
+        return int(self.head[0])
+
+    def back(self) -> np.ndarray:
+        """Свободный кадр для записи (только писателю)."""
+        return self.frames[1 - int(self.head[1])] if self.head[0] else self.frames[0]
+
+    def publish(self):
+        self.head[1] = 0 if not self.head[0] else 1 - int(self.head[1])
+        self.head[0] += 1
+
+    def front(self) -> np.ndarray:
+        """Вид на последний кадр без копии (годится до следующей публикации)."""
+        return self.frames[int(self.head[1])]
+
+    def read(self, out: np.ndarray | None = None):
+        """(seq, копия кадра) | (0, None), если кадров ещё не было."""
+        out = np.empty(self.shape, dtype=np.uint8) if out is None else out
         while True:
-            img = np.array(sct.grab(MONITOR))
-            LAST_MINIMAP = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            sleep(0.15)
+            seq = int(self.head[0])
+            if not seq: return 0, None
+            np.copyto(out, self.frames[int(self.head[1])])
+            if int(self.head[0]) == seq:              # кадр seq ещё не стал back()
+                return seq, out
+
+    def close(self, unlink: bool = False):
+        if self.shm is not None:
+            del self.head, self.frames
+            self.shm.close()
+            if unlink: self.shm.unlink()
+
+# --- конвейер ---------------------------------------------------------------#
+class Capture:
+    """source.read() → BGR в FrameBuffer.back() → публикация, если кадр изменился."""
+
+    def __init__(self, source, buf: FrameBuffer | None = None, interval: float = INTERVAL,
+                 diff_step: int = DIFF_STEP, diff_tol: float = DIFF_TOL, shared: bool = False):
+        import cv2
+        self.cv2, self.source, self.interval = cv2, source, interval
+        h, w = source.shape
+        self.buf = buf or FrameBuffer((h, w, 3), shared=shared)
+        self.tol, self.grid = diff_tol, (max(w // diff_step, 1), max(h // diff_step, 1))
+        self.small = np.empty((self.grid[1], self.grid[0], 4), dtype=np.uint8)
+        self.prev = np.empty_like(self.small)
+        self.grabbed = self.published = self.skipped = 0
+        self.busy_ms = 0.0
+        self.stopped, self.thread = Event(), None
+
+    def changed(self, raw: np.ndarray) -> bool:
+        # INTER_NEAREST – просто выборка узлов сетки (единицы мкс), всё в cv2 без аллокаций
+        cv2 = self.cv2
+        cv2.resize(raw, self.grid, dst=self.small, interpolation=cv2.INTER_NEAREST)
+        if self.published and cv2.norm(self.small, self.prev, cv2.NORM_INF) <= self.tol:
+            return False
+        self.small, self.prev = self.prev, self.small
+        return True
+
+    def step_once(self) -> bool:
+        """Один кадр; True – опубликован."""
+        global LAST_MINIMAP
+        t0 = time.perf_counter()
+        raw = self.source.read(); self.grabbed += 1
+        if not self.changed(raw):
+            self.skipped += 1; self.busy_ms += (time.perf_counter() - t0) * 1e3
+            return False
+        self.cv2.cvtColor(raw, self.cv2.COLOR_BGRA2BGR, dst=self.buf.back())
+        self.buf.publish(); self.published += 1
+        LAST_MINIMAP = self.buf.front()
+        self.busy_ms += (time.perf_counter() - t0) * 1e3
+        return True
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                t0 = time.perf_counter()
+                try:
+                    self.step_once()
+                except EOFError:
+                    return
+                self.stopped.wait(max(0.0, self.interval - (time.perf_counter() - t0)))
+        finally:
+            self.source.close()
+
+    def stop(self, timeout: float = 2.0):
+        self.stopped.set()
+        if self.thread is not None: self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"grabbed": self.grabbed, "published": self.published, "skipped": self.skipped,
+                "seq": self.buf.seq, "shm": self.buf.name,
+                "busy_ms_per_frame": round(self.busy_ms / max(self.grabbed, 1), 4)}
+
+# ---------------------------------------------------------------------------#
+def last_minimap() -> np.ndarray | None:
+    return BUFFER.read()[1] if BUFFER is not None else None
 
-def start():
-    Thread(target=capture_loop, daemon=True).start()
+def start(source=None, screen=None, shared: bool = False, interval: float = INTERVAL) -> Capture:
+    """
+    Поток захвата. source – готовый источник или путь к файлу (FileSource);
+    по умолчанию – экран (mss) с геометрией screen() | default_screen().
+    """
+    global BUFFER, CAPTURE
+    if source is None:
+        source = ScreenSource(minimap_region(screen or default_screen))
+    elif isinstance(source, (str, os.PathLike)):
+        source = FileSource(source)
+    CAPTURE = Capture(source, interval=interval, shared=shared)
+    BUFFER = CAPTURE.buf
+    CAPTURE.thread = Thread(target=CAPTURE.run, name="capture", daemon=True)
+    CAPTURE.thread.start()
+    atexit.register(CAPTURE.stop)         # видео‑декодер не должен умирать посреди кадра
+    return CAPTURE
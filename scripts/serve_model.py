@@ -8,72 +8,269 @@ serve_model.py  –  FastAPI wrapper for Aegis Assistant model (fixed version)
 2. DataFrame формируется так, чтобы содержать ровно FEATURES – отсутствующие
    колонки заполняются нулями, лишние из запроса отбрасываются.
 3. Удобный запуск через `python serve_model.py` (внутри вызывает uvicorn).
+4. Быстрый путь без pandas: float32‑строка в порядке FEATURES → booster,
+   индекс класса → метка по таблице (predictor.LocalPredictor).
+5. /predict_batch – много векторов за один вызов (реплей логов матчей).
+6. AEGIS_MODEL=…/aegis_lgbm_v3.npz – плоская модель flat_model.py: в процесс
+   не грузятся lightgbm / scikit-learn / pandas / joblib.
+7. /predict отдаёт и confidence – вероятность выбранной метки (для оверлея).
+8. num_iteration из bundle (train_model --compact-tol) – столько деревьев
+   считает booster на каждый запрос.
+9. LRU‑кэш ответов перед быстрым путём (predictor.PredictionCache):
+   AEGIS_CACHE=4096 – размер (0 – выключен), AEGIS_CACHE_QUANT="gold_adv=250,
+   xp_adv=250" – шаг округления признаков в ключе (по умолчанию – точные
+   значения). Счётчики – GET /cache.
+10. GET /metrics – Prometheus: время запроса по эндпоинтам, время самой модели
+    (только реальные вызовы, без попаданий в кэш), ошибки, строки, кэш.
+    AEGIS_PROFILE=1 – сэмплирующий профайлер: /profile/start, /profile/stop,
+    /profile, /profile/folded.
+11. Холодный старт: модуль импортируется без joblib / pandas / lightgbm, модель
+    грузится фоновым потоком. До готовности /predict* и /features отвечают 503
+    (Retry-After: 1), GET /ready – 503 / 200 с отчётом STARTUP (мс по этапам
+    или ошибка загрузки, например нет файла модели) – процесс при этом живёт.
 """
 
 from __future__ import annotations
+import time
+T0 = time.perf_counter()   # отчёт о старте считается отсюда
 
-from typing import Any, Dict, List
-import pathlib
+from typing import Any, Dict
+import os, pathlib, threading
 
-import joblib
-import pandas as pd
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from metrics import CONTENT_TYPE, REGISTRY, SamplingProfiler
+from predictor import LocalPredictor, PredictionCache, feature_key, load_bundle
 
 # --------------------------------------------------------------------------- #
 # ─── Загрузка модели / bundle ─────────────────────────────────────────────── #
-PKL_PATH = pathlib.Path("data/models/aegis_lgbm_v3.pkl")
-if not PKL_PATH.exists():
-    raise FileNotFoundError(f"Model file not found: {PKL_PATH.resolve()}")
-
-bundle = joblib.load(PKL_PATH)
-
-if isinstance(bundle, dict) and "model" in bundle:          # «новый» формат
-    model = bundle["model"]
-    encoder = bundle.get("encoder")                         # может быть None
-    FEATURES: List[str] = bundle.get("features") or []
-else:                                                       # «старый» .pkl
-    model = bundle
-    encoder = None
-    FEATURES = []
-
-# если FEATURES в bundle нет – пробуем вытащить из самой модели
-if not FEATURES:
-    FEATURES = getattr(model, "feature_name_", [
-        "gold_adv", "xp_adv", "our_dead_tot", "enemy_dead_tot"
-    ])
-
-# Список возможных меток (не используем, но оставляем для справки)
-LABELS = encoder.classes_.tolist() if encoder else getattr(model, "classes_", [])
+PKL_PATH = pathlib.Path(os.getenv("AEGIS_MODEL", "data/models/aegis_lgbm_v3.pkl"))
+CACHE_SIZE = int(os.getenv("AEGIS_CACHE", "4096"))
+
+# заполняются load_model() в фоне; READY – всё присвоено
+model = encoder = FAST = CACHE = NUM_ITERATION = None
+FEATURES: list = []
+LABELS: list = []          # список возможных меток (для /features)
+READY = threading.Event()
+STARTUP: dict = {"model": str(PKL_PATH)}
+
+
+def since_start() -> float:
+    return round((time.perf_counter() - T0) * 1e3, 1)
+
+
+def load_model():
+    global model, encoder, FEATURES, NUM_ITERATION, FAST, CACHE, LABELS
+    try:
+        if PKL_PATH.suffix == ".npz":                       # плоская модель
+            if not PKL_PATH.exists():
+                raise FileNotFoundError(f"Model file not found: {PKL_PATH.resolve()}")
+            fast = LocalPredictor.load(PKL_PATH)
+            m, enc, feats, num_it, window = fast.booster, None, fast.features, None, \
+                fast.death_window
+        else:
+            # «новый» dict‑формат и «старый» голый .pkl; FEATURES – из bundle или модели
+            m, enc, feats, num_it, window = load_bundle(PKL_PATH)
+
+            # быстрый путь есть только у LightGBM (booster_/Booster); иначе – DataFrame
+            fast = LocalPredictor(m, enc, feats, num_iteration=num_it, death_window=window) \
+                if hasattr(m, "booster_") or type(m).__name__ == "Booster" else None
+        cache = PredictionCache(feats, CACHE_SIZE,
+                                PredictionCache.parse_quant(os.getenv("AEGIS_CACHE_QUANT", ""))) \
+            if fast is not None and CACHE_SIZE > 0 else None
+        labels = enc.classes_.tolist() if enc else \
+            fast.labels if fast is not None else getattr(m, "classes_", [])
+    except Exception as exc:
+        STARTUP["error"] = f"{type(exc).__name__}: {exc}"
+        print("model load failed:", STARTUP["error"], flush=True)
+        return
+    model, encoder, FEATURES, NUM_ITERATION, FAST, CACHE, LABELS = \
+        m, enc, list(feats), num_it, fast, cache, labels
+    STARTUP["death_window"] = window             # окно recent_deaths бандла – в /ready
+    STARTUP["ready_ms"] = since_start()
+    READY.set()
+    print(f"model ready: {PKL_PATH} in {STARTUP['ready_ms']:.0f} ms "
+          f"(import {STARTUP['import_ms']:.0f} ms)", flush=True)
+
+
+def need_model():
+    if not READY.is_set():
+        raise HTTPException(status_code=503, headers={"Retry-After": "1"},
+                            detail=STARTUP.get("error", "model is loading"))
+
+# --------------------------------------------------------------------------- #
+# ─── Метрики ──────────────────────────────────────────────────────────────── #
+REQUEST = REGISTRY.histogram("aegis_serve_request_seconds", "Time spent in an endpoint",
+                             ("endpoint",))
+MODEL_T = REGISTRY.histogram("aegis_serve_model_seconds", "Model evaluation time per call")
+ERRORS  = REGISTRY.counter("aegis_serve_errors_total", "Requests that failed", ("endpoint",))
+ROWS    = REGISTRY.counter("aegis_serve_rows_total", "Feature rows answered", ("endpoint",))
+for _k in ("hits", "misses", "evictions", "deduped"):
+    REGISTRY.counter(f"aegis_serve_cache_{_k}_total", f"Prediction cache {_k}",
+                     fn=lambda k=_k: CACHE.stats()[k] if CACHE is not None else 0)
+REGISTRY.gauge("aegis_serve_cache_size", "Prediction cache entries",
+               fn=lambda: len(CACHE.data) if CACHE is not None else 0)
+PROFILER = SamplingProfiler() if os.getenv("AEGIS_PROFILE") else None
 
 # --------------------------------------------------------------------------- #
 app = FastAPI(title="Aegis Assistant – Model API")
+STARTUP["import_ms"] = since_start()
+threading.Thread(target=load_model, name="load_model", daemon=True).start()
 
 
-def json_to_frame(payload: Dict[str, Any]) -> pd.DataFrame:
+def json_to_frame(payload: Dict[str, Any]):
     """
     Превращаем входной JSON в DataFrame с нужными колонками:
     • отсутствующие колонки → 0
     • лишние колонки → отбрасываем
+    (медленный путь – только для не‑LightGBM моделей)
     """
+    import pandas as pd
     row = {f: payload.get(f, 0) for f in FEATURES}
     return pd.DataFrame([row], columns=FEATURES)
 
 
+def fast_conf(keys):
+    """Промахи кэша: ключи (значения в порядке FEATURES) → [(метка, confidence)]."""
+    with MODEL_T.time():
+        if len(keys) == 1:
+            return [FAST.predict_conf(dict(zip(FEATURES, keys[0])))]
+        return FAST.predict_batch_conf([list(k) for k in keys])
+
+
 # --------------------------------------------------------------------------- #
 @app.post("/predict")
 def predict(payload: Dict[str, Any]):
     """
     Принимает JSON вида {"gold_adv": 123, ... } и возвращает:
-        {"action": "FARM"}
+        {"action": "FARM", "confidence": 0.87}
     """
+    need_model()
+    t0 = time.perf_counter()
     try:
+        if CACHE is not None:
+            label, conf = CACHE.get_many([payload], fast_conf)[0]
+            return {"action": label, "confidence": round(conf, 4)}
+        feature_key(payload, FEATURES)               # null / строки → ValueError → 422
+        if FAST is not None:
+            with MODEL_T.time():
+                label, conf = FAST.predict_conf(payload)
+            return {"action": label, "confidence": round(conf, 4)}
         df = json_to_frame(payload)
-        y_pred = model.predict(df)[0]
+        with MODEL_T.time():
+            if hasattr(model, "predict_proba"):
+                proba = model.predict_proba(df)[0]
+                i = int(proba.argmax())
+                y_pred, conf = model.classes_[i], round(float(proba[i]), 4)
+            else:
+                y_pred, conf = model.predict(df)[0], None
         label = encoder.inverse_transform([y_pred])[0] if encoder else y_pred
-        return {"action": str(label)}
+        return {"action": str(label), "confidence": conf}
+    except ValueError as exc:
+        ERRORS.labels("predict").inc()
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
     except Exception as exc:
+        ERRORS.labels("predict").inc()
         # Пробрасываем stack-trace в detail для более удобной отладки
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    finally:
+        ROWS.labels("predict").inc()
+        REQUEST.labels("predict").observe(time.perf_counter() - t0)
+
+
+@app.post("/predict_batch")
+def predict_batch(payload: Dict[str, Any]):
+    """
+    {"rows": [{"gold_adv": 123, ...}, ...]}  или  {"rows": [[v1, v2, ...], ...]}
+    (списки – значения в порядке FEATURES) →
+        {"actions": ["FARM", ...], "confidences": [0.87, ...]}
+    """
+    need_model()
+    t0 = time.perf_counter()
+    rows = payload.get("rows")
+    if not isinstance(rows, list):
+        ERRORS.labels("predict_batch").inc()
+        raise HTTPException(status_code=422, detail="expected {'rows': [...]}")
+    try:
+        if FAST is not None:
+            if CACHE is not None and rows:
+                res = CACHE.get_many(rows, fast_conf)
+            else:
+                for r in rows: feature_key(r, FEATURES)
+                with MODEL_T.time():
+                    res = FAST.predict_batch_conf(rows)
+            return {"actions": [l for l, _ in res], "confidences": [round(c, 4) for _, c in res]}
+        for r in rows: feature_key(r, FEATURES)
+        import pandas as pd
+        df = pd.DataFrame([r if isinstance(r, dict) else dict(zip(FEATURES, r))
+                           for r in rows]).reindex(columns=FEATURES, fill_value=0)
+        with MODEL_T.time():
+            y_pred = model.predict(df)
+        labels = encoder.inverse_transform(y_pred) if encoder else y_pred
+        return {"actions": [str(l) for l in labels]}
+    except ValueError as exc:
+        ERRORS.labels("predict_batch").inc()
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    except Exception as exc:
+        ERRORS.labels("predict_batch").inc()
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    finally:
+        ROWS.labels("predict_batch").inc(len(rows))
+        REQUEST.labels("predict_batch").observe(time.perf_counter() - t0)
+
+
+@app.get("/cache")
+def cache_stats():
+    """Счётчики LRU‑кэша ответов (hits / misses / evictions / deduped / size)."""
+    return CACHE.stats() if CACHE is not None else {"enabled": False}
+
+
+@app.get("/ready")
+def ready():
+    """200 – модель загружена; 503 – ещё грузится или не загрузилась (error)."""
+    body = {"ready": READY.is_set(), **STARTUP}
+    return body if READY.is_set() else JSONResponse(body, status_code=503)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def profiler() -> SamplingProfiler:
+    if PROFILER is None:
+        raise HTTPException(status_code=404, detail="set AEGIS_PROFILE=1 to enable")
+    return PROFILER
+
+
+@app.post("/profile/start")
+def profile_start():
+    return {"started": profiler().start(), **PROFILER.report(0)}
+
+
+@app.post("/profile/stop")
+def profile_stop(top: int = 25):
+    profiler().stop()
+    return PROFILER.report(top)
+
+
+@app.get("/profile")
+def profile_report(top: int = 25):
+    return profiler().report(top)
+
+
+@app.get("/profile/folded", response_class=PlainTextResponse)
+def profile_folded():
+    return profiler().folded()
+
+
+@app.get("/features")
+def features():
+    """Порядок FEATURES – для /predict_batch со списками значений."""
+    need_model()
+    return {"features": FEATURES, "labels": [str(l) for l in LABELS],
+            "num_iteration": NUM_ITERATION}
 
 
 # --------------------------------------------------------------------------- #
@@ -81,5 +278,5 @@ def predict(payload: Dict[str, Any]):
 if __name__ == "__main__":
     import uvicorn
 
-    # Пример:  python serve_model.py
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Пример:  python serve_model.py   (AEGIS_PORT – другой порт)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("AEGIS_PORT", "8000")))
\ No newline at end of file
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+snapshot_io.py  – схема снапшот‑датасета + потоковая запись / чтение
+
+• компактные типы: int8 счётчики, int16 recent_deaths, int32 адвантажи,
+  label – category с фиксированным списком LABELS
+• писатели CSV / Parquet / Feather(Arrow IPC) сбрасывают row‑group'ы по мере
+  накопления, поэтому память build_dataset не растёт вместе с корпусом
+• read_dataset() – единая загрузка для train_model (формат по расширению)
+• метаданные датасета (open_writer(meta=…), build_dataset: окно recent_deaths)
+  едут вместе с ним: CSV – соседний <файл>.meta.json, Parquet / Feather – схема
+  Arrow, .snap – meta.json; read_meta() отдаёт их (или {} у старого датасета)
+• .snap – каталог для данных больше RAM: колонка = файл <колонка>.bin
+  фиксированного dtype (label – int8 коды LABELS), индекс match_id → строки
+  (matches.bin + offsets.bin, строки матча идут подряд), meta.json.
+  SnapshotStore открывает колонки через np.memmap: сплит по матчам – массивы
+  номеров строк, признаки собираются кусками только на нужные строки.
+
+pyarrow нужен только для parquet/feather и импортируется лениво.
+"""
+
+from __future__ import annotations
+import json, math, pathlib, shutil
+import numpy as np
+import pandas as pd
+
+LABELS = [
+    "CONTEST_ROSHAN", "DEFEND", "FARM", "GANK", "PUSH",
+    "SIEGE", "STACK", "TAKE_ROSHAN", "TEAMFIGHT",
+]
+
+DTYPES = {
+    "match_id": "int64", "t": "int32",
+    "gold_adv": "int32", "xp_adv": "int32",
+    "our_alive": "int8", "enemy_alive": "int8",
+    "our_dead_tot": "int8", "enemy_dead_tot": "int8",
+    "our_core_alive": "int8", "enemy_core_alive": "int8", "enemy_core_dead": "int8",
+    "roshan_alive": "int8", "recent_deaths": "int16", "towers_dire_t3_down": "int8",
+    # features.ROLLING
+    "gold_adv_d60": "int32", "xp_adv_d60": "int32", "gold_adv_m180": "float32",
+    "our_deaths_30": "int8", "enemy_deaths_30": "int8",
+}
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet",
+           ".feather": "feather", ".arrow": "feather", ".snap": "snap"}
+
+TECH = ("label", "match_id", "t")        # не признаки модели
+
+ROW_GROUP = 256_000
+
+META_KEY = b"aegis"                      # метаданные датасета в схеме Arrow
+
+# ---------------------------------------------------------------------------#
+def fmt_of(path: pathlib.Path) -> str:
+    return FORMATS.get(path.suffix.lower(), "csv")
+
+def meta_path(path: pathlib.Path) -> pathlib.Path:
+    """Метаданные CSV‑датасета – соседний файл <имя>.meta.json."""
+    return path.with_name(path.name + ".meta.json")
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводим снапшоты к DTYPES; неизвестная метка – ошибка, а не NaN."""
+    df = df.astype({c: t for c, t in DTYPES.items() if c in df.columns}, copy=False)
+    if "label" in df:
+        lab = pd.Categorical(df["label"], categories=LABELS)
+        if lab.isna().any():
+            bad = set(df["label"][lab.isna()])
+            raise ValueError(f"unknown labels {sorted(bad)} – добавьте в LABELS")
+        df["label"] = lab
+    return df
+
+# ---------------------------------------------------------------------------#
+class _Writer:
+    """Буферизует фреймы и отдаёт их наружу row‑group'ами по row_group строк."""
+
+    def __init__(self, path: pathlib.Path, row_group: int = ROW_GROUP,
+                 meta: dict | None = None):
+        self.path, self.row_group, self.meta = path, row_group, dict(meta or {})
+        self.buf, self.n_buf, self.rows = [], 0, 0
+
+    def write(self, df: pd.DataFrame):
+        if not len(df): return
+        self.buf.append(compact(df)); self.n_buf += len(df)
+        if self.n_buf >= self.row_group: self.flush()
+
+    def flush(self):
+        if not self.buf: return
+        df = pd.concat(self.buf, ignore_index=True) if len(self.buf) > 1 else self.buf[0]
+        self.buf, self.n_buf = [], 0
+        self._write_group(df); self.rows += len(df)
+
+    def close(self):
+        self.flush(); self._close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def _write_group(self, df): raise NotImplementedError
+    def _close(self): pass
+
+
+class CsvWriter(_Writer):
+    def __init__(self, path, row_group=ROW_GROUP, meta=None):
+        super().__init__(path, row_group, meta)
+        meta_path(path).unlink(missing_ok=True)      # от прошлой сборки в тот же файл
+        self.f = open(path, "w", newline="", encoding="utf-8"); self.header = True
+
+    def _write_group(self, df):
+        df.to_csv(self.f, index=False, header=self.header); self.header = False
+
+    def _close(self):
+        self.f.close()
+        if self.meta:
+            meta_path(self.path).write_text(json.dumps(self.meta), encoding="utf-8")
+
+
+class _ArrowWriter(_Writer):
+    def __init__(self, path, row_group=ROW_GROUP, meta=None):
+        super().__init__(path, row_group, meta)
+        import pyarrow as pa
+        self.pa, self.w, self.schema = pa, None, None
+
+    def _write_group(self, df):
+        # схема фиксируется первым блоком – словарь label у всех блоков одинаковый
+        tbl = self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self.w is None:
+            self.schema = tbl.schema.with_metadata(
+                {**(tbl.schema.metadata or {}), META_KEY: json.dumps(self.meta).encode()})
+            self.w = self._open(self.schema)
+        self.w.write_table(tbl.replace_schema_metadata(self.schema.metadata))
+
+    def _close(self):
+        if self.w is not None: self.w.close()
+
+
+class ParquetWriter(_ArrowWriter):
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, schema, compression="zstd")
+
+
+class FeatherWriter(_ArrowWriter):
+    def _open(self, schema):
+        opts = self.pa.ipc.IpcWriteOptions(compression="lz4")
+        return self.pa.ipc.new_file(self.path, schema, options=opts)
+
+
+class SnapWriter(_Writer):
+    """
+    Каталог .snap: row‑group дописывается в конец файла каждой колонки,
+    индекс матчей копится по ходу; meta.json пишется последним – без него
+    каталог считается недописанным.
+    """
+
+    def __init__(self, path, row_group=ROW_GROUP, meta=None):
+        super().__init__(path, row_group, meta)
+        if path.exists(): shutil.rmtree(path)
+        path.mkdir(parents=True)
+        self.files, self.dtypes = {}, {}
+        self.ids, self.starts, self.seen = [], [], set()
+
+    def _write_group(self, df):
+        if not self.files:                   # схема – по первому блоку
+            for c in df.columns:
+                dt = np.dtype("int8") if c == "label" else df[c].dtype
+                if not isinstance(dt, np.dtype) or dt.kind not in "biuf":
+                    raise TypeError(f"column {c!r}: {dt} is not a fixed‑width number")
+                self.dtypes[c] = dt.str
+                self.files[c] = open(self.path / f"{c}.bin", "wb")
+        if list(df.columns) != list(self.dtypes):
+            raise ValueError(f"columns changed between row groups: {list(df.columns)}")
+        for c, f in self.files.items():
+            a = df[c].cat.codes.to_numpy() if c == "label" else df[c].to_numpy()
+            np.ascontiguousarray(a, dtype=self.dtypes[c]).tofile(f)
+        self._index(df["match_id"].to_numpy())
+
+    def _index(self, m):
+        starts = np.flatnonzero(np.r_[True, m[1:] != m[:-1]])
+        for i in starts.tolist():
+            mid = int(m[i])
+            if self.ids and i == 0 and mid == self.ids[-1]:
+                continue                     # матч продолжается из прошлого блока
+            if mid in self.seen:
+                raise ValueError(f"match {mid}: rows are not contiguous")
+            self.seen.add(mid); self.ids.append(mid); self.starts.append(self.rows + i)
+
+    def _close(self):
+        for f in self.files.values(): f.close()
+        np.asarray(self.ids, dtype="<i8").tofile(self.path / "matches.bin")
+        np.asarray(self.starts + [self.rows], dtype="<i8").tofile(self.path / "offsets.bin")
+        meta = {"rows": self.rows, "columns": self.dtypes, "labels": LABELS,
+                "matches": len(self.ids), "dataset": self.meta}
+        (self.path / "meta.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter, "feather": FeatherWriter,
+           "snap": SnapWriter}
+
+def open_writer(path: pathlib.Path, fmt: str | None = None,
+                row_group: int = ROW_GROUP, meta: dict | None = None) -> _Writer:
+    return WRITERS[fmt or fmt_of(path)](path, row_group, meta)
+
+# ---------------------------------------------------------------------------#
+class SnapshotStore:
+    """
+    .snap только для чтения. store["gold_adv"] – np.memmap колонки (страницы
+    подтягивает ОС по мере чтения), строки матча i – [offsets[i], offsets[i+1]).
+    Сплиты отдают отсортированные номера строк, данные не копируются.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        meta_fn = self.path / "meta.json"
+        if not meta_fn.exists():
+            raise FileNotFoundError(f"{self.path}: no meta.json – not a .snap store or unfinished")
+        self.meta = json.loads(meta_fn.read_text(encoding="utf-8"))
+        self.rows, self.dtypes = self.meta["rows"], self.meta["columns"]
+        self.labels = self.meta["labels"]
+        self.cols = {c: np.memmap(self.path / f"{c}.bin", dtype=dt, mode="r", shape=(self.rows,))
+                     if self.rows else np.zeros(0, dt) for c, dt in self.dtypes.items()}
+        self.match_ids = np.fromfile(self.path / "matches.bin", dtype="<i8")
+        self.offsets = np.fromfile(self.path / "offsets.bin", dtype="<i8")
+
+    def __len__(self): return self.rows
+    def __getitem__(self, col: str) -> np.ndarray: return self.cols[col]
+
+    @property
+    def features(self):
+        return [c for c in self.dtypes if c not in TECH]
+
+    def rows_of(self, matches) -> np.ndarray:
+        """Позиции матчей в индексе → их строки по возрастанию (int64)."""
+        m = np.sort(np.asarray(matches, dtype=np.int64))
+        lo, n = self.offsets[m], self.offsets[m + 1] - self.offsets[m]
+        # arange(Σn) + сдвиг начала каждого матча, повторённый n раз
+        shift = lo - np.concatenate([[0], np.cumsum(n)[:-1]])
+        return np.arange(int(n.sum()), dtype=np.int64) + np.repeat(shift, n)
+
+    def group_split(self, test_size: float = 0.2, seed: int = 42):
+        """(train_rows, val_rows): ceil(test_size · матчей) случайных матчей – в валидацию."""
+        perm = np.random.default_rng(seed).permutation(len(self.match_ids))
+        n_test = math.ceil(test_size * len(perm))
+        return self.rows_of(perm[n_test:]), self.rows_of(perm[:n_test])
+
+    def group_kfold(self, k: int, rows=None):
+        """
+        Как GroupKFold: матчи по убыванию размера – в самый лёгкий фолд.
+        rows – только матчи этих строк (обучающая часть group_split).
+        """
+        pos = np.arange(len(self.match_ids)) if rows is None else \
+            np.unique(np.searchsorted(self.offsets, rows, side="right") - 1)
+        sizes = np.diff(self.offsets)[pos]
+        fold, load = np.empty(len(sizes), dtype=np.int64), np.zeros(k, dtype=np.int64)
+        for i in np.argsort(-sizes, kind="stable"):
+            fold[i] = j = int(load.argmin()); load[j] += sizes[i]
+        return [(self.rows_of(pos[fold != j]), self.rows_of(pos[fold == j])) for j in range(k)]
+
+    def matrix(self, rows, columns=None, dtype=np.float32,
+               out: np.ndarray | None = None) -> np.ndarray:
+        """(строки × колонки) в dtype – только для rows (slice или номера строк)."""
+        columns = self.features if columns is None else columns
+        n = len(range(self.rows)[rows]) if isinstance(rows, slice) else len(rows)
+        if out is None: out = np.empty((n, len(columns)), dtype=dtype)
+        for j, c in enumerate(columns):
+            out[:, j] = self.cols[c][rows]
+        return out
+
+    def frame(self, rows=slice(None), columns=None) -> pd.DataFrame:
+        """В память как DataFrame (read_dataset, relabel.py); label – category."""
+        columns = list(self.dtypes) if columns is None else columns
+        df = pd.DataFrame({c: np.asarray(self.cols[c][rows]) for c in columns})
+        if "label" in df:
+            df["label"] = pd.Categorical.from_codes(df["label"], categories=self.labels)
+        return df
+
+
+def read_dataset(path: pathlib.Path) -> pd.DataFrame:
+    """Загружаем снапшоты любого поддерживаемого формата в компактных типах."""
+    fmt = fmt_of(path)
+    if fmt == "snap":
+        return SnapshotStore(path).frame()
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    if fmt == "feather":
+        return pd.read_feather(path)
+    return compact(pd.read_csv(path, dtype={c: t for c, t in DTYPES.items()}))
+
+def read_meta(path: pathlib.Path) -> dict:
+    """Метаданные датасета, записанные open_writer(meta=…); {} – их нет (старый датасет)."""
+    fmt = fmt_of(path)
+    if fmt == "snap":
+        return SnapshotStore(path).meta.get("dataset", {})
+    if fmt in ("parquet", "feather"):
+        import pyarrow as pa
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(path)
+        else:
+            with pa.OSFile(str(path)) as f:
+                schema = pa.ipc.open_file(f).schema
+        raw = (schema.metadata or {}).get(META_KEY)
+        return json.loads(raw) if raw else {}
+    fn = meta_path(path)
+    return json.loads(fn.read_text(encoding="utf-8")) if fn.exists() else {}
@@ -1,48 +1,257 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Train LightGBM multiclass on ideal_no_pos.csv
+Train LightGBM multiclass on ideal_no_pos.csv (or .parquet / .feather)
 – group-aware split (no leakage)
 – balanced classes
-– stores model + LabelEncoder + feature list
+– stores model + LabelEncoder + feature list + the recent_deaths window the
+  dataset was built with, read from the dataset's metadata (mvp1_core refuses
+  a model whose window differs; a window reaching past the tick is refused here)
+– --search N: grouped k-fold search over N configs before the final fit
+  (one binned Dataset for all trials, early stopping, trials in parallel);
+  folds cover the training matches only – the validation matches never
+  pick the config or n_estimators
+– --compact-tol T: keep the fewest trees whose validation accuracy is within
+  T of the full model; the budget goes into the bundle as num_iteration
+– a .snap store (snapshot_io.SnapshotStore) is never loaded whole: the split
+  is row indices per match, LightGBM bins the training rows through an
+  lgb.Sequence over the memory-mapped columns, and evaluation runs in chunks;
+  the model is then saved as a plain Booster
 """
 
-import joblib, pathlib, argparse
-import pandas as pd, lightgbm as lgb
+import joblib, pathlib, argparse, io, numbers, os, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np, pandas as pd, lightgbm as lgb
 from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import GroupShuffleSplit
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit
 from sklearn.metrics import classification_report, confusion_matrix
 
+from snapshot_io import TECH, SnapshotStore, fmt_of, read_dataset, read_meta
+
 # ---------- CLI -------------------------------------------------------------
 ap = argparse.ArgumentParser()
 ap.add_argument("--csv",   type=pathlib.Path,
-                default=pathlib.Path("data/snapshots/ideal_no_pos.csv"))
+                default=pathlib.Path("data/snapshots/ideal_no_pos.csv"),
+                help="dataset: .csv / .parquet / .feather / .snap (format by suffix)")
 ap.add_argument("--model", type=pathlib.Path,
                 default=pathlib.Path("data/models/aegis_lgbm.pkl"))
 ap.add_argument("--test-size", type=float, default=0.2)
+ap.add_argument("--flat", type=pathlib.Path, default=None,
+                help="also export trees to a flat .npz for flat_model.FlatModel")
+ap.add_argument("--search", type=int, default=0, metavar="N",
+                help="try N configs (the first is the default one) before the final fit")
+ap.add_argument("--folds", type=int, default=3, help="GroupKFold splits by match_id")
+ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="trials in parallel")
+ap.add_argument("--trial-threads", type=int, default=0,
+                help="LightGBM threads per trial (0 = cores // jobs)")
+ap.add_argument("--max-rounds", type=int, default=2000)
+ap.add_argument("--early-stop", type=int, default=50)
+ap.add_argument("--seed", type=int, default=42)
+ap.add_argument("--search-log", type=pathlib.Path, default=None,
+                help="write per-trial results to this .csv")
+ap.add_argument("--compact-tol", type=float, default=None, metavar="T",
+                help="drop trailing iterations while val accuracy stays ≥ full − T")
+ap.add_argument("--flat-quantize", action="store_true",
+                help="--flat with float32 thresholds / narrow indices")
+ap.add_argument("--chunk", type=int, default=262_144,
+                help=".snap: rows per batch read from the store")
 args = ap.parse_args()
 args.model.parent.mkdir(parents=True, exist_ok=True)
 
+# ---------- Dataset window --------------------------------------------------
+# build_dataset records its --death-window in the dataset; the live core only
+# ever counts deaths up to the tick, so a window reaching past it is useless
+DEATH_WINDOW = read_meta(args.csv).get("death_window")
+if DEATH_WINDOW is None:
+    print(f"⚠ {args.csv}: no recorded recent_deaths window (built before it was "
+          f"stored) – the bundle gets none, rebuild the dataset to have it checked")
+else:
+    DEATH_WINDOW = tuple(DEATH_WINDOW)
+    if DEATH_WINDOW[1] != 0:
+        raise SystemExit(f"{args.csv}: recent_deaths window {DEATH_WINDOW} counts deaths "
+                         f"after the tick, which the live core never sees – rebuild with "
+                         f"build_dataset --death-window {DEATH_WINDOW[0] + DEATH_WINDOW[1]},0")
+
 # ---------- Load & split ----------------------------------------------------
-df = pd.read_csv(args.csv)
+le = LabelEncoder()
+STORE = SnapshotStore(args.csv) if fmt_of(args.csv) == "snap" else None
 
-labels = df["label"]
-groups = df["match_id"]
+if STORE is not None:
+    FEATURES = STORE.features
+    codes = np.asarray(STORE["label"])                 # int8, one byte per row
+    present = np.flatnonzero(np.bincount(codes, minlength=len(STORE.labels)))
+    names = np.asarray(STORE.labels, dtype=object)[present]
+    lut = np.zeros(len(STORE.labels), dtype=np.int32)
+    lut[present] = le.fit(names).transform(names)
+    y = lut[codes]
+    train_idx, val_idx = STORE.group_split(args.test_size, seed=42)
+    print(f"store: {len(STORE):,} rows, {len(STORE.match_ids):,} matches | "
+          f"train {len(train_idx):,} / val {len(val_idx):,} rows (memory-mapped)")
+else:
+    df = read_dataset(args.csv)
 
-le = LabelEncoder()
-y = le.fit_transform(labels)
+    labels = df["label"]
+    groups = df["match_id"]
+
+    y = le.fit_transform(labels)
+
+    # drop tech cols
+    X = df.drop(columns=list(TECH))
+    FEATURES = list(X.columns)
+
+    gss = GroupShuffleSplit(n_splits=1, test_size=args.test_size, random_state=42)
+    train_idx, val_idx = next(gss.split(X, y, groups))
+
+    X_train, y_train = X.iloc[train_idx], y[train_idx]
+    X_val = X.iloc[val_idx]
+y_val = y[val_idx]
+
+class StoreSequence(lgb.Sequence):
+    """
+    Rows of the store as an lgb.Sequence: sampled for bins, then read batch by
+    batch (float64 – what LightGBM's sampler expects from a Sequence).
+    """
+
+    def __init__(self, rows):
+        self.rows, self.batch_size = rows, args.chunk
+        self.lo, self.block = 0, np.empty((0, len(FEATURES)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, numbers.Integral):
+            # bin sampling asks for single rows in ascending order: serve a block
+            if not self.lo <= idx < self.lo + len(self.block):
+                self.lo = idx
+                self.block = STORE.matrix(self.rows[idx:idx + 4096], FEATURES, np.float64)
+            return self.block[idx - self.lo]
+        return STORE.matrix(self.rows[idx], FEATURES, np.float64)   # slice or list
+
+def matrix(rows):
+    """float32 features of the given rows."""
+    return STORE.matrix(rows, FEATURES) if STORE is not None else \
+        X.iloc[rows].to_numpy(np.float32)
 
-# drop tech cols
-X = df.drop(columns=["label", "match_id", "t"])
+def chunks(rows):
+    """(X, y) over rows, args.chunk at a time (one piece for an in-memory frame)."""
+    step = args.chunk if STORE is not None else max(len(rows), 1)
+    for i in range(0, len(rows), step):
+        part = rows[i:i + step]
+        yield matrix(part), y[part]
 
-gss = GroupShuffleSplit(n_splits=1, test_size=args.test_size, random_state=42)
-train_idx, val_idx = next(gss.split(X, y, groups))
+def predict_class(booster, rows, **kw):
+    """Argmax class per row, chunk by chunk – probabilities never held for all rows."""
+    out = np.empty(len(rows), dtype=np.int32)
+    i = 0
+    for Xc, _ in chunks(rows):
+        p = booster.predict(Xc, **kw)
+        out[i:i + len(Xc)] = p.argmax(axis=1) if p.ndim == 2 else p > 0.5
+        i += len(Xc)
+    return out
 
-X_train, y_train = X.iloc[train_idx], y[train_idx]
-X_val,   y_val   = X.iloc[val_idx],   y[val_idx]
+def dataset(rows, **kw):
+    """lgb.Dataset over rows: from the store via StoreSequence, else from the frame."""
+    data = StoreSequence(rows) if STORE is not None else matrix(rows)
+    return lgb.Dataset(data, label=y[rows], feature_name=FEATURES, **kw)
+
+# ---------- Search ----------------------------------------------------------
+# name → (low, high, log scale); sklearn names are LightGBM aliases, so the
+# same dict goes to lgb.train and to LGBMClassifier
+SPACE = {
+    "learning_rate":     (0.02, 0.2,  True),
+    "num_leaves":        (15,   255,  True),
+    "min_child_samples": (10,   200,  True),
+    "colsample_bytree":  (0.5,  1.0,  False),
+    "reg_lambda":        (1e-3, 10.0, True),
+}
+INT_PARAMS = {"num_leaves", "min_child_samples"}
+DEFAULT = dict(learning_rate=0.05, num_leaves=31, min_child_samples=20,
+               colsample_bytree=0.8, reg_lambda=0.0)
+
+def sample(rng):
+    out = {}
+    for k, (lo, hi, log) in SPACE.items():
+        v = float(np.exp(rng.uniform(np.log(lo), np.log(hi)))) if log else float(rng.uniform(lo, hi))
+        out[k] = int(round(v)) if k in INT_PARAMS else round(v, 4)
+    return out
+
+def balanced_weight(y):
+    """class_weight="balanced" as per-row weights (classes absent from y get none)."""
+    counts = np.bincount(y, minlength=len(le.classes_))
+    present = counts > 0
+    w = np.zeros(len(counts))
+    w[present] = len(y) / (present.sum() * counts[present])
+    return w[y]
+
+def run_trial(i, params, full, rows, folds, threads):
+    """
+    All folds of one config; subsets share the bins of `full` (built over
+    `rows`, folds are positions in it – no re-binning).
+    """
+    p = dict(params, objective="multiclass", num_class=len(le.classes_),
+             num_threads=threads, seed=args.seed, verbosity=-1)
+    t0 = time.perf_counter()
+    acc, loss, iters = [], [], []
+    for tr, va in folds:
+        # weights only on the training fold: early stopping on plain logloss
+        dtr, dva = full.subset(tr).construct(), full.subset(va)
+        dtr.set_weight(balanced_weight(y[rows[tr]]))
+        va = rows[va]
+        b = lgb.train(p, dtr, num_boost_round=args.max_rounds, valid_sets=[dva],
+                      callbacks=[lgb.early_stopping(args.early_stop, verbose=False)])
+        pred = predict_class(b, va, num_iteration=b.best_iteration)
+        acc.append(float((pred == y[va]).mean()))
+        loss.append(b.best_score["valid_0"]["multi_logloss"])
+        iters.append(b.best_iteration)
+    return dict(trial=i, **params, accuracy=np.mean(acc), acc_std=np.std(acc),
+                logloss=np.mean(loss), best_iter=int(np.mean(iters)),
+                wall_s=time.perf_counter() - t0)
+
+def search(n):
+    t0 = time.perf_counter()
+    rows = train_idx                           # val matches stay out of the search
+    full = dataset(rows, free_raw_data=False,
+                   params={"feature_pre_filter": False, "verbosity": -1}).construct()
+    if STORE is not None:                      # store rows → positions in train_idx
+        folds = [(np.searchsorted(rows, tr), np.searchsorted(rows, va))
+                 for tr, va in STORE.group_kfold(args.folds, rows)]
+    else:
+        folds = list(GroupKFold(n_splits=args.folds).split(rows, y[rows], groups.iloc[rows]))
+    print(f"dataset binned once: {len(rows)} train rows, {len(folds)} folds, "
+          f"{time.perf_counter() - t0:.2f}s")
+
+    rng = np.random.default_rng(args.seed)
+    configs = [DEFAULT] + [sample(rng) for _ in range(n - 1)]
+    jobs = max(1, min(args.jobs, n))
+    threads = args.trial_threads or max(1, (os.cpu_count() or 1) // jobs)
+    print(f"{n} trials | {jobs} in parallel × {threads} threads")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(jobs) as ex:       # lgb.train releases the GIL
+        futs = [ex.submit(run_trial, i, c, full, rows, folds, threads)
+                for i, c in enumerate(configs)]
+        for f in futs:
+            r = f.result()
+            print(f"  trial {r['trial']:>3}  acc {r['accuracy']:.4f} ±{r['acc_std']:.4f}  "
+                  f"logloss {r['logloss']:.4f}  iters {r['best_iter']:>4}  "
+                  f"{r['wall_s']:6.1f}s  " +
+                  " ".join(f"{k}={r[k]}" for k in SPACE))
+    wall = time.perf_counter() - t0
+    res = pd.DataFrame([f.result() for f in futs]).sort_values(
+        ["accuracy", "logloss"], ascending=[False, True])
+    print(f"search: {wall:.1f}s wall, {res['wall_s'].sum():.1f}s trial time "
+          f"({res['wall_s'].sum() / wall:.2f}× parallel) | "
+          f"best: trial {int(res.iloc[0]['trial'])} acc {res.iloc[0]['accuracy']:.4f}")
+    if args.search_log:
+        res.to_csv(args.search_log, index=False)
+        print("✓ trials saved →", args.search_log)
+    best = res.iloc[0]
+    return {k: (int(best[k]) if k in INT_PARAMS else float(best[k])) for k in SPACE}, \
+           max(int(best["best_iter"]), 1)
 
 # ---------- Model -----------------------------------------------------------
-model = lgb.LGBMClassifier(
+model_params = dict(
     objective="multiclass",
     num_class=len(le.classes_),
     n_estimators=800,
@@ -54,17 +263,86 @@ model = lgb.LGBMClassifier(
     n_jobs=-1,
     random_state=42,
 )
+if args.search:
+    best, n_estimators = search(args.search)
+    model_params.update(best, n_estimators=n_estimators)
+    print("final params:", best, "| n_estimators:", n_estimators)
+
+if STORE is not None:
+    # same parameters (sklearn names are LightGBM aliases); class_weight → row weights
+    params = {k: v for k, v in model_params.items() if k not in ("class_weight", "n_estimators")}
+    dtrain = dataset(train_idx, weight=balanced_weight(y[train_idx]),
+                     params={"verbosity": -1})
+    model = lgb.train(dict(params, verbosity=-1), dtrain,
+                      num_boost_round=model_params["n_estimators"])
+    del dtrain
+else:
+    model = lgb.LGBMClassifier(**model_params)
 
-model.fit(X_train, y_train)
+    model.fit(X_train, y_train)
 
 # ---------- Evaluation ------------------------------------------------------
-pred = model.predict(X_val)
-print(classification_report(y_val, pred, target_names=le.classes_))
+pred = predict_class(model, val_idx) if STORE is not None else model.predict(X_val)
+# a rare class may be missing from the validation matches
+print(classification_report(y_val, pred, labels=range(len(le.classes_)),
+                            target_names=le.classes_, zero_division=0))
 print("Confusion matrix:\n", confusion_matrix(y_val, pred))
 
+# ---------- Compact ---------------------------------------------------------
+def staged_accuracy(booster, parts):
+    """Val accuracy after each iteration (raw scores summed one iteration at a time)."""
+    hits, n = np.zeros(booster.current_iteration()), 0
+    for Xc, yc in parts:
+        raw = None
+        for it in range(len(hits)):
+            r = booster.predict(Xc, start_iteration=it, num_iteration=1, raw_score=True)
+            raw = r if raw is None else raw + r
+            hits[it] += ((raw.argmax(axis=1) if raw.ndim == 2 else raw > 0) == yc).sum()
+        n += len(yc)
+    return hits / n
+
+def footprint(model, num_iteration=None):
+    """(trees, leaves, bundle bytes, p50 ms of one /predict row via LocalPredictor)."""
+    from predictor import LocalPredictor
+    b = getattr(model, "booster_", model)
+    buf = io.BytesIO()
+    joblib.dump(dict(model=model, encoder=le, features=FEATURES,
+                     num_iteration=num_iteration), buf)
+    p = LocalPredictor(model, le, FEATURES, num_iteration=num_iteration)
+    for row in matrix(val_idx[:500]).tolist():
+        p.predict_conf(dict(zip(FEATURES, row)))
+    return (b.num_trees(), sum(t["num_leaves"] for t in b.dump_model()["tree_info"]),
+            buf.tell(), p.stats.summary()["p50_ms"])
+
+num_iteration = None
+if args.compact_tol is not None:
+    booster = getattr(model, "booster_", model)
+    acc = staged_accuracy(booster, chunks(val_idx))
+    num_iteration = int(np.argmax(acc >= acc[-1] - args.compact_tol)) + 1
+    before = footprint(model)
+    # trees past the budget are cut from the model itself – smaller bundle too
+    cut = lgb.Booster(model_str=booster.model_to_string(num_iteration=num_iteration))
+    if model is booster: model = cut
+    else: model._Booster = cut
+    after = footprint(model, num_iteration)
+    print(f"compact: {booster.current_iteration()} → {num_iteration} iterations | "
+          f"val acc {acc[-1]:.4f} → {acc[num_iteration - 1]:.4f} (tol {args.compact_tol})")
+    for name, fmt, scale, b, a in zip(["trees", "leaves", "bundle KB", "p50 ms/row"],
+                                      [",.0f", ",.0f", ",.1f", ".4f"], [1, 1, 1024, 1],
+                                      before, after):
+        print(f"  {name:<11} {b / scale:>10{fmt}} → {a / scale:<10{fmt}} (×{b / a:.2f})")
+
 # ---------- Save bundle -----------------------------------------------------
 bundle = dict(model=model,
               encoder=le,
-              features=list(X.columns))
+              features=FEATURES,
+              num_iteration=num_iteration,
+              death_window=DEATH_WINDOW)
 joblib.dump(bundle, args.model)
 print("✓ model saved →", args.model, "| classes:", list(le.classes_))
+
+if args.flat:
+    from flat_model import export
+    export(model, le, FEATURES, args.flat, quantize_thresholds=args.flat_quantize,
+           death_window=DEATH_WINDOW)
+    print("✓ flat model saved →", args.flat, f"| {args.flat.stat().st_size / 1024:.0f} KB")